@@ -3,6 +3,13 @@ ASGI config for casetracker project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The live TV board stream (``/api/dashboard/stream/``, Server-Sent Events) only
+works when served through this entry point, e.g.::
+
+    gunicorn casetracker.asgi:application -k uvicorn.workers.UvicornWorker
+
+Under the WSGI entry point the stream answers 204 and boards keep polling.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
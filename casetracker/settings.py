@@ -43,6 +43,12 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = "casetracker.urls"
 
+# User + profile + lab in one query, cached between requests (tracker.auth)
+AUTHENTICATION_BACKENDS = ["tracker.auth.ProfileBackend"]
+AUTH_USER_CACHE_SECONDS = int(os.getenv("AUTH_USER_CACHE_SECONDS", 300))  # 0: query every request
+# sessions are read from the cache and written through to the database
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+
 # Templates
 TEMPLATES = [
     {
@@ -70,6 +76,37 @@ DATABASES = {
     }
 }
 
+# SQLite production mode for several gunicorn workers (see tracker.sqlite):
+# WAL, BEGIN IMMEDIATE for writes, busy waiting and persistent connections
+SQLITE_PRODUCTION = os.getenv("SQLITE_PRODUCTION", "0") == "1"
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;"
+    "PRAGMA synchronous=NORMAL;"
+    f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 20000))};"
+    "PRAGMA mmap_size=268435456;"  # 256 MB
+    "PRAGMA cache_size=-65536;"  # 64 MB
+    "PRAGMA temp_store=MEMORY"
+)
+if SQLITE_PRODUCTION:
+    DATABASES["default"].update({
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", 600)),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {"transaction_mode": "IMMEDIATE", "init_command": SQLITE_PRAGMAS},
+    })
+
+# Cache (file based, shared by all gunicorn workers on this host)
+CACHE_DIR = Path(os.getenv("CACHE_DIR", BASE_DIR / "cache"))
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": CACHE_DIR / "django",
+        "TIMEOUT": 300,
+    }
+}
+
+# Rendered QR code PNGs (content-addressed, see tracker.qr)
+QR_CACHE_DIR = CACHE_DIR / "qr"
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
@@ -90,6 +127,41 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 STATIC_ROOT = BASE_DIR / "staticfiles"
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
+# Uploads: streamed to a temp file while hashing (SHA-256), then stored
+# content-addressed and deduplicated (tracker.uploads)
+FILE_UPLOAD_HANDLERS = ["tracker.uploads.HashingFileUploadHandler"]
+
+# Resumable uploads (tracker.resumable): partial files, per-request chunk and total limits
+UPLOAD_SESSION_DIR = Path(os.getenv("UPLOAD_SESSION_DIR", CACHE_DIR / "uploads"))
+UPLOAD_CHUNK_MAX = int(os.getenv("UPLOAD_CHUNK_MAX", 8 * 1024 * 1024))
+UPLOAD_MAX_SIZE = int(os.getenv("UPLOAD_MAX_SIZE", 2 * 1024 ** 3))
+
+# Attachment downloads (tracker.downloads): after the permission check the web
+# server can send the file: "nginx" (X-Accel-Redirect), "xsendfile" or "" (Django)
+SENDFILE_BACKEND = os.getenv("SENDFILE_BACKEND", "")
+SENDFILE_URL_PREFIX = os.getenv("SENDFILE_URL_PREFIX", "/protected/")
+
+# Background task queue (tracker.tasks, worker: manage.py run_tasks)
+TASK_LEASE_SECONDS = int(os.getenv("TASK_LEASE_SECONDS", 600))  # RUNNING longer than this: requeued
+TASK_KEEP_DONE_HOURS = int(os.getenv("TASK_KEEP_DONE_HOURS", 24))
+
+# PIN brute-force protection on the public QR page (tracker.pinthrottle):
+# bucket -> (capacity, seconds per refilled attempt); "global" caps the PBKDF2 load
+PIN_THROTTLE_RATES = {
+    "token": (10, 60),
+    "ip": (20, 30),
+    "pin": (30, 10),
+    "global": (20, 0.5),
+}
+PIN_LOCKOUT_AFTER = 5  # wrong PINs in a row per token/IP before the lockout starts
+PIN_LOCKOUT_BASE = 30  # seconds, doubled with every further failure ...
+PIN_LOCKOUT_MAX = 3600  # ... up to one hour
+# request.META key with the client address ("HTTP_X_REAL_IP" behind nginx)
+PIN_THROTTLE_IP_HEADER = os.getenv("PIN_THROTTLE_IP_HEADER", "REMOTE_ADDR")
+
+# Signed "trusted device" cookie after a correct lab PIN on the QR page (tracker.trusted)
+TRUSTED_DEVICE_DAYS = 30
+
 # Login redirects
 LOGIN_URL = "/login/"
 LOGIN_REDIRECT_URL = "/"
@@ -0,0 +1,111 @@
+/*
+ * Client for the resumable upload endpoints (tracker/resumable.py).
+ * Markup: <div data-resumable-upload="{% url 'upload_create' case.id %}"> with
+ * a file input, an optional textarea[name=text], a button and a .progress-bar.
+ * The upload URL is remembered in localStorage, so after a network error or a
+ * page reload the same file continues where the server left off.
+ */
+(function () {
+  'use strict';
+
+  const MAX_RETRIES = 8;
+  const sleep = ms => new Promise(r => setTimeout(r, ms));
+
+  function csrfToken(box) {
+    const input = box.querySelector('[name=csrfmiddlewaretoken]');
+    return input ? input.value : '';
+  }
+
+  async function request(box, method, url, opts = {}) {
+    const headers = Object.assign({ 'X-CSRFToken': csrfToken(box) }, opts.headers || {});
+    return fetch(url, Object.assign({}, opts, { method, headers, credentials: 'same-origin' }));
+  }
+
+  async function serverOffset(box, url) {
+    const r = await request(box, 'HEAD', url);
+    return r.ok ? parseInt(r.headers.get('Upload-Offset'), 10) : null;
+  }
+
+  async function start(box, file) {
+    const key = ['upload', box.dataset.resumableUpload, file.name, file.size, file.lastModified].join(':');
+    let url = localStorage.getItem(key);
+    let offset = url ? await serverOffset(box, url) : null;
+    let chunkSize = parseInt(localStorage.getItem(key + ':chunk') || '0', 10);
+    if (offset === null) {
+      const form = new FormData();
+      form.append('filename', file.name);
+      form.append('size', file.size);
+      const r = await request(box, 'POST', box.dataset.resumableUpload, { body: form });
+      const data = await r.json();
+      if (!r.ok) throw new Error(data.error || r.statusText);
+      url = data.url; offset = 0; chunkSize = data.chunk_size;
+      localStorage.setItem(key, url);
+      localStorage.setItem(key + ':chunk', chunkSize);
+    }
+    return { key, url, offset, chunkSize: chunkSize || 8 * 1024 * 1024 };
+  }
+
+  async function upload(box, file, onProgress) {
+    const s = await start(box, file);
+    let retries = 0;
+    while (s.offset < file.size) {
+      onProgress(s.offset / file.size);
+      try {
+        const r = await request(box, 'PATCH', s.url, {
+          headers: { 'Content-Type': 'application/offset+octet-stream', 'Upload-Offset': String(s.offset) },
+          body: file.slice(s.offset, s.offset + s.chunkSize),
+        });
+        if (r.status === 409) {
+          s.offset = await serverOffset(box, s.url);
+          continue;
+        }
+        if (!r.ok) throw new Error((await r.json().catch(() => ({}))).error || r.statusText);
+        s.offset = parseInt(r.headers.get('Upload-Offset'), 10);
+        retries = 0;
+      } catch (err) {
+        if (++retries > MAX_RETRIES) throw err;
+        await sleep(Math.min(30000, 1000 * 2 ** retries));
+        const known = await serverOffset(box, s.url).catch(() => null);
+        if (known !== null) s.offset = known;
+      }
+    }
+    onProgress(1);
+    return s;
+  }
+
+  async function finish(box, s, text) {
+    const form = new FormData();
+    form.append('text', text);
+    const r = await request(box, 'POST', s.url + 'finish/', { body: form });
+    const data = await r.json();
+    if (!r.ok) throw new Error(data.error || r.statusText);
+    localStorage.removeItem(s.key);
+    localStorage.removeItem(s.key + ':chunk');
+    return data;
+  }
+
+  document.querySelectorAll('[data-resumable-upload]').forEach(box => {
+    const input = box.querySelector('input[type=file]');
+    const button = box.querySelector('button');
+    const bar = box.querySelector('.progress-bar');
+    const status = box.querySelector('.upload-status');
+    button.addEventListener('click', async () => {
+      const file = input.files[0];
+      if (!file) return;
+      button.disabled = true;
+      try {
+        const s = await upload(box, file, p => {
+          bar.style.width = (p * 100).toFixed(1) + '%';
+          bar.textContent = Math.floor(p * 100) + ' %';
+        });
+        status.textContent = 'Wird gespeichert …';
+        const text = box.querySelector('[name=text]');
+        await finish(box, s, text ? text.value : '');
+        window.location.reload();
+      } catch (err) {
+        status.textContent = 'Fehler: ' + err.message + ' – erneut starten setzt den Upload fort.';
+        button.disabled = false;
+      }
+    });
+  });
+})();
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Lab, Case, Event, UserProfile
+from .models import Lab, Case, Event, PinThrottle, Task, UserProfile
 from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 
@@ -26,6 +26,25 @@ admin.site.register(Lab)
 admin.site.register(Event)
 
 
+# ------------------------
+# Background tasks (read-mostly; see tracker.tasks)
+# ------------------------
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "status", "attempts", "run_at", "finished_at")
+    list_filter = ("status", "name")
+    readonly_fields = ("created_at", "finished_at", "locked_by", "locked_at", "last_error")
+
+
+@admin.register(PinThrottle)
+class PinThrottleAdmin(admin.ModelAdmin):
+    # deleting a row lifts its lockout
+    list_display = ("key", "failures", "locked_until", "tokens")
+    search_fields = ("key",)
+    ordering = ("-locked_until",)
+
+
 # ------------------------
 # User + Profile
 # ------------------------
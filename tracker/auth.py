@@ -0,0 +1,42 @@
+"""
+Anmelde-Backend, das Benutzer, Profil und Labor in einer Abfrage lädt.
+
+Fast jede View fragt `user_role()` / `user_lab()` bzw. `role_required` ab; mit
+dem Standard-Backend kostet das je eine Abfrage für User, Profil und Labor.
+`ProfileBackend.get_user()` lädt alles per select_related und legt das Ergebnis
+für AUTH_USER_CACHE_SECONDS im gemeinsamen Cache ab. Zusammen mit den
+cached_db-Sessions braucht eine angemeldete Anfrage dann keine Abfrage für die
+Anmeldung mehr. Änderungen an User, Profil oder Labor entfernen den Eintrag
+(Signale in tracker.models).
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+
+
+def cache_key(user_id):
+    return f"authuser:{user_id}"
+
+
+def forget(*user_ids):
+    """Drop cached users; again after commit so a concurrent reload cannot keep the old row."""
+    keys = [cache_key(pk) for pk in user_ids]
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class ProfileBackend(ModelBackend):
+    def get_user(self, user_id):
+        timeout = settings.AUTH_USER_CACHE_SECONDS
+        user = cache.get(cache_key(user_id)) if timeout else None
+        if user is None:
+            try:
+                user = User._default_manager.select_related("profile__lab").get(pk=user_id)
+            except User.DoesNotExist:
+                return None
+            if timeout:
+                cache.set(cache_key(user_id), user, timeout)
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,114 @@
+"""
+Gemeinsamer Daten-Snapshot für das TV-Board.
+
+Alle Boards pollen dieselben Daten (Zähler + neueste Fälle). Statt pro Anfrage
+neu abzufragen und zu serialisieren, wird pro Datenversion (ChangeStamp
+"board") genau ein Snapshot gebaut und im gemeinsamen Cache abgelegt. Parallele
+Anfragen warten auf einen einzigen Neuaufbau (Thread-Lock + Dateisperre über
+alle gunicorn-Worker). Antworten tragen ETag/Last-Modified, unveränderte
+Abfragen bekommen ein 304 ohne Body.
+"""
+import hashlib
+import json
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from . import counters
+from .models import Case, ChangeStamp
+
+try:  # file locks are POSIX only; on Windows we fall back to the thread lock
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+BOARD_STAMP = "board"
+BOARD_RECENT_LIMIT = 50
+SNAPSHOT_TTL = 600
+
+_build_lock = threading.Lock()
+
+
+def recent_row(c):
+    return {
+        "id": c.id,
+        "case_code": c.case_code,
+        "patient_name": c.patient_name,
+        "patient_dob": c.patient_dob.strftime("%d.%m.%Y") if c.patient_dob else "",
+        "patient_dob_order": c.patient_dob.strftime("%Y-%m-%d") if c.patient_dob else "",
+        "lab": c.lab.name if c.lab else "",
+        "status": c.status,
+        "status_label": c.get_status_display(),
+        "detail_url": reverse("case_detail", args=[c.id]),
+        "delete_url": reverse("case_delete", args=[c.id]),
+    }
+
+
+def bump():
+    """Mark board data as changed; call inside the writing transaction."""
+    ChangeStamp.bump(BOARD_STAMP)
+
+
+@contextmanager
+def _single_flight():
+    with _build_lock:
+        if fcntl is None:
+            yield
+            return
+        settings.CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(settings.CACHE_DIR / "board.lock", "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _part(data):
+    body = json.dumps(data, separators=(",", ":")).encode()
+    return {"body": body, "etag": '"%s"' % hashlib.sha1(body).hexdigest()}
+
+
+def _build(stamp):
+    recent = Case.objects.select_related("lab").order_by("-created_at")[:BOARD_RECENT_LIMIT]
+    return {
+        "version": stamp.value,
+        "last_modified": stamp.changed_at.timestamp(),
+        "counts": _part(counters.status_counts()),
+        "recent": _part([recent_row(c) for c in recent]),
+    }
+
+
+def snapshot():
+    stamp = ChangeStamp.current(BOARD_STAMP)
+    # changed_at is part of the key so a recreated database never hits old entries
+    key = f"board:snapshot:{stamp.value}:{stamp.changed_at.timestamp()}"
+    snap = cache.get(key)
+    if snap is None:
+        with _single_flight():
+            snap = cache.get(key)  # another worker may have built it meanwhile
+            if snap is None:
+                snap = _build(stamp)
+                cache.set(key, snap, SNAPSHOT_TTL)
+    return snap
+
+
+def snapshot_response(request, part):
+    """JSON response for one snapshot part ("counts" or "recent") with ETag/304."""
+    snap = snapshot()
+    body, etag = snap[part]["body"], snap[part]["etag"]
+    last_modified = int(snap["last_modified"])
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    # browsers may keep the body but must revalidate every poll
+    response["Cache-Control"] = "private, no-cache"
+    return response
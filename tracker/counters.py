@@ -0,0 +1,102 @@
+"""
+Status-Zähler für Dashboard und TV-Board.
+
+Die Zähler liegen denormalisiert in CaseStatusCount (eine Zeile pro Labor und
+Status). Views, die einen Fall anlegen, löschen oder dessen Status/Labor
+ändern, rufen `record_change()` innerhalb ihrer Transaktion auf; Lesezugriffe
+summieren nur die paar Zählerzeilen statt die Case-Tabelle zu zählen.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from .models import Case, CaseStatusCount
+
+# Keys as used by the dashboard templates and dashboard_counts_api
+STATUS_KEYS = {
+    Case.Status.SENT_CLINIC: "sent",
+    Case.Status.RECEIVED_BY_LAB: "in_lab",
+    Case.Status.RETURNED_BY_LAB: "returned",
+    Case.Status.RECEIVED_BY_CLINIC: "completed",
+}
+
+
+def _as_dict(rows):
+    counts = {key: 0 for key in STATUS_KEYS.values()}
+    for status, n in rows:
+        key = STATUS_KEYS.get(status)
+        if key:
+            counts[key] += n or 0
+    return counts
+
+
+def status_counts(lab=None):
+    """Counts per status bucket, read from the counter table."""
+    qs = CaseStatusCount.objects.all()
+    if lab is not None:
+        qs = qs.filter(lab=lab)
+    rows = qs.values("status").annotate(n=Sum("count")).values_list("status", "n")
+    return _as_dict(rows)
+
+
+def total(lab=None, status=None):
+    """Number of cases (optionally per lab/status) from the counter table."""
+    qs = CaseStatusCount.objects.all()
+    if lab is not None:
+        qs = qs.filter(lab=lab)
+    if status:
+        qs = qs.filter(status=status)
+    return qs.aggregate(n=Sum("count"))["n"] or 0
+
+
+def compute_counts(lab=None):
+    """Same result as status_counts(), computed from Case with one GROUP BY."""
+    qs = Case.objects.all()
+    if lab is not None:
+        qs = qs.filter(lab=lab)
+    rows = qs.values("status").annotate(n=Count("id")).values_list("status", "n")
+    return _as_dict(rows)
+
+
+def _bump(lab_id, status, delta):
+    updated = (CaseStatusCount.objects
+               .filter(lab_id=lab_id, status=status)
+               .update(count=F("count") + delta))
+    if not updated:
+        # first case of this lab/status; get_or_create handles a concurrent insert
+        CaseStatusCount.objects.get_or_create(lab_id=lab_id, status=status)
+        CaseStatusCount.objects.filter(lab_id=lab_id, status=status).update(count=F("count") + delta)
+
+
+def record_change(old_lab_id=None, old_status=None, new_lab_id=None, new_status=None):
+    """
+    Move one case between counter buckets.
+    Creation: only new_*; deletion: only old_*; status/lab change: both.
+    """
+    if (old_lab_id, old_status) == (new_lab_id, new_status):
+        return
+    with transaction.atomic():
+        if old_lab_id and old_status:
+            _bump(old_lab_id, old_status, -1)
+        if new_lab_id and new_status:
+            _bump(new_lab_id, new_status, +1)
+
+
+def add_many(deltas):
+    """Apply several bucket changes at once: {(lab_id, status): delta}."""
+    with transaction.atomic():
+        for (lab_id, status), delta in deltas.items():
+            if delta:
+                _bump(lab_id, status, delta)
+
+
+def rebuild():
+    """Rebuild the counter table from Case (repair after admin edits, imports, ...)."""
+    rows = (Case.objects.values("lab_id", "status")
+            .annotate(n=Count("id")).order_by())
+    with transaction.atomic():
+        CaseStatusCount.objects.all().delete()
+        CaseStatusCount.objects.bulk_create([
+            CaseStatusCount(lab_id=r["lab_id"], status=r["status"], count=r["n"])
+            for r in rows
+        ])
+    return status_counts()
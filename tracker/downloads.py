@@ -0,0 +1,167 @@
+"""
+Geschützte Auslieferung von Anhängen.
+
+Die Berechtigung prüft die View; die Übertragung selbst übernimmt nach
+Möglichkeit der Webserver:
+
+  SENDFILE_BACKEND = "nginx"      X-Accel-Redirect auf SENDFILE_URL_PREFIX + Dateiname
+                                  (nginx: `location /protected/ { internal; alias <MEDIA_ROOT>/; }`)
+  SENDFILE_BACKEND = "xsendfile"  X-Sendfile mit absolutem Pfad (Apache mod_xsendfile, lighttpd)
+  SENDFILE_BACKEND = ""           FileResponse aus Django
+
+Im letzten Fall gibt es ETag/Last-Modified (304 bei unverändertem Inhalt) und
+einfache Byte-Ranges (206), damit abgebrochene STL-Downloads fortgesetzt
+werden können. Ranges bis zum Dateiende gehen als offene Datei an den Server
+(wsgi.file_wrapper, bei gunicorn sendfile()); nur begrenzte Ranges werden in
+Python blockweise gelesen.
+
+Hochgeladene Dateien sind fremde Inhalte: Nur Rasterbilder und PDFs werden im
+Browser angezeigt, alles andere (HTML, SVG, ...) geht immer als Download raus.
+Dazu kommen nosniff und eine Sandbox-CSP, damit eine Datei auch beim direkten
+Öffnen kein Skript im Kontext der Anwendung ausführen kann.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+from . import stl, thumbs
+
+BLOCK = 64 * 1024
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+# shown inline; every other type is forced to Content-Disposition: attachment
+INLINE_TYPES = {"image/png", "image/jpeg", "image/gif", "image/webp", "application/pdf"}
+
+
+def _validators(attachment, stat, variant):
+    if attachment.blob_id:
+        # content-addressed: the digest is a strong validator
+        suffix = f"-{variant}" if variant else ""
+        etag = f'"{attachment.blob.sha256}{suffix}"'
+    else:
+        etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+    return etag, int(stat.st_mtime)
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single "bytes=" range, None to send everything, False if unsatisfiable."""
+    m = RANGE_RE.match((header or "").replace(" ", ""))
+    if not m or m.groups() == ("", ""):
+        return None  # absent, multiple ranges or malformed: ignored (RFC 9110 allows that)
+    first, last = m.groups()
+    if first == "":
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _if_range_matches(request, etag, last_modified):
+    value = request.headers.get("If-Range")
+    if not value:
+        return True
+    if value.startswith('"') or value.startswith("W/"):
+        return value == etag
+    return parse_http_date_safe(value) == last_modified
+
+
+def _read_range(fh, start, end):
+    try:
+        fh.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = fh.read(min(BLOCK, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        fh.close()
+
+
+def derived_name(attachment, variant):
+    """Storage name of a derived file: image thumbnail (tracker.thumbs) or STL artifact (tracker.stl)."""
+    if attachment.is_image:
+        return thumbs.ensure(attachment.file.name, variant)
+    if attachment.is_stl:
+        return stl.ensure(attachment, variant)
+    return None
+
+
+def serve(request, attachment, as_attachment=False, variant=None):
+    """Response for an attachment, or for one of its derived files."""
+    name = attachment.file.name
+    filename = attachment.label or os.path.basename(name)
+    if variant:
+        derived = derived_name(attachment, variant)
+        if derived is None:
+            return None
+        # derived files are "<name>.<suffix>": Oberkiefer.stl -> Oberkiefer.snapshot.png
+        filename = os.path.splitext(filename)[0] + derived[len(name):]
+        name = derived
+    path = default_storage.path(name)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    etag, last_modified = _validators(attachment, stat, variant)
+    content_type = mimetypes.guess_type(filename)[0] or mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = _transfer(request, path, name, stat.st_size, content_type,
+                             _if_range_matches(request, etag, last_modified))
+        inline = not as_attachment and content_type in INLINE_TYPES
+        response["Content-Disposition"] = content_disposition_header(not inline, filename)
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = "private, no-cache"
+    response["X-Content-Type-Options"] = "nosniff"
+    response["Content-Security-Policy"] = "sandbox"
+    return response
+
+
+def _transfer(request, path, name, size, content_type, range_allowed):
+    backend = getattr(settings, "SENDFILE_BACKEND", "")
+    if backend == "nginx":
+        # nginx handles Range and streams the file itself
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = settings.SENDFILE_URL_PREFIX + quote(name)
+        return response
+    if backend == "xsendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = os.path.abspath(path)
+        return response
+
+    byte_range = parse_range(request.headers.get("Range"), size) if range_allowed else None
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    fh = open(path, "rb")
+    if byte_range is None:
+        response = FileResponse(fh, content_type=content_type)
+    else:
+        start, end = byte_range
+        if end == size - 1:
+            # FileResponse measures the length from the current position
+            fh.seek(start)
+            response = FileResponse(fh, content_type=content_type, status=206)
+        else:
+            response = StreamingHttpResponse(_read_range(fh, start, end), content_type=content_type, status=206)
+            response["Content-Length"] = str(end - start + 1)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Accept-Ranges"] = "bytes"
+    return response
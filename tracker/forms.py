@@ -35,6 +35,19 @@ class CaseCreateForm(forms.ModelForm):
         }
 
 
+class CaseImportForm(forms.Form):
+    file = forms.FileField(
+        label="CSV- oder XLSX-Datei",
+        widget=forms.ClearableFileInput(attrs={"class": "form-control", "accept": ".csv,.xlsx"}),
+    )
+
+    def clean_file(self):
+        f = self.cleaned_data["file"]
+        if not f.name.lower().endswith((".csv", ".xlsx")):
+            raise ValidationError("Nur CSV- oder XLSX-Dateien.")
+        return f
+
+
 class LabSearchForm(forms.Form):
     case_code = forms.CharField(label="Fallnummer", max_length=32)
 
@@ -0,0 +1,222 @@
+"""
+Massenimport von Fällen aus CSV/XLSX.
+
+Spalten: patient_name, patient_dob, lab (Laborname oder -ID). Die Datei wird
+zeilenweise gelesen, in Blöcken validiert; gültige Zeilen eines Blocks bekommen
+ihre Fallnummern per Bulk-Reservierung und werden zusammen mit dem
+SENT_CLINIC-Event per bulk_create in einer Transaktion angelegt.
+Fehler werden pro Zeile gesammelt, der Rest wird trotzdem importiert. Eine
+Datei, die sich nicht lesen lässt (Kodierung, beschädigtes XLSX, kaputtes CSV),
+wird vorab komplett abgelehnt (ImportFileError).
+"""
+import csv
+import datetime
+import io
+import time
+import zipfile
+from itertools import islice
+from xml.etree import ElementTree
+
+from django.db import transaction
+
+from . import board, counters, live
+from .models import Case, CaseCodeSequence, CaseNameKey, Event, Lab, Task
+
+IMPORT_COLUMNS = ("patient_name", "patient_dob", "lab")
+DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y", "%d.%m.%y", "%d/%m/%Y")
+CHUNK_SIZE = 500
+
+# accepted German header spellings
+HEADER_ALIASES = {
+    "patient": "patient_name",
+    "name": "patient_name",
+    "geburtsdatum": "patient_dob",
+    "geb.": "patient_dob",
+    "dob": "patient_dob",
+    "labor": "lab",
+}
+
+
+class ImportFileError(Exception):
+    """File cannot be read at all (wrong format, missing columns)."""
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.errors = []  # (line, message)
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.created / self.seconds if self.seconds else 0.0
+
+
+def _header(cells):
+    names = [HEADER_ALIASES.get(str(c or "").strip().lower(), str(c or "").strip().lower()) for c in cells]
+    missing = [c for c in IMPORT_COLUMNS if c not in names]
+    if missing:
+        raise ImportFileError(f"Fehlende Spalten: {', '.join(missing)}")
+    return names
+
+
+def _csv_rows(fileobj, encoding="utf-8-sig"):
+    text = io.TextIOWrapper(fileobj, encoding=encoding, newline="")
+    try:
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=";,\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(text, dialect)
+        names = _header(next(reader, []))
+        for line, cells in enumerate(reader, start=2):
+            if any(cells):
+                yield line, dict(zip(names, cells))
+    finally:
+        text.detach()  # the caller owns the file (and reads it twice, see read_rows)
+
+
+def _xlsx_rows(fileobj):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImportFileError("XLSX-Import benötigt das Paket 'openpyxl'.")
+    wb = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        names = _header(next(rows, ()))
+        for line, cells in enumerate(rows, start=2):
+            if any(c not in (None, "") for c in cells):
+                yield line, dict(zip(names, cells))
+    finally:
+        wb.close()
+
+
+def _guarded(rows):
+    """Turn read errors of a broken or mislabelled file into ImportFileError."""
+    try:
+        yield from rows
+    except UnicodeDecodeError:
+        raise ImportFileError("Die Datei ist weder UTF-8- noch Windows-1252-kodiert.")
+    except csv.Error as exc:
+        raise ImportFileError(f"Die CSV-Datei ist fehlerhaft: {exc}")
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError, ValueError) as exc:
+        # renamed/truncated .xlsx, zip without a workbook, broken sheet XML
+        raise ImportFileError(f"Die Excel-Datei ist beschädigt oder keine XLSX-Datei ({exc.__class__.__name__}).")
+
+
+def _check(rows):
+    for _ in _guarded(rows):
+        pass
+
+
+def read_rows(fileobj, filename):
+    """
+    Yield (line number, {column: value}) from a CSV or XLSX file object
+    (binary, seekable). The file is read once without touching the database
+    first, so a file that breaks off halfway raises ImportFileError before any
+    chunk is committed. CSV is UTF-8 or, as written by Excel, Windows-1252.
+    """
+    if filename.lower().endswith(".xlsx"):
+        _check(_xlsx_rows(fileobj))
+        fileobj.seek(0)
+        return _guarded(_xlsx_rows(fileobj))
+    encoding = "utf-8-sig"
+    try:
+        _check(_csv_rows(fileobj, encoding))
+    except ImportFileError as exc:
+        if not isinstance(exc.__context__, UnicodeDecodeError):
+            raise
+        encoding = "cp1252"
+        fileobj.seek(0)
+        _check(_csv_rows(fileobj, encoding))
+    fileobj.seek(0)
+    return _guarded(_csv_rows(fileobj, encoding))
+
+
+def _parse_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    value = str(value or "").strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+
+def _validate(row, labs):
+    """Case instance (without code) or error message."""
+    name = str(row.get("patient_name") or "").strip()
+    if not name:
+        return "Patient fehlt."
+    if len(name) > Case._meta.get_field("patient_name").max_length:
+        return "Patientenname ist zu lang."
+    dob = _parse_date(row.get("patient_dob"))
+    if not dob:
+        return f"Ungültiges Geburtsdatum: {row.get('patient_dob')!r}"
+    if dob > datetime.date.today():
+        return "Geburtsdatum liegt in der Zukunft."
+    lab_key = str(row.get("lab") or "").strip()
+    lab_id = labs.get(lab_key.lower())
+    if lab_id is None:
+        return f"Unbekanntes Labor: {lab_key!r}"
+    case = Case(patient_name=name, patient_dob=dob, lab_id=lab_id)
+    case.set_name_keys()
+    return case
+
+
+def _insert(cases, user):
+    with transaction.atomic():
+        for case, code in zip(cases, CaseCodeSequence.reserve(len(cases))):
+            case.case_code = code
+            case.created_by = user
+        Case.objects.bulk_create(cases)
+        CaseNameKey.objects.bulk_create([key for case in cases for key in CaseNameKey.build(case)])
+        Event.objects.bulk_create([
+            Event(case=case, status=Case.Status.SENT_CLINIC, actor="CLINIC", note="Import")
+            for case in cases
+        ])
+        deltas = {}
+        for case in cases:
+            deltas[(case.lab_id, case.status)] = deltas.get((case.lab_id, case.status), 0) + 1
+        counters.add_many(deltas)
+        Task.enqueue("qr.warm", tokens=[str(case.qr_token) for case in cases])
+
+
+def import_cases(rows, user=None, chunk_size=CHUNK_SIZE):
+    """Import (line, row) pairs in chunks; returns an ImportResult."""
+    start = time.perf_counter()
+    result = ImportResult()
+    labs = {}
+    for lab_id, name in Lab.objects.values_list("id", "name"):
+        labs.setdefault(str(lab_id), lab_id)
+        labs[name.lower()] = lab_id  # a lab named like another lab's id wins
+
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        valid = []
+        for line, row in chunk:
+            case = _validate(row, labs)
+            if isinstance(case, str):
+                result.errors.append((line, case))
+            else:
+                valid.append(case)
+        if valid:
+            _insert(valid, user)
+            result.created += len(valid)
+
+    if result.created:
+        with transaction.atomic():
+            board.bump()
+            live.publish_bulk(result.created)
+    result.seconds = time.perf_counter() - start
+    return result
@@ -0,0 +1,136 @@
+"""
+Live-Updates für das TV-Board per Server-Sent Events.
+
+Schreibende Views rufen `publish_case()` in ihrer Transaktion auf; das legt
+einen BoardEvent-Eintrag an (SQLite-gestützter Bus, funktioniert über alle
+Worker-Prozesse hinweg). Pro ASGI-Prozess liest genau ein Hub die neuen
+Einträge nach id aus und verteilt sie an alle verbundenen Boards. Ohne ASGI
+(gunicorn sync) antwortet der Stream mit 204, das Board pollt dann weiter.
+"""
+import asyncio
+import json
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from . import counters
+from .models import BoardEvent, Case
+
+POLL_INTERVAL = 0.5     # seconds between bus reads (one query per process, not per board)
+HEARTBEAT = 15          # keep proxies from closing idle streams
+RETENTION = timedelta(minutes=10)
+PRUNE_EVERY = 100       # prune old rows on every n-th publish
+
+
+def publish_case(case, old_status=None, new_status=None):
+    """Publish a case change with counter deltas; call inside the writing transaction."""
+    delta = {}
+    old_key = counters.STATUS_KEYS.get(old_status)
+    new_key = counters.STATUS_KEYS.get(new_status)
+    if old_key != new_key:
+        if old_key:
+            delta[old_key] = -1
+        if new_key:
+            delta[new_key] = delta.get(new_key, 0) + 1
+    event = BoardEvent.objects.create(kind="case", payload={
+        "case_id": case.pk,
+        "case_code": case.case_code,
+        "old_status": old_status,
+        "status": new_status,
+        "status_label": Case.Status(new_status).label if new_status else "",
+        "delta": delta,
+        "counts": counters.status_counts(),
+    })
+    if event.pk % PRUNE_EVERY == 0:
+        BoardEvent.objects.filter(created_at__lt=timezone.now() - RETENTION).delete()
+    return event
+
+
+def publish_bulk(created):
+    """One event for a bulk change (e.g. an import) instead of one per case."""
+    return BoardEvent.objects.create(kind="case", payload={
+        "bulk": created,
+        "counts": counters.status_counts(),
+    })
+
+
+def latest_id():
+    return BoardEvent.objects.order_by("-id").values_list("id", flat=True).first() or 0
+
+
+def events_since(last_id, limit=200):
+    return list(BoardEvent.objects.filter(id__gt=last_id).order_by("id")[:limit])
+
+
+def format_event(event):
+    data = json.dumps(event.payload, separators=(",", ":"))
+    return f"id: {event.id}\nevent: {event.kind}\ndata: {data}\n\n"
+
+
+class Hub:
+    """Reads the bus once per process and fans out to all subscriber queues."""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.loop = None
+        self.task = None
+
+    def subscribe(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:  # new event loop (e.g. server reload): start fresh
+            self.loop, self.task, self.subscribers = loop, None, set()
+        queue = asyncio.Queue(maxsize=1000)
+        self.subscribers.add(queue)
+        if self.task is None or self.task.done():
+            self.task = loop.create_task(self._run())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    async def _run(self):
+        last_id = await sync_to_async(latest_id)()
+        while self.subscribers:
+            events = await sync_to_async(events_since)(last_id)
+            for event in events:
+                last_id = event.id
+                for queue in list(self.subscribers):
+                    try:
+                        queue.put_nowait(event)
+                    except asyncio.QueueFull:  # stuck client: drop it, it reconnects
+                        self.subscribers.discard(queue)
+            await asyncio.sleep(POLL_INTERVAL)
+
+
+hub = Hub()
+
+
+async def stream(last_event_id=None):
+    """Async iterator of SSE frames; resumes after Last-Event-ID if given."""
+    queue = hub.subscribe()
+    try:
+        yield "retry: 3000\n\n"
+        last_id = 0
+        if last_event_id:
+            try:
+                last_id = int(last_event_id)
+            except ValueError:
+                last_id = 0
+            for event in await sync_to_async(events_since)(last_id):
+                last_id = event.id
+                yield format_event(event)
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT)
+            except asyncio.TimeoutError:
+                if queue not in hub.subscribers:
+                    return  # dropped by the hub; the browser reconnects with Last-Event-ID
+                yield ": ping\n\n"
+                continue
+            if event.id <= last_id:
+                continue
+            last_id = event.id
+            yield format_event(event)
+    finally:
+        hub.unsubscribe(queue)
@@ -0,0 +1,90 @@
+"""
+Fehlertolerante Patientensuche (Name + optional Geburtsdatum).
+
+Kandidaten kommen ausschließlich über Indizes: CaseNameKey (gleicher
+Kölner-Phonetik-Code oder ASCII-Präfix eines Namensteils) und, falls ein
+Geburtsdatum angegeben ist, ein Datumsbereich auf Case.patient_dob. Die
+höchstens CANDIDATE_LIMIT Kandidaten werden danach in Python bewertet:
+Namensähnlichkeit und Nähe des Geburtsdatums.
+"""
+import datetime
+from difflib import SequenceMatcher
+
+from django.db.models import Q
+
+from . import phonetic
+from .models import Case, CaseNameKey
+
+CANDIDATE_LIMIT = 500
+LOOKUP_LIMIT = 20
+DOB_WINDOW = datetime.timedelta(days=31)
+MIN_PREFIX = 2
+
+
+def _word_score(code, folded, case_codes, case_words):
+    """How well one query word matches the best part of a stored name (0..1)."""
+    if folded in case_words:
+        return 1.0
+    if any(w.startswith(folded) for w in case_words):
+        return 0.85
+    best = max((SequenceMatcher(None, folded, w).ratio() for w in case_words), default=0.0)
+    if code in case_codes:
+        return max(0.7, best)
+    return best * 0.6
+
+
+def _dob_score(query, dob):
+    if query is None or dob is None:
+        return 0.0
+    if query == dob:
+        return 1.0
+    if (query.year, query.month, query.day) == (dob.year, dob.day, dob.month):
+        return 0.8  # day and month swapped
+    days = abs((query - dob).days)
+    return max(0.0, 0.6 * (1 - days / 365))
+
+
+def score(case, query_keys, dob=None):
+    case_codes = set(case.name_phonetic.split())
+    case_words = case.name_folded.split()
+    name = (sum(_word_score(code, folded, case_codes, case_words) for code, folded in query_keys)
+            / len(query_keys)) if query_keys else 0.0
+    if dob is None:
+        return name
+    if not query_keys:
+        return _dob_score(dob, case.patient_dob)
+    return 0.7 * name + 0.3 * _dob_score(dob, case.patient_dob)
+
+
+def candidate_ids(query_keys, dob=None, lab=None):
+    ids = set()
+    if query_keys:
+        cond = Q(phonetic__in={code for code, _ in query_keys})
+        for _, folded in query_keys:
+            if len(folded) >= MIN_PREFIX:
+                cond |= Q(folded__startswith=folded)
+        keys = CaseNameKey.objects.filter(cond)
+        if lab is not None:
+            keys = keys.filter(case__lab=lab)
+        ids.update(keys.values_list("case_id", flat=True).distinct()[:CANDIDATE_LIMIT])
+    if dob is not None:
+        cases = Case.objects.filter(patient_dob__range=(dob - DOB_WINDOW, dob + DOB_WINDOW))
+        if lab is not None:
+            cases = cases.filter(lab=lab)
+        ids.update(cases.values_list("id", flat=True)[:CANDIDATE_LIMIT])
+    return ids
+
+
+def lookup(name, dob=None, lab=None, limit=LOOKUP_LIMIT):
+    """Best matching cases as [(case, score)], best first."""
+    query_keys = phonetic.name_keys(name)
+    if not query_keys and dob is None:
+        return []
+    ids = candidate_ids(query_keys, dob, lab)
+    if not ids:
+        return []
+    scored = [(case, score(case, query_keys, dob))
+              for case in Case.objects.select_related("lab").filter(id__in=ids)]
+    scored = [(case, s) for case, s in scored if s > 0]
+    scored.sort(key=lambda item: (-item[1], -item[0].created_at.timestamp()))
+    return scored[:limit]
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tracker.models import Case, CaseNameKey
+
+
+class Command(BaseCommand):
+    help = (
+        "Berechnet die phonetischen Namensschlüssel (Case.name_phonetic/name_folded "
+        "und CaseNameKey) für bestehende Fälle, blockweise nach ID."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--all", action="store_true",
+                            help="Alle Fälle neu berechnen, nicht nur die ohne Schlüssel.")
+
+    def handle(self, *args, **opts):
+        batch_size = opts["batch_size"]
+        qs = Case.objects.only("id", "patient_name", "name_phonetic", "name_folded").order_by("id")
+        if not opts["all"]:
+            qs = qs.filter(name_phonetic="")
+        last_id, done = 0, 0
+        while True:
+            batch = list(qs.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                for case in batch:
+                    case.set_name_keys()
+                Case.objects.bulk_update(batch, ["name_phonetic", "name_folded"])
+                CaseNameKey.objects.filter(case__in=batch).delete()
+                CaseNameKey.objects.bulk_create([key for case in batch for key in CaseNameKey.build(case)])
+            last_id = batch[-1].id
+            done += len(batch)
+            self.stdout.write(f"{done} Fälle verarbeitet (bis ID {last_id})")
+        self.stdout.write(self.style.SUCCESS(f"Namensschlüssel aktualisiert: {done} Fälle"))
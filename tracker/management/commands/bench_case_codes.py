@@ -0,0 +1,59 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tracker.models import Case, CaseCodeSequence, Lab
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark der Fallnummernvergabe bei wachsender Fallzahl. Läuft komplett "
+        "in einer Transaktion, die am Ende zurückgerollt wird."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cases", type=int, default=1_000_000,
+                            help="Anzahl Fälle, bis zu der gemessen wird (Standard: 1.000.000).")
+        parser.add_argument("--samples", type=int, default=500,
+                            help="Vergaben pro Messpunkt.")
+
+    def handle(self, *args, **opts):
+        target, samples = opts["cases"], opts["samples"]
+        checkpoints = sorted({0, *[n for n in (10_000, 100_000, 1_000_000) if n < target], target})
+        year = datetime.date.today().year
+
+        with transaction.atomic():
+            lab = Lab.objects.create(name=f"__bench_{time.time_ns()}")
+            created = 0
+            self.stdout.write(f"{'Fälle':>10}  {'Sequenz µs/Code':>16}  {'Präfix-Scan µs':>15}")
+            for checkpoint in checkpoints:
+                created = self._seed(lab, created, checkpoint)
+                seq_us = self._time(samples, lambda: CaseCodeSequence.reserve(1, year))
+                scan_us = self._time(samples, lambda: (
+                    Case.objects.filter(case_code__startswith=f"C-{year}-").order_by("-id").first()
+                ))
+                self.stdout.write(f"{checkpoint:>10}  {seq_us:>16.1f}  {scan_us:>15.1f}")
+            bulk = self._time(10, lambda: CaseCodeSequence.reserve(1000, year)) / 1000
+            self.stdout.write(f"Bulk-Reservierung (1000er Blöcke): {bulk:.2f} µs/Code")
+            transaction.set_rollback(True)
+
+    def _seed(self, lab, created, upto, chunk=10_000):
+        dob = datetime.date(1980, 1, 1)
+        while created < upto:
+            n = min(chunk, upto - created)
+            codes = CaseCodeSequence.reserve(n)
+            Case.objects.bulk_create(
+                [Case(case_code=code, patient_name="Bench", patient_dob=dob, lab=lab) for code in codes],
+                batch_size=1000,
+            )
+            created += n
+        return created
+
+    @staticmethod
+    def _time(samples, fn):
+        start = time.perf_counter()
+        for _ in range(samples):
+            fn()
+        return (time.perf_counter() - start) / samples * 1e6
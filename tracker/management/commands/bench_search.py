@@ -0,0 +1,77 @@
+import datetime
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from tracker import search
+from tracker.models import Case, CaseCodeSequence, CaseComment, Lab
+
+SURNAMES = ["Müller", "Schmidt", "Schneider", "Fischer", "Weber", "Meyer", "Wagner", "Becker",
+            "Schulz", "Hoffmann", "Koch", "Richter", "Klein", "Wolf", "Schröder", "Neumann"]
+WORDS = ["Krone", "Brücke", "Inlay", "Abformung", "Zirkon", "Farbe", "Bissnahme", "Provisorium"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Vergleicht die FTS5-Suche mit der icontains-Suche (Q) bei N Fällen. Läuft "
+        "komplett in einer Transaktion, die am Ende zurückgerollt wird."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cases", type=int, default=100_000,
+                            help="Anzahl Testfälle (Standard: 100.000).")
+        parser.add_argument("--samples", type=int, default=20,
+                            help="Wiederholungen pro Suchbegriff.")
+
+    def handle(self, *args, **opts):
+        if not search.available():
+            raise CommandError("Kein FTS5-Suchindex vorhanden.")
+        n, samples = opts["cases"], opts["samples"]
+        terms = ["Mül", "Schröder", "Krone", CaseCodeSequence.reserve()[0][:-3], "xyz"]
+
+        with transaction.atomic():
+            lab = Lab.objects.create(name=f"__bench_{time.time_ns()}")
+            start = time.perf_counter()
+            self._seed(lab, n)
+            self.stdout.write(f"{n} Fälle + Kommentare angelegt in {time.perf_counter() - start:.1f} s")
+
+            base = Case.objects.order_by("-created_at", "-id")
+            self.stdout.write(f"{'Suche':>14}  {'Treffer':>8}  {'Q ms':>8}  {'FTS ms':>8}  {'Rang ms':>8}")
+            for term in terms:
+                q_qs = base.filter(Q(patient_name__icontains=term) | Q(case_code__icontains=term)
+                                   | Q(lab__name__icontains=term))
+                fts_qs = search.filter_cases(base, term)
+                hits = fts_qs.count()
+                q_ms = self._time(samples, lambda: list(q_qs[:25]))
+                fts_ms = self._time(samples, lambda: list(fts_qs[:25]))
+                rank_ms = self._time(samples, lambda: search.ranked(term, limit=25))
+                self.stdout.write(f"{term:>14}  {hits:>8}  {q_ms:>8.2f}  {fts_ms:>8.2f}  {rank_ms:>8.2f}")
+            transaction.set_rollback(True)
+
+    def _seed(self, lab, upto, chunk=10_000):
+        rnd = random.Random(42)
+        dob = datetime.date(1980, 1, 1)
+        created = 0
+        while created < upto:
+            count = min(chunk, upto - created)
+            cases = Case.objects.bulk_create(
+                [Case(case_code=code, patient_name=f"{rnd.choice(SURNAMES)} {rnd.randint(1, 9999)}",
+                      patient_dob=dob, lab=lab)
+                 for code in CaseCodeSequence.reserve(count)],
+                batch_size=1000,
+            )
+            CaseComment.objects.bulk_create(
+                [CaseComment(case=c, text=" ".join(rnd.sample(WORDS, 3))) for c in cases[::4]],
+                batch_size=1000,
+            )
+            created += count
+
+    @staticmethod
+    def _time(samples, fn):
+        start = time.perf_counter()
+        for _ in range(samples):
+            fn()
+        return (time.perf_counter() - start) / samples * 1e3
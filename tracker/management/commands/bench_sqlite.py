@@ -0,0 +1,149 @@
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+# No tracker imports at module level: the benchmark workers are spawned
+# processes that import this module before django.setup().
+
+MODES = ("default", "production")
+
+
+def _configure(path, mode):
+    """Point the default connection at the benchmark copy, with or without the production options."""
+    from django.db import connections
+
+    db = connections["default"]
+    db.close()
+    db.settings_dict["NAME"] = str(path)
+    db.settings_dict["OPTIONS"] = (
+        {"transaction_mode": "IMMEDIATE", "init_command": settings.SQLITE_PRAGMAS} if mode == "production" else {}
+    )
+
+
+def _worker(path, mode, seconds, write_ratio, case_ids, seed, results):
+    import django
+
+    django.setup()
+    from django.db import OperationalError
+
+    from tracker import sqlite, views
+    from tracker.models import Case
+
+    _configure(path, mode)
+    rng = random.Random(seed)
+    statuses = list(Case.Status.values)
+    reads, writes, locked, latencies = 0, 0, 0, []
+    deadline = time.monotonic() + seconds
+    try:
+        while time.monotonic() < deadline:
+            pk = rng.choice(case_ids)
+            start = time.perf_counter()
+            try:
+                if rng.random() < write_ratio:
+                    # a status scan: event, status, counters, board stamp. Called like the views
+                    # do, outside any atomic block, so a locked database goes through the retries.
+                    case = Case.objects.select_related("lab").get(pk=pk)
+                    views._set_status(case, rng.choice(statuses), actor="LAB", note="bench")
+                    writes += 1
+                else:
+                    case = Case.objects.select_related("lab").get(pk=pk)
+                    list(case.events.all())
+                    reads += 1
+            except OperationalError as exc:
+                if not sqlite.is_locked(exc):
+                    raise
+                locked += 1
+            latencies.append(time.perf_counter() - start)
+    finally:
+        # always report, the parent waits for one result per worker
+        results.put({"reads": reads, "writes": writes, "locked": locked, "latencies": latencies})
+
+
+class Command(BaseCommand):
+    help = (
+        "Durchsatz von SQLite mit mehreren Prozessen (gemischtes Lesen/Schreiben), "
+        "Standardeinstellungen gegen SQLITE_PRODUCTION. Arbeitet auf einer Kopie der Datenbank."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8],
+                            help="Anzahl paralleler Prozesse (mehrere Werte möglich).")
+        parser.add_argument("--seconds", type=float, default=5.0, help="Dauer pro Messung.")
+        parser.add_argument("--write-ratio", type=float, default=0.2, help="Anteil schreibender Operationen.")
+        parser.add_argument("--mode", choices=(*MODES, "both"), default="both")
+
+    def handle(self, *args, **opts):
+        if connection.vendor != "sqlite":
+            raise CommandError("Nur für SQLite.")
+        from tracker.models import Case
+
+        case_ids = list(Case.objects.values_list("id", flat=True)[:5000])
+        if not case_ids:
+            raise CommandError("Keine Fälle in der Datenbank – erst Fälle anlegen oder importieren.")
+        modes = MODES if opts["mode"] == "both" else (opts["mode"],)
+
+        tmp = Path(tempfile.mkdtemp(prefix="bench_sqlite_"))
+        try:
+            self.stdout.write(
+                f"{'Modus':<11} {'Worker':>6} {'Ops/s':>8} {'Lesen/s':>8} {'Schreiben/s':>11} "
+                f"{'gesperrt':>8} {'p50 ms':>7} {'p95 ms':>7}"
+            )
+            for mode in modes:
+                for workers in opts["workers"]:
+                    path = self._copy(tmp, mode)
+                    row = self._run(path, mode, workers, opts["seconds"], opts["write_ratio"], case_ids)
+                    self.stdout.write(
+                        f"{mode:<11} {workers:>6} {row['ops']:>8.0f} {row['reads']:>8.0f} {row['writes']:>11.0f} "
+                        f"{row['locked']:>8} {row['p50']:>7.1f} {row['p95']:>7.1f}"
+                    )
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def _copy(self, tmp, mode):
+        """Fresh copy per run (online backup API), journal mode as the mode would leave it."""
+        path = tmp / f"{mode}.sqlite3"
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{path}{suffix}").unlink(missing_ok=True)
+        src = sqlite3.connect(settings.DATABASES["default"]["NAME"])
+        dst = sqlite3.connect(path)
+        with dst:
+            src.backup(dst)
+        dst.execute("PRAGMA journal_mode=" + ("WAL" if mode == "production" else "DELETE"))
+        dst.close()
+        src.close()
+        return path
+
+    def _run(self, path, mode, workers, seconds, write_ratio, case_ids):
+        ctx = multiprocessing.get_context("spawn")
+        results = ctx.Queue()
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "casetracker.settings")
+        procs = [
+            ctx.Process(target=_worker, args=(path, mode, seconds, write_ratio, case_ids, n, results))
+            for n in range(workers)
+        ]
+        for p in procs:
+            p.start()
+        parts = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+        latencies = sorted(x for part in parts for x in part["latencies"])
+        reads = sum(part["reads"] for part in parts)
+        writes = sum(part["writes"] for part in parts)
+        return {
+            "ops": (reads + writes) / seconds,
+            "reads": reads / seconds,
+            "writes": writes / seconds,
+            "locked": sum(part["locked"] for part in parts),
+            "p50": statistics.median(latencies) * 1000 if latencies else 0,
+            "p95": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0,
+        }
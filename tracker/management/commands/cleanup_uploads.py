@@ -0,0 +1,19 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from tracker import resumable
+
+
+class Command(BaseCommand):
+    help = "Entfernt abgebrochene fortsetzbare Uploads (Sitzung und Teildatei)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=float, default=24,
+                            help="Sitzungen ohne Fortschritt seit so vielen Stunden löschen (Standard: 24).")
+
+    def handle(self, *args, **opts):
+        sessions, orphans = resumable.cleanup(datetime.timedelta(hours=opts["hours"]))
+        self.stdout.write(self.style.SUCCESS(
+            f"{sessions} Upload-Sitzungen und {orphans} verwaiste Teildateien entfernt"
+        ))
@@ -0,0 +1,44 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tracker import stl, thumbs, uploads
+from tracker.models import Attachment
+
+
+class Command(BaseCommand):
+    help = (
+        "Überführt ältere Anhänge (eigene Datei, kein Blob) in die inhaltsadressierte "
+        "Ablage; gleiche Inhalte werden dabei nur noch einmal gespeichert."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=200)
+
+    def handle(self, *args, **opts):
+        qs = Attachment.objects.filter(blob__isnull=True).exclude(file="").order_by("id")
+        last_id = moved = missing = freed = 0
+        while True:
+            batch = list(qs.filter(id__gt=last_id)[:opts["batch_size"]])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            for att in batch:
+                old = att.file.name
+                if not default_storage.exists(old):
+                    missing += 1
+                    continue
+                with default_storage.open(old, "rb") as f:
+                    with transaction.atomic():
+                        blob = uploads.store(f)
+                        Attachment.objects.filter(pk=att.pk).update(blob=blob, file=blob.file.name)
+                moved += 1
+                if old != blob.file.name and not Attachment.objects.filter(file=old).exists():
+                    freed += default_storage.size(old)
+                    default_storage.delete(old)
+                    # previews of the old file; the blob gets its own on the next request
+                    thumbs.delete(old)
+                    stl.delete(old)
+        self.stdout.write(self.style.SUCCESS(
+            f"{moved} Anhänge übernommen, {missing} Dateien fehlen, {freed / 1e6:.1f} MB frei"
+        ))
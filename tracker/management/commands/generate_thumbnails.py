@@ -0,0 +1,24 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from tracker import stl, thumbs
+from tracker.models import Attachment, Task
+
+
+class Command(BaseCommand):
+    help = (
+        "Legt Aufträge für fehlende Vorschauen bestehender Anhänge an "
+        "(WebP für Bilder, Auswertung für STL); abgearbeitet von run_tasks."
+    )
+
+    def handle(self, *args, **opts):
+        names = sorted(set(Attachment.objects.exclude(file="").values_list("file", flat=True).iterator()))
+        queued = []
+        for name in names:
+            if thumbs.is_image(name) and thumbs.missing(name) and default_storage.exists(name):
+                queued.append(Task(name="thumbs.render", kwargs={"name": name}))
+            elif stl.is_stl(name) and default_storage.exists(name) and not all(
+                    default_storage.exists(stl.artifact_name(name, v)) for v in stl.ARTIFACTS):
+                queued.append(Task(name="stl.process", kwargs={"name": name}))
+        Task.objects.bulk_create(queued, batch_size=500)
+        self.stdout.write(self.style.SUCCESS(f"{len(queued)} Aufträge angelegt (manage.py run_tasks arbeitet sie ab)"))
@@ -0,0 +1,35 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker import importer
+
+
+class Command(BaseCommand):
+    help = "Importiert Fälle aus einer CSV- oder XLSX-Datei (patient_name, patient_dob, lab)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV- oder XLSX-Datei")
+        parser.add_argument("--user", help="Benutzername, der als Ersteller eingetragen wird")
+        parser.add_argument("--chunk-size", type=int, default=importer.CHUNK_SIZE,
+                            help="Zeilen pro Transaktion (Standard: %(default)s)")
+
+    def handle(self, *args, **opts):
+        user = None
+        if opts["user"]:
+            user = User.objects.filter(username=opts["user"]).first()
+            if not user:
+                raise CommandError(f"Benutzer {opts['user']!r} nicht gefunden.")
+        try:
+            with open(opts["path"], "rb") as fh:
+                result = importer.import_cases(
+                    importer.read_rows(fh, opts["path"]), user=user, chunk_size=opts["chunk_size"],
+                )
+        except (OSError, importer.ImportFileError) as exc:
+            raise CommandError(str(exc))
+
+        for line, message in result.errors:
+            self.stderr.write(f"Zeile {line}: {message}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{result.created} Fälle importiert, {len(result.errors)} Fehler, "
+            f"{result.seconds:.2f} s ({result.rows_per_second:.0f} Zeilen/s)"
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker import search
+
+
+class Command(BaseCommand):
+    help = "Baut den Volltext-Suchindex (FTS5) aus Fällen, Kommentaren und Anhängen neu auf."
+
+    def handle(self, *args, **opts):
+        if not search.available():
+            raise CommandError("Kein FTS5-Suchindex vorhanden (nur SQLite mit FTS5; Migration 0013 ausgeführt?).")
+        rows = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Suchindex neu aufgebaut: {rows} Einträge"))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from tracker import counters
+from tracker.models import Case, CaseStatusCount
+
+
+class Command(BaseCommand):
+    help = "Baut die Status-Zähler (CaseStatusCount) aus der Case-Tabelle neu auf."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check", action="store_true",
+            help="Nur vergleichen, nichts schreiben (Exit-Code 1 bei Abweichung).",
+        )
+
+    def handle(self, *args, **opts):
+        if opts["check"]:
+            stored = {
+                (lab_id, status): n
+                for lab_id, status, n in CaseStatusCount.objects.exclude(count=0)
+                .values_list("lab_id", "status", "count")
+            }
+            actual = {
+                (r["lab_id"], r["status"]): r["n"]
+                for r in Case.objects.values("lab_id", "status").annotate(n=Count("id")).order_by()
+            }
+            if stored != actual:
+                raise CommandError(f"Abweichung: gespeichert={stored} tatsächlich={actual}")
+            self.stdout.write(self.style.SUCCESS(f"Zähler stimmen: {counters.status_counts()}"))
+            return
+        result = counters.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Zähler neu aufgebaut: {result}"))
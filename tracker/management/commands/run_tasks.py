@@ -0,0 +1,34 @@
+import json
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from tracker import tasks
+
+
+class Command(BaseCommand):
+    help = "Arbeitet die Hintergrund-Aufträge (tracker.tasks) ab."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=1, help="Parallele Aufträge (Standard: 1).")
+        parser.add_argument("--processes", action="store_true",
+                            help="Prozesse statt Threads (für CPU-lastige Aufträge wie Vorschaubilder).")
+        parser.add_argument("--poll", type=float, default=1.0, help="Sekunden zwischen Abfragen einer leeren Queue.")
+        parser.add_argument("--burst", action="store_true", help="Beenden, sobald keine Aufträge mehr fällig sind.")
+        parser.add_argument("--stats", action="store_true", help="Nur den Stand der Queue ausgeben.")
+
+    def handle(self, *args, **opts):
+        if opts["stats"]:
+            self.stdout.write(json.dumps(tasks.stats(), indent=2, default=str))
+            return
+
+        stop = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())  # finish running tasks, then exit
+        self.stdout.write(f"Worker gestartet ({opts['concurrency']} {'Prozesse' if opts['processes'] else 'Threads'})")
+        done = tasks.run_worker(
+            concurrency=max(1, opts["concurrency"]), processes=opts["processes"],
+            poll=opts["poll"], burst=opts["burst"], stop=stop,
+        )
+        self.stdout.write(self.style.SUCCESS(f"{done} Aufträge bearbeitet"))
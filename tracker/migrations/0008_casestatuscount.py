@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_counts(apps, schema_editor):
+    Case = apps.get_model('tracker', 'Case')
+    CaseStatusCount = apps.get_model('tracker', 'CaseStatusCount')
+    rows = Case.objects.values('lab_id', 'status').annotate(n=Count('id')).order_by()
+    CaseStatusCount.objects.bulk_create([
+        CaseStatusCount(lab_id=r['lab_id'], status=r['status'], count=r['n']) for r in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0007_casecomment_attachment_comment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaseStatusCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('SENT_CLINIC', 'Von Praxis gesendet'), ('RECEIVED_BY_LAB', 'Im Labor eingegangen'), ('RETURNED_BY_LAB', 'An Praxis zurückgesendet'), ('RECEIVED_BY_CLINIC', 'In Praxis erhalten')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('lab', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_counts', to='tracker.lab')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('lab', 'status'), name='uniq_status_count_lab_status')],
+            },
+        ),
+        migrations.RunPython(fill_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:38
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def create_stamps(apps, schema_editor):
+    ChangeStamp = apps.get_model('tracker', 'ChangeStamp')
+    ChangeStamp.objects.get_or_create(name='board')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0008_casestatuscount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeStamp',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(create_stamps, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:42
+
+from django.db import migrations, models
+
+
+def seed_sequences(apps, schema_editor):
+    """Continue numbering after the highest existing code of each year."""
+    Case = apps.get_model('tracker', 'Case')
+    CaseCodeSequence = apps.get_model('tracker', 'CaseCodeSequence')
+    last = {}
+    for code in Case.objects.values_list('case_code', flat=True).iterator():
+        try:
+            _, year, seq = code.split('-')
+            year, seq = int(year), int(seq)
+        except ValueError:
+            continue
+        last[year] = max(last.get(year, 0), seq)
+    CaseCodeSequence.objects.bulk_create([
+        CaseCodeSequence(year=year, last=seq) for year, seq in last.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0010_boardevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaseCodeSequence',
+            fields=[
+                ('year', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('last', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
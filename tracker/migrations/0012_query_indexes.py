@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0011_casecodesequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='case',
+            index=models.Index(fields=['created_at'], name='case_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='case',
+            index=models.Index(fields=['status', 'created_at'], name='case_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='case',
+            index=models.Index(fields=['lab', 'status', 'created_at'], name='case_lab_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='case',
+            index=models.Index(fields=['lab', 'created_at'], name='case_lab_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='casecomment',
+            index=models.Index(fields=['case', 'created_at'], name='comment_case_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['case', 'created_at'], name='event_case_created_idx'),
+        ),
+    ]
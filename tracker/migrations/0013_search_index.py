@@ -0,0 +1,144 @@
+# FTS5 search index over cases, comments and attachments (SQLite only)
+
+from django.db import migrations
+
+CREATE = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS tracker_search USING fts5(
+        case_id UNINDEXED, code, name, lab, text,
+        tokenize = "unicode61 remove_diacritics 2"
+    )
+    """,
+    # cases: rowid = id * 4
+    """
+    CREATE TRIGGER tracker_search_case_ai AFTER INSERT ON tracker_case BEGIN
+        INSERT INTO tracker_search(rowid, case_id, code, name, lab, text)
+        VALUES (new.id * 4, new.id, new.case_code, new.patient_name,
+                (SELECT name FROM tracker_lab WHERE id = new.lab_id), '');
+    END
+    """,
+    """
+    CREATE TRIGGER tracker_search_case_au AFTER UPDATE OF case_code, patient_name, lab_id ON tracker_case BEGIN
+        DELETE FROM tracker_search WHERE rowid = old.id * 4;
+        INSERT INTO tracker_search(rowid, case_id, code, name, lab, text)
+        VALUES (new.id * 4, new.id, new.case_code, new.patient_name,
+                (SELECT name FROM tracker_lab WHERE id = new.lab_id), '');
+    END
+    """,
+    """
+    CREATE TRIGGER tracker_search_case_ad AFTER DELETE ON tracker_case BEGIN
+        DELETE FROM tracker_search WHERE rowid = old.id * 4;
+    END
+    """,
+    # comments: rowid = id * 4 + 1
+    """
+    CREATE TRIGGER tracker_search_comment_ai AFTER INSERT ON tracker_casecomment BEGIN
+        INSERT INTO tracker_search(rowid, case_id, code, name, lab, text)
+        VALUES (new.id * 4 + 1, new.case_id, '', '', '', new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER tracker_search_comment_au AFTER UPDATE OF text, case_id ON tracker_casecomment BEGIN
+        DELETE FROM tracker_search WHERE rowid = old.id * 4 + 1;
+        INSERT INTO tracker_search(rowid, case_id, code, name, lab, text)
+        VALUES (new.id * 4 + 1, new.case_id, '', '', '', new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER tracker_search_comment_ad AFTER DELETE ON tracker_casecomment BEGIN
+        DELETE FROM tracker_search WHERE rowid = old.id * 4 + 1;
+    END
+    """,
+    # attachments: rowid = id * 4 + 2; label plus file base name
+    """
+    CREATE TRIGGER tracker_search_attachment_ai AFTER INSERT ON tracker_attachment BEGIN
+        INSERT INTO tracker_search(rowid, case_id, code, name, lab, text)
+        VALUES (new.id * 4 + 2, new.case_id, '', '', '',
+                new.label || ' ' || substr(new.file, length(rtrim(new.file, replace(new.file, '/', ''))) + 1));
+    END
+    """,
+    """
+    CREATE TRIGGER tracker_search_attachment_au AFTER UPDATE OF label, file, case_id ON tracker_attachment BEGIN
+        DELETE FROM tracker_search WHERE rowid = old.id * 4 + 2;
+        INSERT INTO tracker_search(rowid, case_id, code, name, lab, text)
+        VALUES (new.id * 4 + 2, new.case_id, '', '', '',
+                new.label || ' ' || substr(new.file, length(rtrim(new.file, replace(new.file, '/', ''))) + 1));
+    END
+    """,
+    """
+    CREATE TRIGGER tracker_search_attachment_ad AFTER DELETE ON tracker_attachment BEGIN
+        DELETE FROM tracker_search WHERE rowid = old.id * 4 + 2;
+    END
+    """,
+    # renaming a lab re-indexes its cases
+    """
+    CREATE TRIGGER tracker_search_lab_au AFTER UPDATE OF name ON tracker_lab BEGIN
+        DELETE FROM tracker_search WHERE rowid IN (SELECT id * 4 FROM tracker_case WHERE lab_id = new.id);
+        INSERT INTO tracker_search(rowid, case_id, code, name, lab, text)
+        SELECT id * 4, id, case_code, patient_name, new.name, '' FROM tracker_case WHERE lab_id = new.id;
+    END
+    """,
+]
+
+POPULATE = [
+    """
+    INSERT INTO tracker_search(rowid, case_id, code, name, lab, text)
+    SELECT c.id * 4, c.id, c.case_code, c.patient_name, l.name, ''
+    FROM tracker_case c LEFT JOIN tracker_lab l ON l.id = c.lab_id
+    """,
+    """
+    INSERT INTO tracker_search(rowid, case_id, code, name, lab, text)
+    SELECT id * 4 + 1, case_id, '', '', '', text FROM tracker_casecomment
+    """,
+    """
+    INSERT INTO tracker_search(rowid, case_id, code, name, lab, text)
+    SELECT id * 4 + 2, case_id, '', '', '',
+           label || ' ' || substr(file, length(rtrim(file, replace(file, '/', ''))) + 1)
+    FROM tracker_attachment
+    """,
+]
+
+TRIGGERS = [
+    "tracker_search_case_ai", "tracker_search_case_au", "tracker_search_case_ad",
+    "tracker_search_comment_ai", "tracker_search_comment_au", "tracker_search_comment_ad",
+    "tracker_search_attachment_ai", "tracker_search_attachment_au", "tracker_search_attachment_ad",
+    "tracker_search_lab_au",
+]
+
+
+def fts5_supported(connection):
+    if connection.vendor != "sqlite":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        options = {row[0] for row in cursor.fetchall()}
+    return "ENABLE_FTS5" in options
+
+
+def create_index(apps, schema_editor):
+    # other databases keep the icontains search (see tracker.search)
+    if not fts5_supported(schema_editor.connection):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for sql in CREATE + POPULATE:
+            cursor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute("DROP TABLE IF EXISTS tracker_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0012_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:56
+
+from django.db import migrations, models
+
+# Frozen copy of the 0013 triggers that involve tracker_case: the table rebuild
+# below drops them (and a dangling lab trigger would make the rename fail).
+DROP_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS tracker_search_case_ai",
+    "DROP TRIGGER IF EXISTS tracker_search_case_au",
+    "DROP TRIGGER IF EXISTS tracker_search_case_ad",
+    "DROP TRIGGER IF EXISTS tracker_search_lab_au",
+]
+
+CREATE_TRIGGERS = [
+    """
+    CREATE TRIGGER tracker_search_case_ai AFTER INSERT ON tracker_case BEGIN
+        INSERT INTO tracker_search(rowid, case_id, code, name, lab, text)
+        VALUES (new.id * 4, new.id, new.case_code, new.patient_name,
+                (SELECT name FROM tracker_lab WHERE id = new.lab_id), '');
+    END
+    """,
+    """
+    CREATE TRIGGER tracker_search_case_au AFTER UPDATE OF case_code, patient_name, lab_id ON tracker_case BEGIN
+        DELETE FROM tracker_search WHERE rowid = old.id * 4;
+        INSERT INTO tracker_search(rowid, case_id, code, name, lab, text)
+        VALUES (new.id * 4, new.id, new.case_code, new.patient_name,
+                (SELECT name FROM tracker_lab WHERE id = new.lab_id), '');
+    END
+    """,
+    """
+    CREATE TRIGGER tracker_search_case_ad AFTER DELETE ON tracker_case BEGIN
+        DELETE FROM tracker_search WHERE rowid = old.id * 4;
+    END
+    """,
+    """
+    CREATE TRIGGER tracker_search_lab_au AFTER UPDATE OF name ON tracker_lab BEGIN
+        DELETE FROM tracker_search WHERE rowid IN (SELECT id * 4 FROM tracker_case WHERE lab_id = new.id);
+        INSERT INTO tracker_search(rowid, case_id, code, name, lab, text)
+        SELECT id * 4, id, case_code, patient_name, new.name, '' FROM tracker_case WHERE lab_id = new.id;
+    END
+    """,
+]
+
+
+class TriggerSQL(migrations.RunSQL):
+    """RunSQL that only runs where 0013 created the FTS index (SQLite with FTS5)."""
+
+    def _run_sql(self, schema_editor, sqls):
+        if "tracker_search" in schema_editor.connection.introspection.table_names():
+            super()._run_sql(schema_editor, sqls)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0014_name_phonetic'),
+    ]
+
+    operations = [
+        TriggerSQL(DROP_TRIGGERS, CREATE_TRIGGERS),
+        migrations.AddField(
+            model_name='case',
+            name='revision',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        TriggerSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
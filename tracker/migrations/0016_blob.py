@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Frozen copy of the 0013 attachment triggers: the table rebuild below drops them.
+DROP_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS tracker_search_attachment_ai",
+    "DROP TRIGGER IF EXISTS tracker_search_attachment_au",
+    "DROP TRIGGER IF EXISTS tracker_search_attachment_ad",
+]
+
+CREATE_TRIGGERS = [
+    """
+    CREATE TRIGGER tracker_search_attachment_ai AFTER INSERT ON tracker_attachment BEGIN
+        INSERT INTO tracker_search(rowid, case_id, code, name, lab, text)
+        VALUES (new.id * 4 + 2, new.case_id, '', '', '',
+                new.label || ' ' || substr(new.file, length(rtrim(new.file, replace(new.file, '/', ''))) + 1));
+    END
+    """,
+    """
+    CREATE TRIGGER tracker_search_attachment_au AFTER UPDATE OF label, file, case_id ON tracker_attachment BEGIN
+        DELETE FROM tracker_search WHERE rowid = old.id * 4 + 2;
+        INSERT INTO tracker_search(rowid, case_id, code, name, lab, text)
+        VALUES (new.id * 4 + 2, new.case_id, '', '', '',
+                new.label || ' ' || substr(new.file, length(rtrim(new.file, replace(new.file, '/', ''))) + 1));
+    END
+    """,
+    """
+    CREATE TRIGGER tracker_search_attachment_ad AFTER DELETE ON tracker_attachment BEGIN
+        DELETE FROM tracker_search WHERE rowid = old.id * 4 + 2;
+    END
+    """,
+]
+
+
+class TriggerSQL(migrations.RunSQL):
+    """RunSQL that only runs where 0013 created the FTS index (SQLite with FTS5)."""
+
+    def _run_sql(self, schema_editor, sqls):
+        if "tracker_search" in schema_editor.connection.introspection.table_names():
+            super()._run_sql(schema_editor, sqls)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0015_case_revision'),
+    ]
+
+    operations = [
+        TriggerSQL(DROP_TRIGGERS, CREATE_TRIGGERS),
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('file', models.FileField(upload_to='')),
+                ('size', models.BigIntegerField(default=0)),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='attachments', to='tracker.blob'),
+        ),
+        TriggerSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:10
+
+from django.db import migrations, models
+
+# Frozen copy of the 0013 attachment triggers: the table rebuild below drops them.
+DROP_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS tracker_search_attachment_ai",
+    "DROP TRIGGER IF EXISTS tracker_search_attachment_au",
+    "DROP TRIGGER IF EXISTS tracker_search_attachment_ad",
+]
+
+CREATE_TRIGGERS = [
+    """
+    CREATE TRIGGER tracker_search_attachment_ai AFTER INSERT ON tracker_attachment BEGIN
+        INSERT INTO tracker_search(rowid, case_id, code, name, lab, text)
+        VALUES (new.id * 4 + 2, new.case_id, '', '', '',
+                new.label || ' ' || substr(new.file, length(rtrim(new.file, replace(new.file, '/', ''))) + 1));
+    END
+    """,
+    """
+    CREATE TRIGGER tracker_search_attachment_au AFTER UPDATE OF label, file, case_id ON tracker_attachment BEGIN
+        DELETE FROM tracker_search WHERE rowid = old.id * 4 + 2;
+        INSERT INTO tracker_search(rowid, case_id, code, name, lab, text)
+        VALUES (new.id * 4 + 2, new.case_id, '', '', '',
+                new.label || ' ' || substr(new.file, length(rtrim(new.file, replace(new.file, '/', ''))) + 1));
+    END
+    """,
+    """
+    CREATE TRIGGER tracker_search_attachment_ad AFTER DELETE ON tracker_attachment BEGIN
+        DELETE FROM tracker_search WHERE rowid = old.id * 4 + 2;
+    END
+    """,
+]
+
+
+class TriggerSQL(migrations.RunSQL):
+    """RunSQL that only runs where 0013 created the FTS index (SQLite with FTS5)."""
+
+    def _run_sql(self, schema_editor, sqls):
+        if "tracker_search" in schema_editor.connection.introspection.table_names():
+            super()._run_sql(schema_editor, sqls)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0017_uploadsession'),
+    ]
+
+    operations = [
+        TriggerSQL(DROP_TRIGGERS, CREATE_TRIGGERS),
+        migrations.AddField(
+            model_name='attachment',
+            name='meta',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        TriggerSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0019_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PinThrottle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('tokens', models.FloatField()),
+                ('stamp', models.FloatField()),
+                ('failures', models.PositiveIntegerField(default=0)),
+                ('locked_until', models.FloatField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.contrib.auth.hashers import make_password
+from django.db import migrations
+
+
+def create_defaults(apps, schema_editor):
+    # formerly created lazily by AppSettings.get() on the first request
+    AppSettings = apps.get_model('tracker', 'AppSettings')
+    ChangeStamp = apps.get_model('tracker', 'ChangeStamp')
+    obj, _ = AppSettings.objects.get_or_create(name='default')
+    if not obj.praxis_pin_hash:
+        obj.praxis_pin_hash = make_password('000000')
+        obj.save(update_fields=['praxis_pin_hash'])
+    ChangeStamp.objects.get_or_create(name='appsettings')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0020_pinthrottle'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_defaults, migrations.RunPython.noop),
+    ]
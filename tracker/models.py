@@ -1,12 +1,24 @@
+import copy
+import datetime
+import threading
 import uuid
+from contextlib import contextmanager
+
 from django.conf import settings
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.contrib.auth.hashers import make_password, check_password
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
+from . import auth, phonetic, stl, thumbs
+
+try:  # file locks are POSIX only; on Windows we fall back to the thread lock
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
 
 class Lab(models.Model):
     name = models.CharField(max_length=120, unique=True)
@@ -23,6 +35,35 @@ class Lab(models.Model):
         return self.name
 
 
+class CaseCodeSequence(models.Model):
+    """
+    Fortlaufende Fallnummer pro Jahr (C-YYYY-#####).
+    `reserve()` erhöht den Zähler atomar in der laufenden Transaktion; parallele
+    Worker bekommen dadurch nie dieselbe Nummer, und die Vergabe kostet
+    unabhängig von der Anzahl der Fälle immer eine Zeile.
+    """
+    year = models.PositiveIntegerField(primary_key=True)
+    last = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def reserve(cls, count=1, year=None):
+        """Reserve `count` consecutive case codes and return them."""
+        year = year or timezone.now().year
+        with transaction.atomic():
+            updated = cls.objects.filter(year=year).update(last=models.F("last") + count)
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(year=year, last=count)
+                except IntegrityError:  # created concurrently by another worker
+                    cls.objects.filter(year=year).update(last=models.F("last") + count)
+            last = cls.objects.filter(year=year).values_list("last", flat=True).get()
+        return [f"C-{year}-{seq:05d}" for seq in range(last - count + 1, last + 1)]
+
+    def __str__(self):
+        return f"{self.year}: {self.last}"
+
+
 class Case(models.Model):
     class Status(models.TextChoices):
         SENT_CLINIC = ("SENT_CLINIC", "Von Praxis gesendet")
@@ -60,35 +101,153 @@ class Case(models.Model):
     qr_token = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     protection_code = models.CharField(max_length=6, editable=False, blank=True, null=True)
 
+    # Phonetic lookup keys (see tracker.phonetic), kept in sync by save()
+    name_phonetic = models.CharField(max_length=120, blank=True, editable=False)
+    name_folded = models.CharField(max_length=120, blank=True, editable=False)
+
+    # Bumped on every change of the case or its events/comments/attachments;
+    # part of the fragment cache keys (tracker.pagecache)
+    revision = models.PositiveIntegerField(default=0, editable=False)
+
     # Audit
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)  # useful for listings/orders
 
-    def save(self, *args, **kwargs):
-        # Generate case code (C-YYYY-#####)
-        if not self.case_code:
-            year = timezone.now().year
-            last = (
-                Case.objects.filter(case_code__startswith=f"C-{year}-")
-                .order_by("-id")
-                .first()
-            )
-            seq = 1
-            if last:
-                try:
-                    seq = int(last.case_code.split("-")[-1]) + 1
-                except Exception:
-                    seq = last.id + 1
-            self.case_code = f"C-{year}-{seq:05d}"
+    class Meta:
+        # match the list/dashboard query shapes: filter by lab/status, newest first
+        indexes = [
+            models.Index(fields=["created_at"], name="case_created_idx"),
+            models.Index(fields=["status", "created_at"], name="case_status_created_idx"),
+            models.Index(fields=["lab", "status", "created_at"], name="case_lab_status_created_idx"),
+            models.Index(fields=["lab", "created_at"], name="case_lab_created_idx"),
+            models.Index(fields=["patient_dob"], name="case_dob_idx"),
+        ]
+
+    def set_name_keys(self):
+        """Recompute name_phonetic/name_folded; True if they changed."""
+        keys = (phonetic.phonetic_key(self.patient_name)[:120], phonetic.fold(self.patient_name)[:120])
+        changed = keys != (self.name_phonetic, self.name_folded)
+        self.name_phonetic, self.name_folded = keys
+        return changed
 
+    def save(self, *args, **kwargs):
+        names_changed = self.set_name_keys() or self._state.adding
+        if names_changed and kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "name_phonetic", "name_folded"}
         # No per-case PIN anymore (global Praxis-PIN via AppSettings)
-        super().save(*args, **kwargs)
+        if self.case_code:
+            bump = not self._state.adding
+            if bump:
+                # increment in the UPDATE itself so concurrent workers never share a revision
+                self.revision = models.F("revision") + 1
+                if kwargs.get("update_fields") is not None:
+                    kwargs["update_fields"] = {*kwargs["update_fields"], "revision"}
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                if names_changed:
+                    CaseNameKey.sync(self)
+            if bump:
+                self.refresh_from_db(fields=["revision"])
+            return
+        # Generate case code (C-YYYY-#####); number and row commit together
+        try:
+            with transaction.atomic():
+                self.case_code = CaseCodeSequence.reserve()[0]
+                super().save(*args, **kwargs)
+                CaseNameKey.sync(self)
+        except Exception:
+            self.case_code = ""  # the reservation was rolled back with the insert
+            raise
 
     def __str__(self):
         return f"{self.case_code} — {self.patient_name}"
 
 
+class CaseNameKey(models.Model):
+    """
+    Ein Eintrag pro Namensteil eines Falls (Kölner-Phonetik-Code und ASCII-Form),
+    damit die Patientensuche auch für einzelne Namensteile einen Index nutzt.
+    """
+    case = models.ForeignKey(Case, on_delete=models.CASCADE, related_name="name_keys")
+    phonetic = models.CharField(max_length=40, db_index=True)
+    folded = models.CharField(max_length=120, db_index=True)
+
+    @classmethod
+    def build(cls, case):
+        return [cls(case=case, phonetic=code[:40], folded=folded[:120])
+                for code, folded in phonetic.name_keys(case.patient_name)]
+
+    @classmethod
+    def sync(cls, case):
+        """Replace the keys of one case (after its name changed)."""
+        cls.objects.filter(case=case).delete()
+        cls.objects.bulk_create(cls.build(case))
+
+    def __str__(self):
+        return f"{self.case_id}: {self.phonetic} / {self.folded}"
+
+
+class CaseStatusCount(models.Model):
+    """
+    Denormalisierte Fallzähler pro Labor und Status.
+    Wird bei jeder Statusänderung mitgepflegt (siehe tracker.counters);
+    `manage.py rebuild_status_counts` baut die Tabelle aus Case neu auf.
+    """
+    lab = models.ForeignKey(Lab, on_delete=models.CASCADE, related_name="status_counts")
+    status = models.CharField(max_length=20, choices=Case.Status.choices)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["lab", "status"], name="uniq_status_count_lab_status"),
+        ]
+
+    def __str__(self):
+        return f"{self.lab}: {self.status} = {self.count}"
+
+
+class ChangeStamp(models.Model):
+    """
+    Monoton steigender Versionszähler pro Datenbereich (z. B. "board").
+    Caches hängen die Version an ihre Schlüssel und werden so implizit ungültig.
+    """
+    name = models.CharField(max_length=32, unique=True)
+    value = models.BigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    # stands in for a missing row: a fixed version, so ETags and cache keys stay stable
+    NEVER = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+    @classmethod
+    def current(cls, name):
+        obj = cls.objects.filter(name=name).first()
+        return obj or cls(name=name, value=0, changed_at=cls.NEVER)
+
+    @classmethod
+    def bump(cls, name):
+        updated = cls.objects.filter(name=name).update(value=models.F("value") + 1, changed_at=timezone.now())
+        if not updated:
+            cls.objects.get_or_create(name=name, defaults={"value": 1})
+
+    def __str__(self):
+        return f"{self.name} v{self.value}"
+
+
+class BoardEvent(models.Model):
+    """
+    Änderungs-Bus für Live-Boards (Server-Sent Events).
+    Schreibende Views legen hier Einträge an, der Stream in tracker.live liest sie
+    prozessübergreifend nach id aus. Alte Einträge werden laufend entfernt.
+    """
+    kind = models.CharField(max_length=20)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind}"
+
+
 class Event(models.Model):
     """
     Ereignisprotokoll für einen Fall.
@@ -114,12 +273,70 @@ class Event(models.Model):
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [models.Index(fields=["case", "created_at"], name="event_case_created_idx")]
 
     def __str__(self):
         when = self.created_at.strftime("%Y-%m-%d %H:%M")
         return f"{self.case.case_code}: {self.get_status_display()} @ {when}"
 
 
+_blob_thread_locks = [threading.Lock() for _ in range(256)]  # same stripes as the lock files
+
+
+class Blob(models.Model):
+    """
+    Inhaltsadressierte Datei (SHA-256), von beliebig vielen Anhängen geteilt.
+    `refcount` zählt die Attachment-Zeilen; fällt er auf 0, werden Zeile und
+    Datei nach dem Commit entfernt (siehe tracker.uploads).
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField()
+    size = models.BigIntegerField(default=0)
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @staticmethod
+    @contextmanager
+    def locked(sha256):
+        """
+        Serializes creating and collecting blobs of one digest across threads
+        and worker processes (256 stripes by digest prefix, one lock file per
+        stripe under CACHE_DIR). Held only for renames and the Blob row, never
+        while an upload is written.
+        """
+        with _blob_thread_locks[int(sha256[:2], 16)]:
+            if fcntl is None:
+                yield
+                return
+            lock_dir = settings.CACHE_DIR / "locks"
+            lock_dir.mkdir(parents=True, exist_ok=True)
+            with open(lock_dir / f"blob-{sha256[:2]}.lock", "a") as fh:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+
+    @classmethod
+    def collect(cls, pk):
+        """Delete an unreferenced blob and its file."""
+        blob = cls.objects.filter(pk=pk, refcount=0).first()
+        if blob is None:
+            return
+        name = blob.file.name
+        # under the lock, tracker.uploads.store() cannot reuse the file while it is being removed
+        with cls.locked(blob.sha256):
+            with transaction.atomic():
+                if not cls.objects.filter(pk=pk, refcount=0).delete()[0]:
+                    return  # referenced again meanwhile
+            blob.file.storage.delete(name)
+            thumbs.delete(name)
+            stl.delete(name)
+
+    def __str__(self):
+        return f"{self.sha256[:12]}… ({self.refcount}×)"
+
+
 class Attachment(models.Model):
     """Dateianhänge (Berichte, Fotos, STL, etc.) pro Fall."""
     case = models.ForeignKey(Case, on_delete=models.CASCADE, related_name="attachments")
@@ -138,14 +355,45 @@ class Attachment(models.Model):
         related_name="attachments",
     )
     file = models.FileField(upload_to="case_attachments/%Y/%m/")
+    # shared content (new uploads); older rows only have their own file
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name="attachments")
     label = models.CharField(max_length=120, blank=True)
+    # derived data, e.g. {"stl": {"triangles", "bbox", "size", "area", "volume"}} (tracker.stl)
+    meta = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    @property
+    def is_image(self):
+        return thumbs.is_image(self.file.name)
+
+    @property
+    def is_stl(self):
+        return stl.is_stl(self.file.name)
+
     def __str__(self):
         base = self.label or (self.file.name if self.file else "Attachment")
         return f"{self.case.case_code} — {base}"
 
 
+class UploadSession(models.Model):
+    """
+    Fortsetzbarer Upload (tus-ähnlich): Die Datei wird in Blöcken an eine
+    temporäre Datei angehängt, `offset` ist die Anzahl bereits gespeicherter
+    Bytes. Beim Abschluss wird daraus ein Anhang (siehe tracker.resumable).
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    case = models.ForeignKey(Case, on_delete=models.CASCADE, related_name="upload_sessions")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+
 class CaseComment(models.Model):
     """Conversation between clinic and lab per case."""
     case = models.ForeignKey(Case, on_delete=models.CASCADE, related_name="comments")
@@ -161,6 +409,7 @@ class CaseComment(models.Model):
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [models.Index(fields=["case", "created_at"], name="comment_case_created_idx")]
 
     def author_role(self):
         return getattr(getattr(self.author, "profile", None), "role", "") or "UNKNOWN"
@@ -189,8 +438,76 @@ def create_user_profile(sender, instance, created, **kwargs):
         UserProfile.objects.create(user=instance)
 
 
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=UserProfile)
+def forget_cached_user(sender, instance, **kwargs):
+    # password, is_active, role or lab may have changed (tracker.auth)
+    auth.forget(instance.pk if sender is User else instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Lab)
+def forget_cached_lab_users(sender, instance, **kwargs):
+    auth.forget(*UserProfile.objects.filter(lab_id=instance.pk).values_list("user_id", flat=True))
+
+
+@receiver([post_save, post_delete], sender=Event)
+@receiver([post_save, post_delete], sender=CaseComment)
+@receiver([post_save, post_delete], sender=Attachment)
+def bump_case_revision(sender, instance, **kwargs):
+    """Anything shown on the case pages changed: invalidate its cached fragments."""
+    Case.objects.filter(pk=instance.case_id).update(revision=models.F("revision") + 1)
+
+
+@receiver(post_delete, sender=Attachment)
+def release_blob(sender, instance, **kwargs):
+    if instance.blob_id:
+        Blob.objects.filter(pk=instance.blob_id, refcount__gt=0).update(refcount=models.F("refcount") - 1)
+        transaction.on_commit(lambda: Blob.collect(instance.blob_id))
+
+
+@receiver(post_save, sender=Attachment)
+def queue_previews(sender, instance, created, **kwargs):
+    # image thumbnails / STL analysis by the task worker (tracker.tasks)
+    name = instance.file.name
+    if created and thumbs.is_image(name):
+        Task.enqueue("thumbs.render", name=name)
+    elif created and stl.is_stl(name):
+        Task.enqueue("stl.process", name=name)
+
+
+@receiver(post_save, sender=Lab)
+def bump_lab_case_revisions(sender, instance, created, update_fields=None, **kwargs):
+    # the lab name is rendered on the case pages; PIN changes do not matter
+    if not created and (update_fields is None or "name" in update_fields):
+        Case.objects.filter(lab=instance).update(revision=models.F("revision") + 1)
+
+
+class PinThrottle(models.Model):
+    """
+    Token-Bucket und Fehlversuchszähler für die PIN-Prüfung (tracker.pinthrottle).
+    key z. B. "token:<qr_token>", "ip:<adresse>", "lab:<id>", "praxis", "global";
+    Zeiten als Unix-Sekunden, damit das Nachfüllen in einem UPDATE rechnen kann.
+    """
+    key = models.CharField(max_length=100, unique=True)
+    tokens = models.FloatField()
+    stamp = models.FloatField()  # last refill
+    failures = models.PositiveIntegerField(default=0)  # wrong PINs in a row
+    locked_until = models.FloatField(default=0)
+
+    def __str__(self):
+        return f"{self.key} ({self.tokens:.1f}, {self.failures} Fehlversuche)"
+
+
 class AppSettings(models.Model):
-    """Globale App-Einstellungen, inkl. Praxis-PIN (gehasht)."""
+    """
+    Globale App-Einstellungen, inkl. Praxis-PIN (gehasht).
+    Die Zeile "default" legt Migration 0021 an; `get()` liest sie einmal pro
+    Worker und prüft danach nur den ChangeStamp "appsettings", den jedes
+    save() hochzählt.
+    """
+    STAMP = "appsettings"
+    DEFAULT_PIN = "000000"
+
     name = models.CharField(max_length=32, unique=True, default="default")
     praxis_pin_hash = models.CharField(max_length=256, blank=True)
 
@@ -202,8 +519,74 @@ class AppSettings(models.Model):
 
     @classmethod
     def get(cls):
-        obj, created = cls.objects.get_or_create(name="default")
-        if created or not obj.praxis_pin_hash:
-            obj.set_praxis_pin("000000")   # default
-            obj.save()
-        return obj
+        """The settings row; one small stamp query per call, writes only to restore the default PIN."""
+        stamp = ChangeStamp.objects.filter(name=cls.STAMP).values_list("id", "value").first()
+        cached = _appsettings_cache.get("entry")
+        if cached is None or stamp is None or cached[0] != stamp:
+            obj = cls.objects.filter(name="default").first()
+            if obj is None:
+                # not migrated yet: behave like the default row without creating it
+                obj = cls(name="default")
+                obj.set_praxis_pin(cls.DEFAULT_PIN)
+            elif not obj.praxis_pin_hash:
+                # no PIN (cleared in the admin): the default PIN applies again; the save bumps the stamp
+                obj.set_praxis_pin(cls.DEFAULT_PIN)
+                obj.save(update_fields=["praxis_pin_hash"])
+                return copy.copy(obj)
+            cached = (stamp, obj)
+            if stamp is not None:
+                _appsettings_cache["entry"] = cached
+        # a copy, so callers may modify it (settings_pin) without touching the cache
+        return copy.copy(cached[1])
+
+
+_appsettings_cache = {}  # process-local: {"entry": ((stamp id, value), AppSettings)}
+
+
+@receiver([post_save, post_delete], sender=AppSettings)
+def bump_appsettings(sender, instance, **kwargs):
+    # other workers reload on their next get(); this one right away
+    ChangeStamp.bump(AppSettings.STAMP)
+    _appsettings_cache.clear()
+
+
+class Task(models.Model):
+    """
+    Hintergrundauftrag (tracker.tasks). Wird in derselben Transaktion wie die
+    auslösende Änderung angelegt und von `manage.py run_tasks` abgearbeitet;
+    Fehlschläge werden mit wachsendem Abstand wiederholt.
+    """
+    class Status(models.TextChoices):
+        QUEUED = ("QUEUED", "Wartend")
+        RUNNING = ("RUNNING", "Läuft")
+        DONE = ("DONE", "Erledigt")
+        FAILED = ("FAILED", "Fehlgeschlagen")
+
+    name = models.CharField(max_length=64)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # the worker's claim query: next due tasks in order
+            models.Index(fields=["status", "run_at"], name="task_status_run_at_idx"),
+        ]
+
+    @classmethod
+    def enqueue(cls, name, /, *, delay=0, max_attempts=5, **kwargs):
+        """Queue handler `name` (see tracker.tasks) with JSON-serialisable kwargs."""
+        return cls.objects.create(
+            name=name, kwargs=kwargs, max_attempts=max_attempts,
+            run_at=timezone.now() + datetime.timedelta(seconds=delay),
+        )
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
@@ -0,0 +1,117 @@
+"""
+Fragment-Cache für die Fallseiten (Verlauf, Nachrichten, öffentliche QR-Seite).
+
+Schlüssel: casefrag:v<FRAGMENT_VERSION>:<id>:<qr_token>:<revision>:<name>. Case.revision wird bei
+jeder Änderung am Fall, seinen Events, Kommentaren oder Anhängen in der
+Datenbank hochgezählt; ein neuer Stand ergibt damit einen neuen Schlüssel und
+alte Einträge laufen einfach aus. Es muss nichts gelöscht werden, und alle
+Worker sehen über den gemeinsamen Cache-Backend (settings.CACHES) denselben
+Stand.
+
+Treffer/Fehlschläge werden pro Fragment gezählt: lokal im Prozess und alle
+STATS_FLUSH_EVERY Zugriffe in den gemeinsamen Cache übertragen.
+"""
+import threading
+from collections import Counter
+
+from django.core.cache import cache
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .models import CaseComment
+
+FRAGMENT_TIMEOUT = 7 * 24 * 3600
+FRAGMENT_VERSION = 4  # bump when the fragment markup changes (e.g. link targets)
+STATS_FLUSH_EVERY = 50
+STATS_KEY = "casefrag:stats"
+
+# what a fragment may need from the case graph, loaded only on a miss
+GRAPH = {
+    "events": "events",
+    "comments": Prefetch(
+        "comments",
+        queryset=CaseComment.objects.select_related("author__profile").prefetch_related("attachments"),
+    ),
+}
+
+_lock = threading.Lock()
+_pending = Counter()  # not yet flushed to the shared cache
+_seen = 0
+
+
+def fragment_key(case, name):
+    # qr_token keeps keys unique even if ids are reused (fresh database, tests)
+    return f"casefrag:v{FRAGMENT_VERSION}:{case.pk}:{case.qr_token.hex}:{case.revision}:{name}"
+
+
+def load_graph(case, parts):
+    """Prefetch the given GRAPH parts for one case (skips what is already loaded)."""
+    cached = getattr(case, "_prefetched_objects_cache", {})
+    lookups = [GRAPH[p] for p in parts if p not in cached]
+    if lookups:
+        prefetch_related_objects([case], *lookups)
+
+
+def get_fragment(case, name):
+    html = cache.get(fragment_key(case, name))
+    _record(name, html is not None)
+    return html
+
+
+def set_fragment(case, name, html):
+    cache.set(fragment_key(case, name), html, FRAGMENT_TIMEOUT)
+
+
+def _record(name, hit):
+    global _seen
+    with _lock:
+        _pending[(name, "hits" if hit else "misses")] += 1
+        _seen += 1
+        if _seen < STATS_FLUSH_EVERY:
+            return
+        pending = dict(_pending)
+        _pending.clear()
+        _seen = 0
+    _flush(pending)
+
+
+def _flush(pending):
+    for (name, kind), n in pending.items():
+        key = f"{STATS_KEY}:{name}:{kind}"
+        if not cache.add(key, n, None):
+            try:
+                cache.incr(key, n)
+            except ValueError:  # expired between add() and incr()
+                cache.set(key, n, None)
+    names = cache.get(f"{STATS_KEY}:names") or []
+    new = sorted({*names, *(name for name, _ in pending)})
+    if new != names:
+        cache.set(f"{STATS_KEY}:names", new, None)
+
+
+def flush_stats():
+    global _seen
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _seen = 0
+    _flush(pending)
+
+
+def stats():
+    """{fragment: {"hits", "misses", "hit_rate"}} across all workers (after flushing this one)."""
+    flush_stats()
+    result = {}
+    for name in cache.get(f"{STATS_KEY}:names") or []:
+        hits = cache.get(f"{STATS_KEY}:{name}:hits") or 0
+        misses = cache.get(f"{STATS_KEY}:{name}:misses") or 0
+        total = hits + misses
+        result[name] = {"hits": hits, "misses": misses, "hit_rate": round(hits / total, 3) if total else None}
+    return result
+
+
+def reset_stats():
+    with _lock:
+        _pending.clear()
+    for name in cache.get(f"{STATS_KEY}:names") or []:
+        cache.delete_many([f"{STATS_KEY}:{name}:hits", f"{STATS_KEY}:{name}:misses"])
+    cache.delete(f"{STATS_KEY}:names")
@@ -0,0 +1,101 @@
+"""
+Keyset-Pagination (Cursor) für Falllisten.
+
+Sortiert wird immer nach (created_at, id) absteigend. Statt OFFSET/COUNT
+merkt sich der Cursor den Schlüssel der ersten bzw. letzten Zeile einer Seite;
+die nächste Seite ist ein Index-Range-Scan ab diesem Schlüssel und kostet auf
+Seite 1000 so viel wie auf Seite 1. Cursor sind signiert und für den Client
+undurchsichtig; ein ungültiger Cursor führt zurück auf die erste Seite.
+"""
+import datetime
+
+from django.core import signing
+
+CURSOR_SALT = "tracker.pagination.cursor"
+PER_PAGE = 25
+
+
+def encode_cursor(obj, direction):
+    """Opaque token pointing before ("p") or after ("n") obj."""
+    return signing.dumps([obj.created_at.isoformat(), obj.pk, direction], salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token):
+    """(created_at, id, direction) or None for a missing/tampered cursor."""
+    if not token:
+        return None
+    try:
+        created, pk, direction = signing.loads(token, salt=CURSOR_SALT)
+        return datetime.datetime.fromisoformat(created), int(pk), direction if direction in ("n", "p") else "n"
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, prev_cursor=None, total=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total  # approximate, may be None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+
+def paginate(qs, cursor=None, per_page=PER_PAGE, total=None):
+    """
+    One page of qs, newest first. `cursor` is a token from a previous page
+    (next_cursor/prev_cursor); `total` is passed through for display.
+    Fetches per_page + 1 rows to know whether another page exists.
+    """
+    key = decode_cursor(cursor)
+    if key is None:
+        rows = list(qs.order_by("-created_at", "-id")[:per_page + 1])
+        more, rows = len(rows) > per_page, rows[:per_page]
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor(rows[-1], "n") if more else None,
+            total=total,
+        )
+
+    created, pk, direction = key
+    if direction == "n":
+        # older than the cursor row
+        rows = list(qs.filter(created_at__lte=created)
+                      .exclude(created_at=created, id__gte=pk)
+                      .order_by("-created_at", "-id")[:per_page + 1])
+        more, rows = len(rows) > per_page, rows[:per_page]
+        if not rows:
+            return paginate(qs, None, per_page, total)
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor(rows[-1], "n") if more else None,
+            prev_cursor=encode_cursor(rows[0], "p"),
+            total=total,
+        )
+
+    # newer than the cursor row: walk upwards, then flip back to newest-first
+    rows = list(qs.filter(created_at__gte=created)
+                  .exclude(created_at=created, id__lte=pk)
+                  .order_by("created_at", "id")[:per_page + 1])
+    more, rows = len(rows) > per_page, rows[:per_page][::-1]
+    if not more:
+        # reached the newest rows: that is simply the first page
+        return paginate(qs, None, per_page, total)
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(rows[-1], "n"),
+        prev_cursor=encode_cursor(rows[0], "p"),
+        total=total,
+    )
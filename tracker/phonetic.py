@@ -0,0 +1,95 @@
+"""
+Phonetische Schlüssel für Patientennamen (Kölner Phonetik).
+
+`koelner("Müller")` und `koelner("Mueler")` ergeben beide "657"; `fold()`
+liefert die kleingeschriebene ASCII-Form ("Jürgen Groß" -> "juergen gross").
+Case speichert beides für den ganzen Namen, CaseNameKey zusätzlich pro Wort,
+damit auch die Suche nach nur einem Namensteil über einen Index läuft.
+"""
+import re
+import unicodedata
+
+UMLAUTS = {"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"}
+WORD_RE = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+
+def fold(text):
+    """Lowercase ASCII form: umlauts spelled out, other accents dropped."""
+    text = "".join(UMLAUTS.get(ch, ch) for ch in (text or "").lower())
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+def words(name):
+    """Name parts ("Müller-Lüdenscheidt, Hans" -> Müller, Lüdenscheidt, Hans)."""
+    return WORD_RE.findall(name or "")
+
+
+def _letters(word):
+    # Kölner Phonetik treats umlauts like their base vowel and ß like S
+    word = word.upper().replace("ß", "S")
+    word = unicodedata.normalize("NFKD", word).encode("ascii", "ignore").decode()
+    return re.sub(r"[^A-Z]", "", word)
+
+
+def koelner(word):
+    """Kölner Phonetik code of a single word ("" for words without letters)."""
+    w = _letters(word)
+    raw = []
+    for i, ch in enumerate(w):
+        prev = w[i - 1] if i else ""
+        nxt = w[i + 1] if i + 1 < len(w) else ""
+        if ch in "AEIJOUY":
+            code = "0"
+        elif ch == "H":
+            code = ""
+        elif ch == "B":
+            code = "1"
+        elif ch == "P":
+            code = "3" if nxt == "H" else "1"
+        elif ch in "DT":
+            code = "8" if nxt and nxt in "CSZ" else "2"
+        elif ch in "FVW":
+            code = "3"
+        elif ch in "GKQ":
+            code = "4"
+        elif ch == "C":
+            if i == 0:
+                code = "4" if nxt and nxt in "AHKLOQRUX" else "8"
+            elif prev in "SZ" or not nxt or nxt not in "AHKOQUX":
+                code = "8"
+            else:
+                code = "4"
+        elif ch == "X":
+            code = "8" if prev and prev in "CKQ" else "48"
+        elif ch == "L":
+            code = "5"
+        elif ch in "MN":
+            code = "6"
+        elif ch == "R":
+            code = "7"
+        elif ch in "SZ":
+            code = "8"
+        else:
+            code = ""
+        raw.append(code)
+
+    digits = "".join(raw)
+    collapsed = [d for i, d in enumerate(digits) if i == 0 or d != digits[i - 1]]
+    return "".join(d for i, d in enumerate(collapsed) if d != "0" or i == 0)
+
+
+def name_keys(name):
+    """[(phonetic, folded)] per name part, duplicates removed, order kept."""
+    seen, keys = set(), []
+    for word in words(name):
+        key = (koelner(word), fold(word))
+        if key[0] and key not in seen:
+            seen.add(key)
+            keys.append(key)
+    return keys
+
+
+def phonetic_key(name):
+    """Codes of all name parts, space-separated (stored on Case.name_phonetic)."""
+    return " ".join(code for code, _ in name_keys(name))
@@ -0,0 +1,176 @@
+"""
+Schutz der PIN-Prüfung auf der öffentlichen QR-Seite gegen Durchprobieren.
+
+check_password (PBKDF2) kostet bewusst viel CPU. Bevor gehasht wird, prüft
+`acquire()` ohne jede Hash-Arbeit:
+
+  1. Sperren: Token oder IP nach zu vielen Fehlversuchen in Folge gesperrt?
+  2. Token-Buckets (settings.PIN_THROTTLE_RATES), je eine Zeile in tracker_pinthrottle:
+       token:<qr_token>   pro Fall
+       ip:<adresse>       pro Client
+       lab:<id> / praxis  pro PIN (alle Fälle eines Labors teilen sich einen)
+       global             alle Prüfungen zusammen – deckelt die Hash-Last pro Zeit
+
+Abbuchen ist ein einziges bedingtes UPDATE (Nachfüllen und Prüfen im SQL),
+also über alle gunicorn-Worker hinweg atomar. Falsche PINs zählen pro Token und
+IP; ab PIN_LOCKOUT_AFTER Fehlversuchen in Folge wird der Schlüssel gesperrt,
+30 s, 60 s, 120 s … bis PIN_LOCKOUT_MAX. Eine richtige PIN setzt den Zähler
+zurück. Sperren werden nur für Token und IP gesetzt, damit ein Angreifer nicht
+das ganze Labor oder die Seite für alle sperren kann.
+
+Zähler (alle Worker, im gemeinsamen Cache): stats(), /api/security/pin-stats/.
+"""
+import math
+import random
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max, Value
+from django.db.models.functions import Least
+
+from .models import PinThrottle
+
+STATS_KEY = "pinthrottle:stats"
+COUNTERS = ("checked", "ok", "wrong", "malformed", "rejected_locked", "rejected_rate")
+LOCKABLE = ("token", "ip")
+PRUNE_PROBABILITY = 0.01
+PRUNE_AFTER = 24 * 3600
+
+# lab PINs: 6–10 letters/digits, praxis PIN: 6 digits (see forms)
+PLAUSIBLE = {"LAB": re.compile(r"^[A-Za-z0-9]{6,10}$"), "CLINIC": re.compile(r"^\d{6}$")}
+
+
+def client_ip(request):
+    value = request.META.get(settings.PIN_THROTTLE_IP_HEADER) or request.META.get("REMOTE_ADDR") or "?"
+    return value.split(",")[0].strip()[:64]
+
+
+def keys_for(token, ip, pin_scope):
+    """[(bucket, key)] for one PIN check; pin_scope is "lab:<id>" or "praxis"."""
+    return [("token", f"token:{token}"), ("ip", f"ip:{ip}"), ("pin", pin_scope), ("global", "global")]
+
+
+def plausible(code, need):
+    """Cheap format check; implausible codes are wrong without hashing."""
+    pattern = PLAUSIBLE.get(need)
+    return bool(pattern and pattern.match(code or ""))
+
+
+def _count(name, n=1):
+    key = f"{STATS_KEY}:{name}"
+    if not cache.add(key, n, None):
+        try:
+            cache.incr(key, n)
+        except ValueError:  # expired between add() and incr()
+            cache.set(key, n, None)
+
+
+def _take(key, capacity, interval, now):
+    """Take one attempt from a bucket; False if it is empty."""
+    refill = Least(Value(float(capacity)), F("tokens") + (Value(now) - F("stamp")) / Value(float(interval)))
+    if PinThrottle.objects.filter(key=key).alias(available=refill).filter(available__gte=1).update(
+            tokens=refill - 1, stamp=now):
+        return True
+    if PinThrottle.objects.filter(key=key).exists():
+        return False
+    try:
+        with transaction.atomic():
+            PinThrottle.objects.create(key=key, tokens=capacity - 1, stamp=now)
+        return True
+    except IntegrityError:  # created by another worker just now
+        return _take(key, capacity, interval, now)
+
+
+def locked_for(keys, now=None):
+    """Seconds until the token/IP lockout ends, 0 if not locked."""
+    now = now or time.time()
+    lockable = [key for bucket, key in keys if bucket in LOCKABLE]
+    until = PinThrottle.objects.filter(key__in=lockable, locked_until__gt=now).aggregate(
+        until=Max("locked_until"))["until"]
+    return math.ceil(until - now) if until else 0
+
+
+def acquire(keys):
+    """
+    Call before hashing. Returns 0 if the PIN may be checked, otherwise the
+    number of seconds the client should wait (Retry-After).
+    """
+    now = time.time()
+    if random.random() < PRUNE_PROBABILITY:
+        prune(now)
+    wait = locked_for(keys, now)
+    if wait:
+        _count("rejected_locked")
+        return wait
+    for bucket, key in keys:
+        capacity, interval = settings.PIN_THROTTLE_RATES[bucket]
+        if not _take(key, capacity, interval, now):
+            _count("rejected_rate")
+            return max(1, math.ceil(interval))
+    _count("checked")
+    return 0
+
+
+def record(keys, ok):
+    """Outcome of a PIN check: reset or count failures, lock out."""
+    lockable = [key for bucket, key in keys if bucket in LOCKABLE]
+    if ok:
+        _count("ok")
+        PinThrottle.objects.filter(key__in=lockable, failures__gt=0).update(failures=0)
+        return
+    _count("wrong")
+    now = time.time()
+    for key in lockable:
+        if not PinThrottle.objects.filter(key=key).update(failures=F("failures") + 1):
+            # malformed codes are rejected before any bucket row exists
+            PinThrottle.objects.get_or_create(key=key, defaults={"tokens": 0, "stamp": now, "failures": 1})
+    for row in PinThrottle.objects.filter(key__in=lockable, failures__gte=settings.PIN_LOCKOUT_AFTER):
+        seconds = min(settings.PIN_LOCKOUT_MAX,
+                      settings.PIN_LOCKOUT_BASE * 2 ** (row.failures - settings.PIN_LOCKOUT_AFTER))
+        PinThrottle.objects.filter(pk=row.pk).update(locked_until=now + seconds)
+
+
+def check(keys, need, code, verify):
+    """
+    Full guarded check, returns (ok, retry_after). `verify(code)` (the
+    expensive hash comparison) only runs for plausible codes that got past the
+    lockout and all buckets.
+    """
+    wait = locked_for(keys)
+    if wait:
+        _count("rejected_locked")
+        return False, wait
+    if not plausible(code, need):
+        _count("malformed")
+        record(keys, False)
+        return False, 0
+    wait = acquire(keys)
+    if wait:
+        return False, wait
+    ok = verify(code)
+    record(keys, ok)
+    return ok, 0
+
+
+def prune(now=None):
+    """Drop rows that are idle, full again and not locked (they carry no state)."""
+    now = now or time.time()
+    return PinThrottle.objects.filter(stamp__lt=now - PRUNE_AFTER, locked_until__lt=now).delete()[0]
+
+
+def stats():
+    now = time.time()
+    counters = {name: cache.get(f"{STATS_KEY}:{name}") or 0 for name in COUNTERS}
+    locked = [
+        {"key": key, "failures": failures, "seconds_left": math.ceil(until - now)}
+        for key, failures, until in PinThrottle.objects.filter(locked_until__gt=now)
+        .order_by("-locked_until").values_list("key", "failures", "locked_until")[:20]
+    ]
+    return {"counters": counters, "locked": locked, "buckets": PinThrottle.objects.count()}
+
+
+def reset_stats():
+    cache.delete_many([f"{STATS_KEY}:{name}" for name in COUNTERS])
@@ -0,0 +1,185 @@
+"""
+QR-Code-Bilder mit Cache.
+
+Der qr_token eines Falls ändert sich nie, das PNG also auch nicht. Bilder werden
+inhaltsadressiert (sha256 über Token, URL und Größe) einmal erzeugt, als Datei
+unter settings.QR_CACHE_DIR abgelegt und zusätzlich in einem kleinen
+In-Memory-LRU pro Prozess gehalten.
+"""
+import base64
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as PoolTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import qrcode
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+
+from .utils import public_token_url
+
+# size name -> qrcode box_size (pixels per module)
+QR_SIZES = {"s": 4, "m": 10, "l": 16}
+DEFAULT_SIZE = "m"
+MEMORY_ITEMS = 512
+BATCH_TIMEOUT = 60  # seconds for rendering all misses of one label sheet
+
+
+
+class QrBusy(Exception):
+    """The pool did not finish a batch in BATCH_TIMEOUT; what was done is cached, retry later."""
+
+
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+_pool = None
+
+
+def qr_key(token, url, size):
+    return hashlib.sha256(f"{token}|{url}|{size}".encode()).hexdigest()
+
+
+def _path(key):
+    return settings.QR_CACHE_DIR / key[:2] / f"{key}.png"
+
+
+def clean_size(size):
+    """Only the known size names are rendered and cached; anything else gets the default."""
+    return size if size in QR_SIZES else DEFAULT_SIZE
+
+
+def render_png(url, size=DEFAULT_SIZE):
+    img = qrcode.make(url, box_size=QR_SIZES[size])
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _remember(key, data):
+    with _memory_lock:
+        _memory[key] = data
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_ITEMS:
+            _memory.popitem(last=False)
+
+
+def store(key, data):
+    """Write a rendered PNG to the disk cache (atomically) and the memory LRU."""
+    path = _path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+    _remember(key, data)
+
+
+def lookup(key):
+    """Cached PNG bytes for key, or None."""
+    with _memory_lock:
+        data = _memory.get(key)
+        if data is not None:
+            _memory.move_to_end(key)
+            return data
+    try:
+        data = _path(key).read_bytes()
+    except FileNotFoundError:
+        return None
+    _remember(key, data)
+    return data
+
+
+def qr_png(token, size=DEFAULT_SIZE):
+    """(key, png bytes) for the public URL of a token; renders only on a cache miss."""
+    size = clean_size(size)
+    url = public_token_url(token)
+    key = qr_key(token, url, size)
+    data = lookup(key)
+    if data is None:
+        data = render_png(url, size)
+        store(key, data)
+    return key, data
+
+
+def _render_many(urls, size):
+    """
+    Render on the process pool; fall back to in-process rendering if it broke.
+    After BATCH_TIMEOUT the PNGs finished so far are returned (fewer than urls).
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+    rendered = []
+    try:
+        for data in _pool.map(render_png, urls, [size] * len(urls),
+                              chunksize=max(1, len(urls) // 16), timeout=BATCH_TIMEOUT):
+            rendered.append(data)
+    except BrokenProcessPool:
+        _pool = None
+        rendered += [render_png(url, size) for url in urls[len(rendered):]]
+    except PoolTimeout:
+        # stuck or overloaded: drop the queued work, the next batch gets a fresh pool
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+    return rendered
+
+
+def qr_pngs(tokens, size=DEFAULT_SIZE):
+    """
+    {token: png bytes} for many tokens at once. Cache misses are rendered in
+    parallel on a process pool (QR encoding is pure CPU work). Raises QrBusy
+    if the pool timed out; the images finished until then are cached.
+    """
+    size = clean_size(size)
+    result, missing = {}, {}
+    for token in tokens:
+        url = public_token_url(token)
+        key = qr_key(token, url, size)
+        data = lookup(key)
+        if data is None:
+            missing[key] = (token, url)
+        else:
+            result[token] = data
+    if not missing:
+        return result
+
+    keys = list(missing)
+    urls = [missing[k][1] for k in keys]
+    if len(urls) == 1:
+        rendered = [render_png(urls[0], size)]
+    else:
+        rendered = _render_many(urls, size)
+    for key, data in zip(keys, rendered):
+        store(key, data)
+        result[missing[key][0]] = data
+    if len(rendered) < len(urls):
+        raise QrBusy(f"{len(urls) - len(rendered)} von {len(urls)} QR-Codes nicht rechtzeitig erzeugt")
+    return result
+
+
+def data_uri(data):
+    return "data:image/png;base64," + base64.b64encode(data).decode("ascii")
+
+
+def warm(tokens, sizes=(DEFAULT_SIZE,)):
+    """Pre-generate the QR images of new cases (task "qr.warm", see tracker.tasks)."""
+    for size in sizes:
+        qr_pngs(tokens, size)
+
+
+def qr_response(request, token, size=None):
+    key, data = qr_png(token, size or DEFAULT_SIZE)
+    etag = f'"{key}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(data, content_type="image/png")
+    response["ETag"] = etag
+    # login-protected, but the image for a token never changes
+    response["Cache-Control"] = "private, max-age=31536000, immutable"
+    return response
@@ -0,0 +1,197 @@
+"""
+Fortsetzbare Uploads für große Scan-Dateien (angelehnt an tus 1.0).
+
+  POST   /cases/<pk>/uploads/       filename, size         -> 201, Location
+  HEAD   /uploads/<id>/                                    -> Upload-Offset, Upload-Length
+  PATCH  /uploads/<id>/             Upload-Offset + Bytes  -> 204, Upload-Offset
+  POST   /uploads/<id>/finish/      text (optional)        -> 201, Anhang
+  DELETE /uploads/<id>/                                    -> 204
+
+Jeder PATCH überträgt höchstens UPLOAD_CHUNK_MAX Bytes und hängt sie an
+UPLOAD_SESSION_DIR/<id>.part an; ein Request hält einen Worker also nur für
+einen Block. Bricht die Verbindung ab, fragt der Client per HEAD den Stand ab
+und macht dort weiter. Die SHA-256-Prüfsumme läuft beim Anhängen mit (pro
+Worker; was ein Worker nicht gesehen hat, liest er von der Platte nach). Beim
+Abschluss wird die Datei in die inhaltsadressierte Ablage umbenannt
+(tracker.uploads) und als Anhang an einen Kommentar gehängt; die Transaktion
+umfasst nur die Datensätze. Liegengebliebene Sitzungen räumt
+`manage.py cleanup_uploads` auf.
+"""
+import datetime
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from . import uploads
+from .models import Attachment, CaseComment, UploadSession
+
+COPY_CHUNK = 64 * 1024
+HASHERS_MAX = 64
+
+# session id -> (offset, running sha256 of the part file up to offset)
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+
+
+class UploadError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class _PartFile(File):
+    # lets FileSystemStorage move the finished part file instead of copying it
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def part_path(session):
+    return Path(settings.UPLOAD_SESSION_DIR) / f"{session.pk.hex}.part"
+
+
+def _hasher(session, offset):
+    """
+    SHA-256 of the part file up to `offset`. Chunks another worker received
+    are read back from disk, so each worker hashes every byte at most once.
+    """
+    with _hashers_lock:
+        seen, hasher = _hashers.pop(session.pk, (0, None))
+    if hasher is None or seen > offset:
+        seen, hasher = 0, hashlib.sha256()
+    if seen < offset:
+        with open(part_path(session), "rb") as f:
+            f.seek(seen)
+            while seen < offset:
+                data = f.read(min(COPY_CHUNK, offset - seen))
+                if not data:
+                    break
+                hasher.update(data)
+                seen += len(data)
+    return hasher
+
+
+def _keep_hasher(session, offset, hasher):
+    with _hashers_lock:
+        _hashers[session.pk] = (offset, hasher)
+        while len(_hashers) > HASHERS_MAX:
+            _hashers.popitem(last=False)
+
+
+def _drop_hasher(session):
+    with _hashers_lock:
+        _hashers.pop(session.pk, None)
+
+
+def create(case, user, filename, size):
+    filename = os.path.basename((filename or "").replace("\\", "/")).strip()[:255]
+    if not filename:
+        raise UploadError(400, "Dateiname fehlt.")
+    if size is None or size <= 0:
+        raise UploadError(400, "Dateigröße fehlt.")
+    if size > settings.UPLOAD_MAX_SIZE:
+        raise UploadError(413, "Datei ist zu groß.")
+    session = UploadSession.objects.create(case=case, user=user, filename=filename, size=size)
+    path = part_path(session)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+    return session
+
+
+def append(session, offset, stream, length):
+    """Write one chunk at `offset`; returns the new offset."""
+    if offset != session.offset:
+        raise UploadError(409, f"Offset {offset} passt nicht, erwartet {session.offset}.")
+    if length is None:
+        raise UploadError(411, "Content-Length fehlt.")
+    if length > settings.UPLOAD_CHUNK_MAX:
+        raise UploadError(413, f"Block größer als {settings.UPLOAD_CHUNK_MAX} Bytes.")
+    if offset + length > session.size:
+        raise UploadError(413, "Block geht über das Dateiende hinaus.")
+
+    path = part_path(session)
+    if not path.exists():
+        raise UploadError(410, "Upload ist abgelaufen.")
+    hasher = _hasher(session, offset)
+    written = 0
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        while written < length:
+            data = stream.read(min(COPY_CHUNK, length - written))
+            if not data:
+                break  # client went away; what arrived is kept
+            f.write(data)
+            hasher.update(data)
+            written += len(data)
+
+    new_offset = offset + written
+    # conditional update: a concurrent PATCH for the same offset loses
+    if not UploadSession.objects.filter(pk=session.pk, offset=offset).update(
+            offset=new_offset, updated_at=timezone.now()):
+        raise UploadError(409, "Paralleler Upload für denselben Block.")
+    session.offset = new_offset
+    _keep_hasher(session, new_offset, hasher)
+    return new_offset
+
+
+def finish(session, text=""):
+    """Turn a complete upload into an Attachment on a new comment."""
+    if session.offset != session.size:
+        raise UploadError(409, f"Upload unvollständig ({session.offset}/{session.size} Bytes).")
+    path = part_path(session)
+    if not path.exists():
+        raise UploadError(410, "Upload ist abgelaufen.")
+
+    digest = _hasher(session, session.size).hexdigest()
+    with open(path, "rb") as fh:
+        f = _PartFile(fh, name=session.filename)
+        f.sha256 = digest
+        blob = uploads.store(f)  # renames the part file into blobs/ unless the content exists
+    try:
+        with transaction.atomic():
+            if not UploadSession.objects.filter(pk=session.pk).delete()[0]:
+                raise UploadError(410, "Upload wurde bereits abgeschlossen.")
+            comment = CaseComment.objects.create(
+                case=session.case, author=session.user,
+                text=text or f"Datei hochgeladen: {session.filename}",
+            )
+            attachment = Attachment.objects.create(
+                case=session.case, blob=blob, file=blob.file.name, label=session.filename,
+                uploaded_by=session.user, comment=comment,
+            )
+    except Exception:
+        uploads.release(blob)
+        raise
+    _drop_hasher(session)
+    path.unlink(missing_ok=True)  # still there if the blob already existed
+    return attachment
+
+
+def abort(session):
+    _drop_hasher(session)
+    part_path(session).unlink(missing_ok=True)
+    session.delete()
+
+
+def cleanup(max_age):
+    """Remove sessions idle for longer than max_age and orphaned part files."""
+    cutoff = timezone.now() - max_age
+    stale = list(UploadSession.objects.filter(updated_at__lt=cutoff))
+    for session in stale:
+        abort(session)
+    orphans = 0
+    folder = Path(settings.UPLOAD_SESSION_DIR)
+    if folder.is_dir():
+        live = {s.hex for s in UploadSession.objects.values_list("pk", flat=True)}
+        for path in folder.glob("*.part"):
+            mtime = datetime.datetime.fromtimestamp(path.stat().st_mtime, tz=datetime.timezone.utc)
+            if path.stem not in live and mtime < cutoff:
+                path.unlink(missing_ok=True)
+                orphans += 1
+    return len(stale), orphans
@@ -0,0 +1,130 @@
+"""
+Volltextsuche über Fälle, Kommentare und Anhänge (SQLite FTS5).
+
+Die virtuelle Tabelle `tracker_search` enthält eine Zeile pro Fall
+(Fallnummer, Patient, Labor), pro Kommentar und pro Anhang (Beschreibung und
+Dateiname). Die rowid kodiert Quelle und ID (id * 4 + KIND_*), `case_id`
+verweist auf den Fall. Trigger aus Migration 0013 halten den Index bei jedem
+INSERT/UPDATE/DELETE synchron, auch bei bulk_create und QuerySet.update().
+
+Auf anderen Datenbanken (oder falls SQLite ohne FTS5 gebaut ist) fällt die
+Suche auf die bisherigen icontains-Filter zurück.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+KIND_CASE, KIND_COMMENT, KIND_ATTACHMENT = 0, 1, 2
+KIND_NAMES = {KIND_CASE: "case", KIND_COMMENT: "comment", KIND_ATTACHMENT: "attachment"}
+
+# column weights for bm25(): case_id, code, name, lab, text
+BM25_WEIGHTS = "0, 10.0, 6.0, 2.0, 1.0"
+SEARCH_LIMIT = 50
+
+TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+_available = None
+
+POPULATE_SQL = [
+    """
+    INSERT INTO tracker_search(rowid, case_id, code, name, lab, text)
+    SELECT c.id * 4, c.id, c.case_code, c.patient_name, l.name, ''
+    FROM tracker_case c LEFT JOIN tracker_lab l ON l.id = c.lab_id
+    """,
+    """
+    INSERT INTO tracker_search(rowid, case_id, code, name, lab, text)
+    SELECT id * 4 + 1, case_id, '', '', '', text FROM tracker_casecomment
+    """,
+    """
+    INSERT INTO tracker_search(rowid, case_id, code, name, lab, text)
+    SELECT id * 4 + 2, case_id, '', '', '',
+           label || ' ' || substr(file, length(rtrim(file, replace(file, '/', ''))) + 1)
+    FROM tracker_attachment
+    """,
+]
+
+
+def available():
+    """True if the FTS5 table exists on the default database."""
+    global _available
+    if _available is None:
+        _available = (
+            connection.vendor == "sqlite"
+            and "tracker_search" in connection.introspection.table_names()
+        )
+    return _available
+
+
+def match_expression(q):
+    """
+    User input -> FTS5 MATCH expression. Every whitespace-separated word must
+    match (AND); inside a word the tokens form a phrase whose last token is a
+    prefix, so "mül" finds "Müller" and "C-2026-001" finds "C-2026-00123".
+    """
+    phrases = []
+    for word in q.split():
+        tokens = TERM_RE.findall(word)
+        if tokens:
+            phrases.append('"%s"*' % " ".join(tokens))
+    return " ".join(phrases)
+
+
+def filter_cases(qs, q, fields=("patient_name", "case_code", "lab__name")):
+    """Restrict a Case queryset to matches for q (FTS5 or icontains fallback)."""
+    if available():
+        expr = match_expression(q)
+        if not expr:
+            return qs.none()
+        return qs.filter(pk__in=RawSQL(
+            "SELECT case_id FROM tracker_search WHERE tracker_search MATCH %s", [expr]
+        ))
+    cond = Q()
+    for field in fields:
+        cond |= Q(**{f"{field}__icontains": q})
+    return qs.filter(cond)
+
+
+def ranked(q, lab_id=None, limit=SEARCH_LIMIT):
+    """
+    Best matching cases as [(case_id, score, kind, snippet)], best first.
+    score is bm25 (lower is better); kind/snippet describe the best hit.
+    """
+    expr = match_expression(q)
+    if not expr or not available():
+        return []
+    lab_filter = "AND c.lab_id = %s" if lab_id is not None else ""
+    params = [expr] + ([lab_id] if lab_id is not None else []) + [limit]
+    # bm25()/snippet() only work in the MATCH query itself, hence the materialized CTE
+    sql = f"""
+        WITH h AS MATERIALIZED (
+            SELECT case_id,
+                   bm25(tracker_search, {BM25_WEIGHTS}) AS score,
+                   rowid %% 4 AS kind,
+                   snippet(tracker_search, -1, '', '', '…', 10) AS snippet
+            FROM tracker_search
+            WHERE tracker_search MATCH %s
+        )
+        SELECT h.case_id, MIN(h.score), h.kind, h.snippet
+        FROM h JOIN tracker_case c ON c.id = h.case_id
+        WHERE 1 {lab_filter}
+        GROUP BY h.case_id
+        ORDER BY MIN(h.score)
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(case_id, score, KIND_NAMES.get(kind, ""), snippet)
+                for case_id, score, kind, snippet in cursor.fetchall()]
+
+
+def rebuild():
+    """Refill the index from the source tables; returns the number of rows."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("DELETE FROM tracker_search")
+        for sql in POPULATE_SQL:
+            cursor.execute(sql)
+        cursor.execute("INSERT INTO tracker_search(tracker_search) VALUES ('optimize')")
+        cursor.execute("SELECT COUNT(*) FROM tracker_search")
+        return cursor.fetchone()[0]
@@ -0,0 +1,65 @@
+"""
+SQLite im Mehrprozessbetrieb (mehrere gunicorn-Worker, run_tasks).
+
+Mit SQLITE_PRODUCTION=1 (settings) gilt pro Verbindung:
+
+  journal_mode=WAL       Leser warten nie auf den Schreiber und umgekehrt
+  synchronous=NORMAL     fsync nur beim Checkpoint; in WAL trotzdem konsistent
+  busy_timeout           warten statt sofort "database is locked"
+  mmap_size, cache_size  weniger read()-Aufrufe, größerer Seitencache
+  BEGIN IMMEDIATE        Schreibtransaktionen holen die Schreibsperre gleich zu
+                         Beginn; ohne das scheitert das spätere Hochstufen einer
+                         Lesesperre sofort, ohne busy_timeout abzuwarten
+
+Verbindungen bleiben mit CONN_MAX_AGE offen (die PRAGMAs laufen nur beim
+Verbindungsaufbau). Die Schreibblöcke selbst (z. B. views._set_status) sind
+zusätzlich mit `retry_locked` dekoriert: bleibt die Datenbank länger als
+busy_timeout gesperrt, wird nur dieser Block nach kurzer Pause wiederholt;
+seine Transaktion ist da schon zurückgerollt. Ganze Views werden nicht
+wiederholt, sonst liefen Lesezugriffe und Nebenwirkungen davor (PIN-Prüfung,
+Drosselung) doppelt. Messung: `manage.py bench_sqlite`.
+"""
+import logging
+import random
+import time
+from functools import wraps
+
+from django.db import OperationalError, connection
+
+logger = logging.getLogger(__name__)
+
+RETRY_ATTEMPTS = 3
+RETRY_DELAY = 0.05  # seconds, doubled per attempt
+
+
+def is_locked(exc):
+    message = str(exc).lower()
+    return "database is locked" in message or "database table is locked" in message
+
+
+def retry_locked(func):
+    """
+    Re-run a function that opens its own write transaction when SQLite stayed
+    locked. Only for the transactional block itself: everything it does must
+    be safe to repeat after a rollback. Never retried inside a surrounding
+    transaction.
+    """
+    @wraps(func)
+    def _wrap(*a, **kw):
+        for attempt in range(1, RETRY_ATTEMPTS + 1):
+            try:
+                return func(*a, **kw)
+            except OperationalError as exc:
+                if attempt == RETRY_ATTEMPTS or not is_locked(exc) or connection.in_atomic_block:
+                    raise
+                logger.warning("Datenbank gesperrt in %s, Versuch %s wird wiederholt", func.__name__, attempt)
+                time.sleep(RETRY_DELAY * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+    return _wrap
+
+
+def pragmas(using=None):
+    """Effective settings of the current connection (bench_sqlite, diagnostics)."""
+    conn = connection if using is None else using
+    names = ("journal_mode", "synchronous", "busy_timeout", "mmap_size", "cache_size")
+    with conn.cursor() as cursor:
+        return {name: cursor.execute(f"PRAGMA {name}").fetchone()[0] for name in names}
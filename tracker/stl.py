@@ -0,0 +1,272 @@
+"""
+STL-Auswertung für Scan-Anhänge (NumPy).
+
+Binäre STL werden direkt als strukturiertes Array gelesen (50 Byte pro
+Dreieck); bei ASCII-STL bleiben nach einer Regex-Ersetzung nur die
+Koordinaten stehen, die NumPy in einem Durchgang parst. Pro Dreieck entsteht
+kein Python-Objekt. Daraus werden berechnet:
+
+  - Kennzahlen (Dreiecke, Bounding Box, Oberfläche, Volumen) -> Attachment.meta["stl"]
+  - ein vereinfachtes Netz (Vertex-Clustering)             -> <datei>.preview.stl
+  - ein Vorschaubild                                        -> <datei>.snapshot.png
+
+Die Dateien liegen neben dem Original (wie die Bildvorschauen, tracker.thumbs)
+und werden vom Task-Worker erzeugt (Auftrag "stl.process", tracker.tasks).
+NumPy wird erst in der Auswertung importiert.
+"""
+import io
+import logging
+import os
+import re
+import tempfile
+
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_TRIANGLES = 20_000
+SNAPSHOT_SIZE = 512
+# variant name (URL) -> file suffix
+ARTIFACTS = {"mesh": "preview.stl", "snapshot": "snapshot.png"}
+
+# everything except the coordinates of "vertex x y z" lines
+_NOT_VERTEX = re.compile(rb"^(?!\s*vertex\b).*$|vertex", re.MULTILINE)
+
+
+def is_stl(name):
+    return os.path.splitext(name or "")[1].lower() == ".stl"
+
+
+def artifact_name(name, variant):
+    return f"{name}.{ARTIFACTS[variant]}"
+
+
+def _binary_dtype(np):
+    return np.dtype([("normal", "<f4", (3,)), ("v", "<f4", (3, 3)), ("attr", "<u2")])
+
+
+def parse(path):
+    """Triangles of an STL file as a float32 array of shape (n, 3, 3)."""
+    import numpy as np
+
+    size = os.path.getsize(path)
+    with open(path, "rb") as fh:
+        head = fh.read(84)
+    if len(head) == 84:
+        count = int.from_bytes(head[80:84], "little")
+        # some binary files start with "solid" too; the exact size is the reliable test
+        if size == 84 + 50 * count:
+            return np.fromfile(path, dtype=_binary_dtype(np), count=count, offset=84)["v"]
+    if not head.lstrip().startswith(b"solid"):
+        raise ValueError("keine gültige STL-Datei")
+    with open(path, "rb") as fh:
+        text = _NOT_VERTEX.sub(b" ", fh.read())
+    coords = np.fromstring(text, dtype=np.float32, sep=" ")
+    if coords.size % 9:
+        raise ValueError("unvollständige Dreiecke in ASCII-STL")
+    return coords.reshape(-1, 3, 3)
+
+
+def _bounds(verts):
+    # per column: a strided min/max over axis 0 is several times slower
+    lo = [float(verts[:, k].min()) for k in range(3)]
+    hi = [float(verts[:, k].max()) for k in range(3)]
+    return lo, hi
+
+
+def _face_areas2(tris):
+    """Twice the area of every triangle (float32), and the cross products."""
+    import numpy as np
+
+    cross = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])
+    return np.sqrt(np.einsum("ij,ij->i", cross, cross)), cross
+
+
+def measure(tris):
+    import numpy as np
+
+    lo, hi = _bounds(tris.reshape(-1, 3))
+    areas2, cross = _face_areas2(tris)
+    # signed tetrahedra against the origin; only meaningful for closed meshes
+    volume6 = np.einsum("ij,ij->i", tris[:, 0], cross).sum(dtype=np.float64)
+    return {
+        "triangles": int(len(tris)),
+        "bbox": [[round(x, 3) for x in lo], [round(x, 3) for x in hi]],
+        "size": [round(h - l, 3) for l, h in zip(lo, hi)],
+        "area": round(float(areas2.sum(dtype=np.float64)) / 2, 3),
+        "volume": round(abs(float(volume6)) / 6, 3),
+    }
+
+
+DENSE_CELLS = 1 << 25  # up to this many grid cells: index via bincount instead of sorting
+
+
+def _cluster(verts, lo, cell):
+    import numpy as np
+
+    grid = ((verts - np.asarray(lo, dtype=verts.dtype)) / cell).astype(np.int64)
+    dims = [int(grid[:, k].max()) + 1 for k in range(3)]
+    keys = (grid[:, 0] * dims[1] + grid[:, 1]) * dims[2] + grid[:, 2]
+    cells = dims[0] * dims[1] * dims[2]
+    if cells <= DENSE_CELLS:
+        occupied = np.bincount(keys, minlength=cells) > 0
+        index = (np.cumsum(occupied) - 1)[keys]
+        n = int(occupied.sum())
+    else:
+        _, index = np.unique(keys, return_inverse=True)
+        n = int(index.max()) + 1
+    counts = np.bincount(index, minlength=n)[:, None]
+    centers = np.stack([np.bincount(index, weights=verts[:, k], minlength=n) for k in range(3)], axis=1) / counts
+    faces = index.reshape(-1, 3)
+    faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])]
+    # collapse duplicates (same three cells in any order), keep the first orientation
+    ordered = np.sort(faces, axis=1)
+    _, first = np.unique((ordered[:, 0] * n + ordered[:, 1]) * n + ordered[:, 2], return_index=True)
+    return centers[faces[np.sort(first)]].astype(np.float32)
+
+
+def decimate(tris, target=PREVIEW_TRIANGLES, area=None):
+    """Vertex clustering on a uniform grid, sized so that about `target` triangles remain."""
+    import numpy as np
+
+    if len(tris) <= target:
+        return tris
+    if area is None:
+        area = float(_face_areas2(tris)[0].sum(dtype=np.float64)) / 2
+    verts = tris.reshape(-1, 3)
+    lo, _ = _bounds(verts)
+    # a surface of area A covered by cells of edge c has ~A/c² vertices and ~2A/c² triangles
+    cell = max((2 * area / target) ** 0.5, 1e-6)
+    result = _cluster(verts, lo, cell)
+    for _ in range(3):
+        if len(result) <= target * 1.5:
+            break
+        cell *= (len(result) / target) ** 0.5
+        result = _cluster(verts, lo, cell)
+    return result
+
+
+def write_binary(tris, fh):
+    import numpy as np
+
+    data = np.zeros(len(tris), dtype=_binary_dtype(np))
+    data["v"] = tris
+    normals = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    data["normal"] = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+    fh.write(b"Arbeit-Tracker preview".ljust(80, b"\0"))
+    fh.write(np.uint32(len(tris)).tobytes())
+    fh.write(data.tobytes())
+
+
+def snapshot(tris, size=SNAPSHOT_SIZE):
+    """PNG bytes: shaded orthographic view (tilted occlusal view), painter's algorithm."""
+    import numpy as np
+    from PIL import Image, ImageDraw
+
+    # rotate 35° about x so the model is seen from above and slightly in front
+    a = np.radians(35)
+    rot = np.array([[1, 0, 0], [0, np.cos(a), -np.sin(a)], [0, np.sin(a), np.cos(a)]])
+    v = tris.astype(np.float64) @ rot.T
+    normals = np.cross(v[:, 1] - v[:, 0], v[:, 2] - v[:, 0])
+    lengths = np.linalg.norm(normals, axis=1)
+    light = np.abs(normals[:, 2]) / np.where(lengths > 0, lengths, 1)
+    shade = (60 + 180 * light).astype(np.uint8)
+
+    flat = v.reshape(-1, 3)
+    lo, hi = flat[:, :2].min(axis=0), flat[:, :2].max(axis=0)
+    scale = (size * 0.9) / max(float((hi - lo).max()), 1e-9)
+    offset = (size - (hi - lo) * scale) / 2
+    xy = (v[:, :, :2] - lo) * scale + offset
+    xy[:, :, 1] = size - xy[:, :, 1]  # image y grows downwards
+
+    img = Image.new("RGB", (size, size), (248, 249, 250))
+    draw = ImageDraw.Draw(img)
+    order = np.argsort(v[:, :, 2].mean(axis=1))  # far to near
+    for poly, s in zip(xy[order].round(1).tolist(), shade[order].tolist()):
+        draw.polygon([tuple(p) for p in poly], fill=(s, s, int(s * 0.92)))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", optimize=True)
+    return buf.getvalue()
+
+
+def _write_atomic(dst, write):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dst), suffix=".tmp")
+    with os.fdopen(fd, "wb") as fh:
+        write(fh)
+    os.replace(tmp, dst)
+
+
+def process(path):
+    """Analyse an STL file and write its artifacts next to it; returns the metadata."""
+    tris = parse(path)
+    if not len(tris):
+        raise ValueError("STL-Datei enthält keine Dreiecke")
+    meta = measure(tris)
+    preview = decimate(tris, area=meta["area"])
+    meta["preview_triangles"] = int(len(preview))
+    _write_atomic(artifact_name(path, "mesh"), lambda fh: write_binary(preview, fh))
+    png = snapshot(preview)
+    _write_atomic(artifact_name(path, "snapshot"), lambda fh: fh.write(png))
+    return meta
+
+
+def _process_logged(path):
+    """
+    process(), with files that will never work (no valid STL, too large)
+    recorded as {"error": ...}. OSErrors (disk full, NFS hiccup) propagate,
+    so the task runner retries them.
+    """
+    try:
+        return process(path)
+    except (ValueError, MemoryError) as e:
+        logger.warning("STL-Auswertung für %s fehlgeschlagen: %s", path, e)
+        return {"error": str(e)}
+
+
+def _save(name, meta):
+    from .models import Attachment
+
+    # every attachment sharing this file (deduplicated blob) gets the result
+    for att in Attachment.objects.filter(file=name).only("case_id", "meta"):
+        att.meta = {**att.meta, "stl": meta}
+        att.save(update_fields=["meta"])
+
+
+def process_stored(name):
+    """Task handler (tracker.tasks): analyse a stored STL and save the result on its attachments."""
+    if not is_stl(name):
+        return
+    if all(default_storage.exists(artifact_name(name, v)) for v in ARTIFACTS):
+        from .models import Attachment
+
+        # same file uploaded again (deduplicated blob): reuse the earlier result
+        known = Attachment.objects.filter(file=name, meta__has_key="stl").values_list("meta", flat=True).first()
+        if known:
+            _save(name, known["stl"])
+            return
+    _save(name, _process_logged(default_storage.path(name)))
+
+
+def ensure(attachment, variant):
+    """Storage name of an artifact ("mesh", "snapshot"), computed now if the background job has not run yet."""
+    name = attachment.file.name
+    if variant not in ARTIFACTS or not is_stl(name):
+        return None
+    target = artifact_name(name, variant)
+    if not default_storage.exists(target):
+        try:
+            meta = _process_logged(default_storage.path(name))
+        except OSError as e:
+            # nothing is stored, the next request or the task tries again
+            logger.warning("STL-Auswertung für %s derzeit nicht möglich: %s", name, e)
+            return None
+        _save(name, meta)
+        if "error" in meta:
+            return None
+    return target
+
+
+def delete(name):
+    for variant in ARTIFACTS:
+        default_storage.delete(artifact_name(name, variant))
@@ -0,0 +1,19 @@
+"""
+Einstiegspunkt der Worker-Prozesse von `run_tasks --processes`.
+
+Neue Prozesse werden gestartet (spawn, keine geerbten DB-Verbindungen) und
+importieren dieses Modul, bevor Django eingerichtet ist; es darf daher auf
+Modulebene nichts aus tracker laden.
+"""
+
+
+def init():
+    import django
+
+    django.setup()
+
+
+def execute(task_id):
+    from tracker import tasks
+
+    return tasks.execute_pooled(task_id)
@@ -0,0 +1,236 @@
+"""
+Lokale, dauerhafte Auftragswarteschlange (ohne externen Broker).
+
+Aufträge sind Zeilen in tracker_task. `Task.enqueue()` legt sie in der
+laufenden Transaktion an – wird die Änderung zurückgerollt, verschwindet auch
+der Auftrag; nach dem Commit sieht ihn der Worker sicher:
+
+    python manage.py run_tasks                     # 1 Thread
+    python manage.py run_tasks --concurrency 2 --processes
+
+Ein Worker beansprucht fällige Aufträge per bedingtem UPDATE (status QUEUED ->
+RUNNING, locked_by), mehrere Worker nehmen sich also nie denselben Auftrag.
+Fehlschläge werden mit exponentiell wachsendem Abstand wiederholt
+(`backoff()`), nach max_attempts bleibt der Auftrag als FAILED stehen. Hängt
+ein Auftrag länger als TASK_LEASE_SECONDS in RUNNING (Worker abgestürzt), wird
+er wieder eingereiht. Überblick: `stats()`, /api/tasks/stats/, run_tasks --stats.
+"""
+import datetime
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import threading
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from . import qr, stl, task_process, thumbs
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+RETRY_BASE = 10  # seconds before the first retry, doubled per attempt
+RETRY_MAX = 3600
+MAINTENANCE_EVERY = 60  # seconds between stale-lease/prune runs of a worker
+
+HANDLERS = {}
+
+
+def register(name):
+    def decorator(fn):
+        HANDLERS[name] = fn
+        return fn
+    return decorator
+
+
+def enqueue(name, /, **kwargs):
+    if name not in HANDLERS:
+        raise ValueError(f"Unbekannter Auftrag: {name}")
+    return Task.enqueue(name, **kwargs)
+
+
+def backoff(attempt):
+    delay = min(RETRY_MAX, RETRY_BASE * 2 ** max(attempt - 1, 0))
+    return delay * random.uniform(0.8, 1.2)  # spread retries of a failed batch
+
+
+# -------------------------------
+# Worker side
+# -------------------------------
+def claim(worker, limit=1):
+    """Mark up to `limit` due tasks as RUNNING for this worker; returns their ids."""
+    now = timezone.now()
+    ids = list(
+        Task.objects.filter(status=Task.Status.QUEUED, run_at__lte=now)
+        .order_by("run_at", "id").values_list("id", flat=True)[:limit]
+    )
+    if not ids:
+        return []
+    token = f"{worker}:{uuid.uuid4().hex[:8]}"
+    Task.objects.filter(id__in=ids, status=Task.Status.QUEUED).update(
+        status=Task.Status.RUNNING, locked_by=token, locked_at=now, attempts=F("attempts") + 1,
+    )
+    # another worker may have won some of them between the SELECT and the UPDATE
+    return list(Task.objects.filter(id__in=ids, locked_by=token).order_by("run_at", "id").values_list("id", flat=True))
+
+
+def execute(task_id):
+    """Run one claimed task and record the outcome; True on success."""
+    task = Task.objects.get(pk=task_id, status=Task.Status.RUNNING)
+    try:
+        handler = HANDLERS.get(task.name)
+        if handler is None:
+            raise LookupError(f"Unbekannter Auftrag: {task.name}")
+        handler(**task.kwargs)
+    except Exception:
+        _failed(task, traceback.format_exc(limit=8)[-4000:])
+        return False
+    Task.objects.filter(pk=task.pk).update(
+        status=Task.Status.DONE, finished_at=timezone.now(), locked_by="", last_error="")
+    return True
+
+
+def _failed(task, error):
+    """Retry later with backoff, or give up after max_attempts."""
+    now = timezone.now()
+    if task.attempts >= task.max_attempts:
+        Task.objects.filter(pk=task.pk).update(
+            status=Task.Status.FAILED, finished_at=now, locked_by="", last_error=error)
+        logger.error("Auftrag %s endgültig fehlgeschlagen:\n%s", task, error)
+    else:
+        Task.objects.filter(pk=task.pk).update(
+            status=Task.Status.QUEUED, locked_by="", last_error=error,
+            run_at=now + datetime.timedelta(seconds=backoff(task.attempts)))
+        logger.warning("Auftrag %s fehlgeschlagen (Versuch %s), wird wiederholt", task, task.attempts)
+
+
+def execute_pooled(task_id):
+    # pool threads/processes keep their own connection; drop it when broken or too old
+    try:
+        return execute(task_id)
+    finally:
+        close_old_connections()
+
+
+def requeue_stale(lease=None):
+    """Put tasks back whose worker stopped while running them."""
+    lease = lease or settings.TASK_LEASE_SECONDS
+    cutoff = timezone.now() - datetime.timedelta(seconds=lease)
+    return Task.objects.filter(status=Task.Status.RUNNING, locked_at__lt=cutoff).update(
+        status=Task.Status.QUEUED, locked_by="")
+
+
+def prune(keep_hours=None):
+    keep_hours = keep_hours if keep_hours is not None else settings.TASK_KEEP_DONE_HOURS
+    cutoff = timezone.now() - datetime.timedelta(hours=keep_hours)
+    return Task.objects.filter(status=Task.Status.DONE, finished_at__lt=cutoff).delete()[0]
+
+
+def work_off(limit=None, worker="inline"):
+    """Run due tasks in this thread until none are left (tests, `run_tasks --burst`)."""
+    done = 0
+    while limit is None or done < limit:
+        ids = claim(worker)
+        if not ids:
+            break
+        execute(ids[0])
+        done += 1
+    return done
+
+
+def _pool(concurrency, processes):
+    if processes:
+        return ProcessPoolExecutor(concurrency, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=task_process.init)
+    return ThreadPoolExecutor(concurrency, thread_name_prefix="task")
+
+
+def run_worker(concurrency=1, processes=False, poll=1.0, burst=False, stop=None):
+    """
+    Claim and run tasks until `stop` is set (or, with burst, until the queue is
+    empty). Threads suit I/O-bound handlers; processes (spawned, with their own
+    database connections) let CPU-bound ones such as thumbnails or STL analysis
+    use several cores.
+    """
+    stop = stop or threading.Event()
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    pool = _pool(concurrency, processes)
+    run = task_process.execute if processes else execute_pooled
+    running, processed, last_maintenance = {}, 0, None
+    try:
+        while not stop.is_set():
+            now = timezone.now()
+            if last_maintenance is None or (now - last_maintenance).total_seconds() > MAINTENANCE_EVERY:
+                requeue_stale()
+                prune()
+                last_maintenance = now
+            ids = claim(worker, concurrency - len(running)) if len(running) < concurrency else []
+            running.update({pool.submit(run, pk): pk for pk in ids})
+            if running:
+                finished, _ = wait(running, timeout=0 if ids else poll, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    pk = running.pop(future)
+                    processed += 1
+                    error = future.exception()
+                    if error is None:
+                        continue
+                    # the worker itself failed (not the handler, see execute())
+                    task = Task.objects.filter(pk=pk, status=Task.Status.RUNNING).first()
+                    if task is not None:
+                        _failed(task, f"Worker-Fehler: {error!r}")
+                    if isinstance(error, BrokenExecutor):
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        pool = _pool(concurrency, processes)
+            elif burst:
+                break
+            else:
+                stop.wait(poll)
+            close_old_connections()
+    finally:
+        pool.shutdown(wait=True)
+    return processed
+
+
+def stats():
+    now = timezone.now()
+    counts = dict(Task.objects.values_list("status").annotate(n=Count("id")).order_by())
+    due = Task.objects.filter(status=Task.Status.QUEUED, run_at__lte=now)
+    oldest = due.aggregate(oldest=Min("run_at"))["oldest"]
+    return {
+        "counts": {status: counts.get(status, 0) for status in Task.Status.values},
+        "due": due.count(),
+        "oldest_due_seconds": round((now - oldest).total_seconds(), 1) if oldest else None,
+        "queued_by_name": dict(
+            Task.objects.filter(status=Task.Status.QUEUED).values_list("name").annotate(n=Count("id")).order_by()
+        ),
+        "recent_failures": list(
+            Task.objects.filter(status=Task.Status.FAILED).order_by("-finished_at")
+            .values("id", "name", "attempts", "finished_at")[:10]
+        ),
+    }
+
+
+# -------------------------------
+# Handlers
+# -------------------------------
+@register("qr.warm")
+def warm_qr(tokens):
+    """Pre-render label QR codes (new or imported cases)."""
+    qr.warm(tokens)
+
+
+@register("thumbs.render")
+def render_thumbnails(name):
+    thumbs.render_stored(name)
+
+
+@register("stl.process")
+def process_stl(name):
+    stl.process_stored(name)
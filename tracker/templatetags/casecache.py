@@ -0,0 +1,42 @@
+"""
+{% casefragment "timeline" case "events" %} … {% endcasefragment %}
+
+Rendert den Block einmal pro Fallrevision und liefert ihn danach aus dem
+Cache. Die weiteren Argumente nennen die Teile des Fallgraphen (siehe
+tracker.pagecache.GRAPH), die nur bei einem Fehlschlag nachgeladen werden.
+Der Block darf nur vom Fall abhängen, nicht vom angemeldeten Benutzer.
+"""
+from django import template
+
+from tracker import pagecache
+
+register = template.Library()
+
+
+class CaseFragmentNode(template.Node):
+    def __init__(self, nodelist, name, case, parts):
+        self.nodelist = nodelist
+        self.name = name
+        self.case = case
+        self.parts = parts
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        case = self.case.resolve(context)
+        html = pagecache.get_fragment(case, name)
+        if html is None:
+            pagecache.load_graph(case, [p.resolve(context) for p in self.parts])
+            html = self.nodelist.render(context)
+            pagecache.set_fragment(case, name, html)
+        return html
+
+
+@register.tag
+def casefragment(parser, token):
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' braucht einen Namen und den Fall.")
+    nodelist = parser.parse(("endcasefragment",))
+    parser.delete_first_token()
+    name, case, *parts = (parser.compile_filter(b) for b in bits[1:])
+    return CaseFragmentNode(nodelist, name, case, parts)
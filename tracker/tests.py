@@ -1,3 +1,1582 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import hashlib
+import importlib.util
+import io
+import os
+import re
+import shutil
+import struct
+import tempfile
+import threading
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    board, counters, importer, live, lookup, phonetic, pinthrottle, qr, resumable, search, sqlite, stl, tasks, thumbs,
+    trusted, uploads,
+)
+from .models import (
+    AppSettings, Attachment, Blob, Case, CaseCodeSequence, CaseComment, CaseNameKey, ChangeStamp, Event, Lab,
+    PinThrottle, Task, UploadSession,
+)
+
+# Tables that grow with usage; everything touching them must be index-driven.
+HOT_TABLES = ("tracker_case", "tracker_event", "tracker_casecomment", "tracker_attachment", "tracker_casenamekey")
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class SeededTestCase(TestCase):
+    """A small clinic/lab dataset with events, comments and attachments."""
+
+    @classmethod
+    def setUpClass(cls):
+        # QR images and lock files go to a scratch directory, not BASE_DIR/cache
+        cls.cache_root = Path(tempfile.mkdtemp())
+        cls.enterClassContext(override_settings(CACHE_DIR=cls.cache_root, QR_CACHE_DIR=cls.cache_root / "qr"))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.cache_root, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.lab = Lab.objects.create(name="Alpha Dental")
+        cls.other_lab = Lab.objects.create(name="Beta Zahntechnik")
+        cls.clinic_user = User.objects.create_user("praxis", password="pw")
+        cls.lab_user = User.objects.create_user("labor", password="pw")
+        cls.lab_user.profile.role = "LAB"
+        cls.lab_user.profile.lab = cls.lab
+        cls.lab_user.profile.save()
+
+        statuses = list(Case.Status.values)
+        for i in range(120):
+            case = Case.objects.create(
+                patient_name=f"Patient {i}",
+                patient_dob=datetime.date(1960 + i % 40, 1 + i % 12, 1 + i % 28),
+                lab=cls.lab if i % 2 else cls.other_lab,
+                status=statuses[i % len(statuses)],
+                created_by=cls.clinic_user,
+            )
+            Event.objects.create(case=case, status=Case.Status.SENT_CLINIC, actor="CLINIC")
+            Event.objects.create(case=case, status=case.status, actor="LAB")
+        counters.rebuild()
+
+        cls.case = Case.objects.filter(lab=cls.lab).order_by("-created_at").first()
+        for i in range(6):
+            author = cls.clinic_user if i % 2 else cls.lab_user
+            comment = CaseComment.objects.create(case=cls.case, author=author, text=f"Nachricht {i}")
+            for j in range(2):
+                Attachment.objects.create(
+                    case=cls.case, comment=comment, uploaded_by=author,
+                    file=f"case_attachments/2025/12/scan_{i}_{j}.stl", label=f"scan_{i}_{j}.stl",
+                )
+        Task.objects.all().delete()  # STL analysis of the fixture files (which do not exist)
+
+
+class RecentApiTests(SeededTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.clinic_user)
+
+    def page(self, **params):
+        params.setdefault("draw", 1)
+        return self.client.get(reverse("dashboard_recent_api"), params).json()
+
+    def test_pages_cover_every_case_once(self):
+        ids, start = [], 0
+        while True:
+            page = self.page(start=start, length=25)
+            if not page["data"]:
+                break
+            ids += [row["id"] for row in page["data"]]
+            start += 25
+        self.assertEqual(page["recordsTotal"], Case.objects.count())
+        self.assertEqual(sorted(ids), sorted(Case.objects.values_list("id", flat=True)))
+
+    def test_ordering_and_search(self):
+        page = self.page(draw=7, length=10, **{"columns[1][data]": "patient_name", "order[0][column]": 1,
+                                               "order[0][dir]": "desc", "search[value]": "alpha labor"})
+        expected = (Case.objects.filter(lab=self.lab, status=Case.Status.RECEIVED_BY_LAB)
+                    .order_by("-patient_name", "-id"))
+        self.assertEqual(page["draw"], 7)
+        self.assertEqual(page["recordsFiltered"], expected.count())
+        self.assertLess(page["recordsFiltered"], page["recordsTotal"])
+        self.assertEqual([row["id"] for row in page["data"]], list(expected.values_list("id", flat=True)[:10]))
+
+        # unknown columns are ignored, not passed to order_by()
+        page = self.page(length=3, **{"columns[0][data]": "lab__pin_hash", "order[0][column]": 0})
+        self.assertEqual([row["id"] for row in page["data"]],
+                         list(Case.objects.order_by("-created_at", "-id").values_list("id", flat=True)[:3]))
+
+    def test_page_size_and_legacy_limit(self):
+        self.assertEqual(len(self.page(length=0)["data"]), min(Case.objects.count(), 500))
+        rows = self.client.get(reverse("dashboard_recent_api"), {"limit": 5}).json()
+        self.assertEqual([row["id"] for row in rows],
+                         list(Case.objects.order_by("-created_at").values_list("id", flat=True)[:5]))
+
+
+class StatusCounterTests(SeededTestCase):
+    def assertCountersMatch(self):
+        self.assertEqual(counters.status_counts(), counters.compute_counts())
+        for lab in (self.lab, self.other_lab):
+            self.assertEqual(counters.status_counts(lab), counters.compute_counts(lab))
+
+    def test_counters_follow_create_status_lab_change_and_delete(self):
+        self.client.force_login(self.clinic_user)
+        self.client.post(reverse("case_new"), {
+            "patient_name": "Zähler Test", "patient_dob": "1975-04-03", "lab": self.lab.pk,
+        })
+        case = Case.objects.get(patient_name="Zähler Test")
+        self.assertEqual(counters.status_counts(self.lab)["sent"],
+                         Case.objects.filter(lab=self.lab, status=Case.Status.SENT_CLINIC).count())
+        self.assertCountersMatch()
+
+        self.client.force_login(self.lab_user)
+        self.client.post(reverse("lab_case_detail", args=[case.pk]), {"action": "receive_lab"})
+        self.assertEqual(Case.objects.get(pk=case.pk).status, Case.Status.RECEIVED_BY_LAB)
+        self.assertCountersMatch()
+
+        self.client.force_login(self.clinic_user)
+        self.client.post(reverse("case_edit", args=[case.pk]), {
+            "patient_name": "Zähler Test", "patient_dob": "1975-04-03", "lab": self.other_lab.pk,
+        })
+        self.assertEqual(Case.objects.get(pk=case.pk).lab, self.other_lab)
+        self.assertCountersMatch()
+
+        self.client.post(reverse("case_delete", args=[case.pk]))
+        self.assertFalse(Case.objects.filter(pk=case.pk).exists())
+        self.assertCountersMatch()
+
+    def test_repair_command(self):
+        call_command("rebuild_status_counts", "--check", stdout=io.StringIO())
+        Case.objects.filter(pk=self.case.pk).update(status=Case.Status.RECEIVED_BY_CLINIC, lab=self.other_lab)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_status_counts", "--check", stdout=io.StringIO())
+
+        out = io.StringIO()
+        call_command("rebuild_status_counts", stdout=out)
+        self.assertIn("neu aufgebaut", out.getvalue())
+        self.assertCountersMatch()
+        call_command("rebuild_status_counts", "--check", stdout=io.StringIO())
+
+
+class BoardStreamTests(SeededTestCase):
+    def setUp(self):
+        super().setUp()
+        self.enterContext(mock.patch.object(live, "POLL_INTERVAL", 0.01))
+        self.case = Case.objects.filter(status=Case.Status.SENT_CLINIC).first()
+
+    def publish(self, status):
+        old, self.case.status = self.case.status, status
+        return live.publish_case(self.case, old, status)
+
+    def test_wsgi_and_lab_users_get_no_stream(self):
+        self.client.force_login(self.clinic_user)
+        self.assertEqual(self.client.get(reverse("board_stream")).status_code, 204)
+        self.async_client.force_login(self.lab_user)
+        self.assertEqual(async_to_sync(self.async_client.get)(reverse("board_stream")).status_code, 403)
+
+    async def test_hub_fans_out_to_all_boards(self):
+        boards = [live.stream(), live.stream()]
+        for board_stream in boards:
+            self.assertEqual(await anext(board_stream), "retry: 3000\n\n")
+        # one hub task reads the bus for the whole process, not one per board
+        self.assertEqual(len(live.hub.subscribers), 2)
+        hub_task = live.hub.task
+        await asyncio.sleep(0.05)  # hub has its starting point
+        event = await sync_to_async(self.publish)(Case.Status.RECEIVED_BY_LAB)
+        frames = [await asyncio.wait_for(anext(board_stream), 2) for board_stream in boards]
+        self.assertEqual(frames, [live.format_event(event)] * 2)
+        self.assertIn('"delta":{"sent":-1,"in_lab":1}', frames[0])
+        self.assertIs(live.hub.task, hub_task)
+
+        for board_stream in boards:
+            await board_stream.aclose()
+        self.assertEqual(live.hub.subscribers, set())
+
+    async def test_reconnect_resumes_after_last_event_id(self):
+        seen = await sync_to_async(self.publish)(Case.Status.RECEIVED_BY_LAB)
+        missed = await sync_to_async(self.publish)(Case.Status.RETURNED_BY_LAB)
+        board_stream = live.stream(last_event_id=str(seen.id))
+        try:
+            self.assertEqual(await anext(board_stream), "retry: 3000\n\n")
+            self.assertEqual(await anext(board_stream), live.format_event(missed))
+        finally:
+            await board_stream.aclose()
+
+
+class QrImageCacheTests(SeededTestCase):
+    def setUp(self):
+        super().setUp()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = Path(cache_dir.name)
+        self.enterContext(override_settings(QR_CACHE_DIR=self.cache_dir))
+        qr._memory.clear()
+        self.addCleanup(qr._memory.clear)
+        self.tokens = list(Case.objects.order_by("id").values_list("qr_token", flat=True)[:6])
+
+    def test_png_response_is_cacheable_and_conditional(self):
+        self.client.force_login(self.clinic_user)
+        case = Case.objects.get(qr_token=self.tokens[0])
+        url = reverse("case_qr_png", args=[case.pk])
+        first = self.client.get(url, {"size": "l"})
+        self.assertEqual((first.status_code, first["Content-Type"]), (200, "image/png"))
+        self.assertTrue(first.content.startswith(b"\x89PNG"))
+        self.assertEqual(first["Cache-Control"], "private, max-age=31536000, immutable")
+        key = qr.qr_key(case.qr_token, qr.public_token_url(case.qr_token), "l")
+        self.assertEqual(first["ETag"], f'"{key}"')
+
+        again = self.client.get(url, {"size": "l"}, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual((again.status_code, again.content, again["ETag"]), (304, b"", first["ETag"]))
+        self.assertNotEqual(self.client.get(url)["ETag"], first["ETag"])  # other size, other image
+
+        self.client.force_login(self.lab_user)
+        foreign = Case.objects.exclude(lab=self.lab).first()
+        self.assertEqual(self.client.get(reverse("lab_case_qr_png", args=[foreign.pk])).status_code, 404)
+
+    def test_disk_cache_is_content_addressed(self):
+        token = self.tokens[0]
+        key, data = qr.qr_png(token)
+        self.assertEqual(qr._path(key), self.cache_dir / key[:2] / f"{key}.png")
+        self.assertEqual(qr._path(key).read_bytes(), data)
+
+        qr._memory.clear()  # another worker process: served from disk, not rendered
+        with mock.patch.object(qr, "render_png") as render:
+            self.assertEqual(qr.qr_png(token), (key, data))
+        render.assert_not_called()
+        self.assertIn(key, qr._memory)
+
+        with mock.patch("tracker.qr.public_token_url", return_value="https://neu.example/t/x/"):
+            self.assertNotEqual(qr.qr_png(token)[0], key)  # a new public URL is a new image
+        self.assertEqual(len(list(self.cache_dir.rglob("*.png"))), 2)
+
+    def test_label_sheet_renders_misses_in_one_batch(self):
+        self.client.force_login(self.clinic_user)
+        cases = list(Case.objects.filter(qr_token__in=self.tokens))
+        qr.qr_png(cases[0].qr_token)  # one label already cached
+        url = reverse("label_sheet") + "?ids=" + ",".join(str(c.pk) for c in cases)
+
+        def inline(urls, size):
+            return [qr.render_png(u, size) for u in urls]
+
+        with mock.patch.object(qr, "_render_many", side_effect=inline) as batch:
+            response = self.client.get(url)
+        self.assertEqual(batch.call_count, 1)
+        self.assertEqual(len(batch.call_args.args[0]), len(cases) - 1)
+        self.assertEqual(len(response.context["labels"]), len(cases))
+        self.assertContains(response, "data:image/png;base64,", count=len(cases))
+
+        with mock.patch.object(qr, "render_png") as render, mock.patch.object(qr, "_render_many") as batch:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        render.assert_not_called()
+        batch.assert_not_called()
+
+    def test_label_sheet_filters_and_limit(self):
+        from . import views
+
+        self.client.force_login(self.clinic_user)
+        self.assertRedirects(self.client.get(reverse("label_sheet")), reverse("cases_list"),
+                             fetch_redirect_response=False)
+        self.assertEqual(self.client.get(reverse("label_sheet"), {"status": "KAPUTT"}).status_code, 404)
+
+        sent = Case.objects.filter(status=Case.Status.SENT_CLINIC).count()
+        self.enterContext(mock.patch.object(views, "LABEL_SHEET_MAX", 4))
+        self.enterContext(mock.patch.object(qr, "qr_pngs", side_effect=lambda tokens: dict.fromkeys(tokens, b"png")))
+        response = self.client.get(reverse("label_sheet"), {"status": Case.Status.SENT_CLINIC, "created": "today"})
+        self.assertGreater(sent, 4)
+        self.assertEqual(len(response.context["labels"]), 4)
+        self.assertContains(response, "nur die ersten 4 Labels")
+
+
+def reserve_in_process(path, rounds, seed, results):
+    """Forked worker for CaseCodeSequenceTests: reserve blocks on the file database at `path`."""
+    import random
+
+    from django.db import connections
+
+    # the inherited connection sits inside the test case transaction
+    db = connections["default"] = connections.create_connection("default")
+    db.settings_dict.update(NAME=path, OPTIONS={"timeout": 20})
+    rng = random.Random(seed)
+    codes = []
+    try:
+        for _ in range(rounds):
+            codes += CaseCodeSequence.reserve(rng.randint(1, 5), year=2030)
+    finally:
+        connections["default"].close()
+        results.put(codes)
+
+
+class CaseCodeSequenceTests(TestCase):
+    def test_blocks_are_consecutive_per_year(self):
+        self.assertEqual(CaseCodeSequence.reserve(3, year=2031), ["C-2031-00001", "C-2031-00002", "C-2031-00003"])
+        self.assertEqual(CaseCodeSequence.reserve(year=2031), ["C-2031-00004"])
+        self.assertEqual(CaseCodeSequence.reserve(2, year=2032), ["C-2032-00001", "C-2032-00002"])
+
+    def test_parallel_workers_never_get_the_same_code(self):
+        import multiprocessing
+        import sqlite3
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sql FROM sqlite_master WHERE name = %s", [CaseCodeSequence._meta.db_table])
+            schema = cursor.fetchone()[0]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "codes.sqlite3")
+            db = sqlite3.connect(path)
+            db.execute(schema)
+            db.execute("PRAGMA journal_mode=WAL")  # switching it needs the database to itself
+            db.close()
+
+            ctx = multiprocessing.get_context("fork")
+            results = ctx.Queue()
+            workers = [ctx.Process(target=reserve_in_process, args=(path, 40, n, results)) for n in range(4)]
+            for p in workers:
+                p.start()
+            codes = [code for _ in workers for code in results.get(timeout=60)]
+            for p in workers:
+                p.join()
+
+            db = sqlite3.connect(path)
+            last = db.execute("SELECT last FROM tracker_casecodesequence WHERE year = 2030").fetchone()[0]
+            db.close()
+        self.assertGreaterEqual(len(codes), 4 * 40)  # every worker got through
+        self.assertEqual(len(codes), len(set(codes)))
+        self.assertEqual(sorted(codes), [f"C-2030-{n:05d}" for n in range(1, last + 1)])
+
+
+class QueryPlanTests(SeededTestCase):
+    """EXPLAIN QUERY PLAN for every query the hot views issue: no table scans, no temp sorts."""
+
+    def assertIndexedQueries(self, user, url, hot=True):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        checked = 0
+        for query in ctx.captured_queries:
+            sql = query["sql"]
+            if not sql.startswith("SELECT") or not any(f'"{t}"' in sql for t in HOT_TABLES):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN QUERY PLAN " + sql)
+                details = [row[-1] for row in cursor.fetchall()]
+            for detail in details:
+                self.assertNotIn("TEMP B-TREE", detail, f"{url}: {sql}\n{details}")
+                self.assertIsNone(
+                    re.match(r"SCAN (TABLE )?(%s)\b(?! USING)" % "|".join(HOT_TABLES), detail),
+                    f"{url}: full table scan\n{sql}\n{details}",
+                )
+            checked += 1
+        if hot:
+            self.assertGreater(checked, 0, url)
+        return checked
+
+    def test_dashboard(self):
+        # counts come from CaseStatusCount, lab names via the counter table
+        self.assertEqual(self.assertIndexedQueries(self.clinic_user, reverse("dashboard"), hot=False), 0)
+
+    def test_dashboard_recent_api(self):
+        self.assertIndexedQueries(self.clinic_user, reverse("dashboard_recent_api") + "?draw=1&start=25&length=25")
+        self.assertIndexedQueries(self.clinic_user, reverse("dashboard_recent_api") + "?limit=100")
+
+    def test_cases_list(self):
+        self.assertIndexedQueries(self.clinic_user, reverse("cases_list"))
+        self.assertIndexedQueries(self.clinic_user, reverse("cases_list") + "?status=RECEIVED_BY_LAB")
+
+    def test_lab_cases_list(self):
+        self.assertIndexedQueries(self.lab_user, reverse("lab_cases"))
+        self.assertIndexedQueries(self.lab_user, reverse("lab_cases") + "?status=RETURNED_BY_LAB")
+
+    def test_case_detail(self):
+        self.assertIndexedQueries(self.clinic_user, reverse("case_detail", args=[self.case.pk]))
+
+    def test_lab_case_detail(self):
+        self.assertIndexedQueries(self.lab_user, reverse("lab_case_detail", args=[self.case.pk]))
+
+    def test_public_token(self):
+        self.assertIndexedQueries(self.clinic_user, reverse("public_token", args=[self.case.qr_token]))
+
+    def test_patient_lookup(self):
+        self.assertIndexedQueries(self.clinic_user, reverse("patient_lookup_api") + "?name=Patiend&dob=1971-02-02")
+
+    def test_label_sheet(self):
+        self.assertIndexedQueries(self.clinic_user, reverse("label_sheet") + "?status=SENT_CLINIC&created=today")
+
+
+class KeysetPaginationTests(SeededTestCase):
+    def walk(self, url, cursor_attr):
+        pages, cursor = [], None
+        while True:
+            response = self.client.get(url, {"cursor": cursor} if cursor else {})
+            page = response.context["page"]
+            pages.append([c.pk for c in page])
+            cursor = getattr(page, cursor_attr)
+            if cursor is None:
+                return pages, page
+
+    def test_forward_and_back(self):
+        self.client.force_login(self.clinic_user)
+        url = reverse("cases_list")
+        pages, last = self.walk(url, "next_cursor")
+        expected = list(Case.objects.order_by("-created_at", "-id").values_list("pk", flat=True))
+        self.assertEqual([pk for page in pages for pk in page], expected)
+        self.assertEqual(last.total, len(expected))
+
+        back, cursor = [], last.prev_cursor
+        while cursor:
+            page = self.client.get(url, {"cursor": cursor}).context["page"]
+            back.append([c.pk for c in page])
+            cursor = page.prev_cursor
+        self.assertEqual(back, pages[-2::-1])
+
+    def test_date_column_matches_sort_key(self):
+        self.client.force_login(self.clinic_user)
+        response = self.client.get(reverse("cases_list"))
+        first = next(iter(response.context["page"]))
+        self.assertContains(response, "<th>Angelegt</th>")
+        self.assertContains(response, f'data-order="{timezone.localtime(first.created_at):%Y-%m-%d %H:%M}"')
+
+    def test_filters_and_constant_cost(self):
+        self.client.force_login(self.lab_user)
+        url = reverse("lab_cases")
+        first = self.client.get(url, {"status": "SENT_CLINIC"}).context["page"]
+        self.assertTrue(all(c.lab_id == self.lab.pk and c.status == "SENT_CLINIC" for c in first))
+        with CaptureQueriesContext(connection) as page_one:
+            self.client.get(url)
+        pages, last = self.walk(url, "next_cursor")
+        self.assertGreater(len(pages), 2)
+        with CaptureQueriesContext(connection) as deep:
+            self.client.get(url, {"cursor": last.prev_cursor})
+        self.assertEqual(len(deep), len(page_one))
+        self.assertNotIn("COUNT(", " ".join(q["sql"] for q in deep if "tracker_case\"" in q["sql"]))
+
+    def test_bad_cursor_falls_back_to_first_page(self):
+        self.client.force_login(self.clinic_user)
+        page = self.client.get(reverse("cases_list"), {"cursor": "garbage"}).context["page"]
+        self.assertFalse(page.has_previous)
+        self.assertEqual(len(page), 25)
+
+
+class SearchIndexTests(SeededTestCase):
+    def search_ids(self, q):
+        return set(search.filter_cases(Case.objects.all(), q).values_list("pk", flat=True))
+
+    def test_index_follows_writes(self):
+        case = Case.objects.create(patient_name="Jürgen Überall", patient_dob=datetime.date(1970, 5, 5),
+                                   lab=self.lab, created_by=self.clinic_user)
+        self.assertEqual(self.search_ids("uber"), {case.pk})  # prefix, diacritics folded
+        self.assertIn(case.pk, self.search_ids(case.case_code[:-2]))
+
+        comment = CaseComment.objects.create(case=case, author=self.clinic_user, text="Zirkonkrone Farbe A2")
+        Attachment.objects.create(case=case, comment=comment, file="case_attachments/2026/01/Bissregistrat.stl")
+        self.assertEqual(self.search_ids("zirkon"), {case.pk})
+        self.assertEqual(self.search_ids("bissreg"), {case.pk})
+
+        Lab.objects.filter(pk=self.lab.pk).update(name="Gamma Labor")
+        self.assertIn(case.pk, self.search_ids("gamma"))
+        self.assertFalse(self.search_ids("alpha"))
+
+        case.delete()
+        self.assertFalse(self.search_ids("zirkon") | self.search_ids("uber"))
+
+    def test_triggers_exist_after_migrate(self):
+        # 0014-0018 rebuild tracker_case/tracker_attachment and restore frozen copies of these
+        search_index = importlib.import_module("tracker.migrations.0013_search_index")
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'")
+            triggers = dict(cursor.fetchall())
+        self.assertEqual(set(triggers), set(search_index.TRIGGERS))
+        for sql in search_index.CREATE[1:]:
+            name = re.search(r"CREATE TRIGGER (\w+)", sql).group(1)
+            self.assertEqual(" ".join(triggers[name].split()), " ".join(sql.split()))
+
+    def test_rebuild_matches_triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT rowid, case_id, code, name, lab, text FROM tracker_search ORDER BY rowid")
+            before = cursor.fetchall()
+            search.rebuild()
+            cursor.execute("SELECT rowid, case_id, code, name, lab, text FROM tracker_search ORDER BY rowid")
+            self.assertEqual(cursor.fetchall(), before)
+
+    def test_search_api_ranks_and_scopes(self):
+        self.client.force_login(self.clinic_user)
+        results = self.client.get(reverse("search_api"), {"q": "Patient 11"}).json()["results"]
+        self.assertEqual(results[0]["patient_name"], "Patient 11")
+        self.assertEqual(self.client.get(reverse("search_api"), {"q": "nachricht"}).json()["results"][0]["match"],
+                         "comment")
+
+        self.client.force_login(self.lab_user)
+        results = self.client.get(reverse("search_api"), {"q": "patient"}).json()["results"]
+        self.assertTrue(results)
+        self.assertEqual({r["lab"] for r in results}, {self.lab.name})
+
+
+class PatientLookupTests(SeededTestCase):
+    def setUp(self):
+        self.mueller = Case.objects.create(patient_name="Hans Müller", patient_dob=datetime.date(1961, 3, 4),
+                                           lab=self.lab, created_by=self.clinic_user)
+        self.miller = Case.objects.create(patient_name="Anna Miller", patient_dob=datetime.date(1990, 7, 1),
+                                          lab=self.other_lab, created_by=self.clinic_user)
+
+    def test_koelner_phonetik(self):
+        self.assertEqual(phonetic.koelner("Müller-Lüdenscheidt"), "65752682")
+        self.assertEqual(phonetic.koelner("Wikipedia"), "3412")
+        self.assertEqual(phonetic.koelner("Mueler"), phonetic.koelner("Müller"))
+        self.assertEqual(phonetic.fold("Jürgen Groß"), "juergen gross")
+
+    def test_misspelled_names_rank_by_dob(self):
+        hits = lookup.lookup("Mueler")
+        self.assertEqual({c.pk for c, _ in hits}, {self.mueller.pk, self.miller.pk})
+        self.assertEqual(lookup.lookup("Mueller Hans")[0][0], self.mueller)
+        self.assertEqual(lookup.lookup("Miler", dob=datetime.date(1990, 1, 7))[0][0], self.miller)
+        self.assertEqual([c for c, _ in lookup.lookup("Müller", lab=self.lab)], [self.mueller])
+
+    def test_rename_and_backfill(self):
+        self.mueller.patient_name = "Hans Schmidt"
+        self.mueller.save()
+        self.assertEqual(lookup.lookup("Schmitt")[0][0], self.mueller)
+        self.assertNotIn(self.mueller, [c for c, _ in lookup.lookup("Mueller")])
+
+        Case.objects.update(name_phonetic="", name_folded="")
+        CaseNameKey.objects.all().delete()
+        call_command("backfill_name_keys", batch_size=7, stdout=io.StringIO())
+        self.assertEqual(lookup.lookup("Schmitt")[0][0], self.mueller)
+        self.assertEqual(CaseNameKey.objects.filter(case=self.mueller).count(), 2)
+
+    def test_api_scopes_lab(self):
+        self.client.force_login(self.lab_user)
+        results = self.client.get(reverse("patient_lookup_api"), {"name": "Mueler"}).json()["results"]
+        self.assertEqual([r["id"] for r in results], [self.mueller.pk])
+
+
+class DetailQueryBudgetTests(SeededTestCase):
+    """The detail pages load the whole case graph with a fixed number of queries."""
+
+    # user + profile + lab (uncached here, see AuthQueryTests), case + lab; on a
+    # fragment cache miss additionally events, comments + authors + profiles, attachments
+    CASE_DETAIL_QUERIES = 2
+    LAB_CASE_DETAIL_QUERIES = 2
+    GRAPH_QUERIES = 3
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(override_settings(AUTH_USER_CACHE_SECONDS=0))
+
+    def add_messages(self, n):
+        for i in range(n):
+            author = self.lab_user if i % 2 else self.clinic_user
+            comment = CaseComment.objects.create(case=self.case, author=author, text=f"Mehr {i}")
+            Attachment.objects.create(case=self.case, comment=comment, uploaded_by=author,
+                                      file=f"case_attachments/2026/01/extra_{i}.pdf", label=f"extra_{i}.pdf")
+            Event.objects.create(case=self.case, status=self.case.status, actor="LAB", note=f"Notiz {i}")
+
+    def assertBudget(self, url, queries):
+        with self.assertNumQueries(queries + self.GRAPH_QUERIES):
+            self.client.get(url)
+        with self.assertNumQueries(queries):
+            self.client.get(url)
+        self.add_messages(15)
+        with self.assertNumQueries(queries + self.GRAPH_QUERIES):
+            response = self.client.get(url)
+        self.assertContains(response, "extra_14.pdf")
+        self.assertContains(response, "Notiz 14")
+
+    def test_case_detail(self):
+        self.client.force_login(self.clinic_user)
+        self.assertBudget(reverse("case_detail", args=[self.case.pk]), self.CASE_DETAIL_QUERIES)
+
+    def test_lab_case_detail(self):
+        self.client.force_login(self.lab_user)
+        self.assertBudget(reverse("lab_case_detail", args=[self.case.pk]), self.LAB_CASE_DETAIL_QUERIES)
+
+
+class FragmentCacheTests(SeededTestCase):
+    def test_revision_bumps(self):
+        self.case.refresh_from_db()
+        rev = self.case.revision
+        comment = CaseComment.objects.create(case=self.case, author=self.clinic_user, text="x")
+        Attachment.objects.create(case=self.case, comment=comment, file="case_attachments/a.pdf")
+        Event.objects.create(case=self.case, status=self.case.status, actor="LAB")
+        comment.delete()
+        self.case.refresh_from_db()
+        self.assertEqual(self.case.revision, rev + 4)
+        self.case.save(update_fields=["status"])
+        self.assertEqual(self.case.revision, rev + 5)
+        Lab.objects.get(pk=self.lab.pk).save()
+        self.case.refresh_from_db()
+        self.assertEqual(self.case.revision, rev + 6)
+
+    def test_public_page_and_stats(self):
+        url = reverse("public_token", args=[self.case.qr_token])
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        Event.objects.create(case=self.case, status=self.case.status, actor="LAB", note="Neu im Verlauf")
+        self.assertContains(self.client.get(url), "Neu im Verlauf")
+
+        self.client.force_login(self.clinic_user)
+        stats = self.client.get(reverse("cache_stats_api")).json()["fragments"]
+        self.assertEqual(stats["public_timeline"], {"hits": 1, "misses": 2, "hit_rate": 0.333})
+        self.client.post(reverse("cache_stats_api"))
+        self.assertEqual(self.client.get(reverse("cache_stats_api")).json()["fragments"], {})
+
+
+class BlobUploadTests(SeededTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.media = media.name
+        self.client.force_login(self.clinic_user)
+
+    def upload(self, case, name, content):
+        return self.client.post(reverse("case_add_comment", args=[case.pk]), {
+            "text": "Scan anbei",
+            "files": SimpleUploadedFile(name, content),
+        })
+
+    def stored_files(self):
+        return [os.path.join(d, f) for d, _, files in os.walk(self.media) for f in files]
+
+    def test_same_content_is_stored_once(self):
+        content = b"solid scan\n" * 50_000
+        other = Case.objects.exclude(pk=self.case.pk).first()
+        self.upload(self.case, "Oberkiefer.stl", content)
+        self.upload(other, "OK_kopie.stl", content)
+
+        blob = Blob.objects.get()
+        self.assertEqual(blob.sha256, hashlib.sha256(content).hexdigest())
+        self.assertEqual((blob.refcount, blob.size), (2, len(content)))
+        self.assertEqual(len(self.stored_files()), 1)
+        labels = set(Attachment.objects.filter(blob=blob).values_list("label", flat=True))
+        self.assertEqual(labels, {"Oberkiefer.stl", "OK_kopie.stl"})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Attachment.objects.filter(blob=blob, case=self.case).delete()
+        self.assertEqual(Blob.objects.get().refcount, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertEqual(self.stored_files(), [])
+
+    def test_collect_holds_blob_lock_until_file_is_gone(self):
+        content = b"scan to be collected\n" * 1000
+        blob = uploads.store(SimpleUploadedFile("alt.stl", content))
+        Blob.objects.filter(pk=blob.pk).update(refcount=0)
+        path = os.path.join(self.media, blob.file.name)
+        seen = []
+
+        def probe():
+            with Blob.locked(blob.sha256):
+                seen.append(os.path.exists(path))
+
+        def unlink_slowly(name):
+            if name != blob.file.name:
+                return  # thumbnail/STL variants
+            thread.start()
+            thread.join(0.2)
+            seen.append("still blocked" if thread.is_alive() else "ran early")
+            os.remove(path)
+
+        thread = threading.Thread(target=probe)
+        with mock.patch.object(FileSystemStorage, "delete", side_effect=unlink_slowly):
+            Blob.collect(blob.pk)
+        thread.join()
+        # a store() waiting for the lock only looks at the file after it is gone
+        self.assertEqual(seen, ["still blocked", False])
+
+    def test_store_after_collect_writes_the_file_again(self):
+        content = b"re-uploaded scan\n" * 1000
+        blob = uploads.store(SimpleUploadedFile("alt.stl", content))
+        Blob.objects.filter(pk=blob.pk).update(refcount=0)
+        Blob.collect(blob.pk)
+        self.assertEqual(self.stored_files(), [])
+
+        again = uploads.store(SimpleUploadedFile("neu.stl", content))
+        self.assertEqual((again.sha256, again.refcount), (blob.sha256, 1))
+        with again.file.open("rb") as f:
+            self.assertEqual(f.read(), content)
+
+    def test_store_writes_the_file_outside_the_blob_lock(self):
+        content = b"large scan\n" * 1000
+        digest = hashlib.sha256(content).hexdigest()
+        save, acquired = FileSystemStorage.save, []
+
+        def probe():
+            with Blob.locked(digest):
+                acquired.append(digest)
+
+        def save_while_probing(storage, name, content, **kwargs):
+            thread = threading.Thread(target=probe)
+            thread.start()
+            thread.join(5)
+            return save(storage, name, content, **kwargs)
+
+        with mock.patch.object(FileSystemStorage, "save", autospec=True, side_effect=save_while_probing):
+            blob = uploads.store(SimpleUploadedFile("gross.stl", content))
+        # another upload of the same content got the lock while this one was writing
+        self.assertEqual(acquired, [digest])
+        self.assertEqual(self.stored_files(), [os.path.join(self.media, blob.file.name)])
+        with blob.file.open("rb") as f:
+            self.assertEqual(f.read(), content)
+
+    def test_dedupe_command_moves_legacy_files_and_their_previews(self):
+        content = b"legacy scan\n" * 1000
+        legacy = []
+        for name in ("alt/foto.jpg", "alt/kopie.jpg", "alt/scan.stl"):
+            default_storage.save(name, ContentFile(content))
+            for derived in [thumbs.variant_name(name, v) for v in thumbs.VARIANTS] + \
+                           [stl.artifact_name(name, v) for v in stl.ARTIFACTS]:
+                default_storage.save(derived, ContentFile(b"preview"))
+            legacy.append(Attachment.objects.create(case=self.case, file=name, label=os.path.basename(name)))
+
+        call_command("dedupe_attachments", stdout=io.StringIO())
+        blob = Blob.objects.get()
+        self.assertEqual(blob.refcount, 3)
+        self.assertEqual({a.file.name for a in Attachment.objects.filter(pk__in=[a.pk for a in legacy])},
+                         {blob.file.name})
+        # nothing of the old files is left behind, previews included
+        self.assertEqual(self.stored_files(), [os.path.join(self.media, blob.file.name)])
+
+    def test_handler_hashes_while_streaming(self):
+        self.upload(self.case, "bericht.pdf", b"%PDF-1.4 " + os.urandom(200_000))
+        att = Attachment.objects.filter(case=self.case, blob__isnull=False).get()
+        with att.file.open("rb") as f:
+            self.assertEqual(hashlib.sha256(f.read()).hexdigest(), att.blob.sha256)
+        self.assertTrue(att.file.name.startswith(f"blobs/{att.blob.sha256[:2]}/"))
+
+
+class ResumableUploadTests(SeededTestCase):
+    def setUp(self):
+        super().setUp()
+        for name in ("MEDIA_ROOT", "UPLOAD_SESSION_DIR"):
+            folder = tempfile.TemporaryDirectory()
+            self.addCleanup(folder.cleanup)
+            self.enterContext(override_settings(**{name: folder.name}))
+        self.enterContext(override_settings(UPLOAD_CHUNK_MAX=64 * 1024))
+        self.client.force_login(self.lab_user)
+        self.content = os.urandom(150_000)
+
+    def create(self):
+        r = self.client.post(reverse("upload_create", args=[self.case.pk]),
+                             {"filename": "Unterkiefer.stl", "size": len(self.content)})
+        self.assertEqual(r.status_code, 201)
+        return r["Location"]
+
+    def patch(self, url, offset, data):
+        return self.client.generic("PATCH", url, data, content_type="application/offset+octet-stream",
+                                   HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_resume_after_interruption(self):
+        url = self.create()
+        r = self.patch(url, 0, self.content[:60_000])
+        self.assertEqual((r.status_code, r["Upload-Offset"]), (204, "60000"))
+        # a retried chunk with a stale offset is refused, HEAD tells where to go on
+        self.assertEqual(self.patch(url, 0, self.content[:60_000]).status_code, 409)
+        self.assertEqual(self.client.head(url)["Upload-Offset"], "60000")
+        self.assertEqual(self.patch(url, 60_000, self.content[60_000:]).status_code, 413)  # > chunk max
+        self.patch(url, 60_000, self.content[60_000:120_000])
+        self.patch(url, 120_000, self.content[120_000:])
+
+        r = self.client.post(url + "finish/", {"text": "UK-Scan"})
+        self.assertEqual(r.status_code, 201)
+        att = Attachment.objects.get(pk=r.json()["attachment_id"])
+        self.assertEqual((att.label, att.comment.text, att.case_id), ("Unterkiefer.stl", "UK-Scan", self.case.pk))
+        self.assertEqual(att.blob.sha256, hashlib.sha256(self.content).hexdigest())
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(settings.UPLOAD_SESSION_DIR), [])
+
+    def test_digest_runs_along_and_part_file_is_moved(self):
+        url = self.create()
+        session = UploadSession.objects.get()
+        self.patch(url, 0, self.content[:60_000])
+        resumable._hashers.clear()  # next chunk lands on a worker that has not seen the first one
+        self.patch(url, 60_000, self.content[60_000:120_000])
+        self.patch(url, 120_000, self.content[120_000:])
+        self.assertEqual(resumable._hashers[session.pk][0], len(self.content))
+        inode = resumable.part_path(session).stat().st_ino
+        session.refresh_from_db()
+
+        with mock.patch("hashlib.sha256", side_effect=AssertionError("re-hashed")):
+            blob = resumable.finish(session).blob
+        self.assertEqual(blob.sha256, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(os.stat(blob.file.path).st_ino, inode)  # renamed, not copied
+        self.assertNotIn(session.pk, resumable._hashers)
+
+    def test_failed_finish_gives_the_blob_back(self):
+        url = self.create()
+        self.patch(url, 0, self.content[:60_000])
+        self.patch(url, 60_000, self.content[60_000:120_000])
+        self.patch(url, 120_000, self.content[120_000:])
+        with mock.patch.object(Attachment.objects, "create", side_effect=RuntimeError("db")):
+            with self.assertRaises(RuntimeError):
+                resumable.finish(UploadSession.objects.get())
+        self.assertFalse(Blob.objects.exists())
+        self.assertTrue(UploadSession.objects.exists())
+
+    def test_incomplete_upload_cannot_finish_and_other_users_are_locked_out(self):
+        url = self.create()
+        self.patch(url, 0, self.content[:1000])
+        self.assertEqual(self.client.post(url + "finish/").status_code, 409)
+        self.client.force_login(self.clinic_user)
+        self.assertEqual(self.client.head(url).status_code, 404)
+
+    def test_cleanup_removes_stale_sessions(self):
+        self.create()
+        UploadSession.objects.update(updated_at=timezone.now() - datetime.timedelta(days=2))
+        call_command("cleanup_uploads", stdout=io.StringIO())
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(settings.UPLOAD_SESSION_DIR), [])
+
+
+class AttachmentDownloadTests(SeededTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.content = os.urandom(100_000)
+        self.attachment = uploads.attach(self.case, SimpleUploadedFile("Oberkiefer.stl", self.content))
+        self.url = reverse("attachment_download", args=[self.attachment.pk])
+        self.client.force_login(self.lab_user)
+
+    def get(self, **headers):
+        r = self.client.get(self.url, **headers)
+        body = b"".join(r.streaming_content) if r.streaming else r.content
+        r.close()
+        return r, body
+
+    def test_full_download_and_conditional_get(self):
+        r, body = self.get()
+        self.assertEqual((r.status_code, body), (200, self.content))
+        self.assertEqual(r["ETag"], f'"{self.attachment.blob.sha256}"')
+        self.assertEqual(r["Accept-Ranges"], "bytes")
+        self.assertIn('filename="Oberkiefer.stl"', r["Content-Disposition"])
+        r, body = self.get(HTTP_IF_NONE_MATCH=r["ETag"])
+        self.assertEqual((r.status_code, body), (304, b""))
+
+    def test_ranges(self):
+        r, body = self.get(HTTP_RANGE="bytes=60000-")
+        self.assertEqual((r.status_code, r["Content-Range"]), (206, "bytes 60000-99999/100000"))
+        self.assertEqual(body, self.content[60000:])
+        r, body = self.get(HTTP_RANGE="bytes=10-19")
+        self.assertEqual((r.status_code, r["Content-Length"], body), (206, "10", self.content[10:20]))
+        r, body = self.get(HTTP_RANGE="bytes=-5")
+        self.assertEqual(body, self.content[-5:])
+        r, _ = self.get(HTTP_RANGE="bytes=200000-")
+        self.assertEqual((r.status_code, r["Content-Range"]), (416, "bytes */100000"))
+        # outdated If-Range: the whole (new) file instead of a partial one
+        r, body = self.get(HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE='"stale"')
+        self.assertEqual((r.status_code, len(body)), (200, len(self.content)))
+
+    def test_permissions(self):
+        foreign = Case.objects.exclude(lab=self.case.lab).first()
+        other = uploads.attach(foreign, SimpleUploadedFile("fremd.pdf", b"%PDF"))
+        self.assertEqual(self.client.get(reverse("attachment_download", args=[other.pk])).status_code, 403)
+        self.client.force_login(self.clinic_user)
+        self.assertEqual(self.get()[0].status_code, 200)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_only_images_and_pdfs_are_shown_inline(self):
+        for name, inline in (("foto.png", True), ("befund.pdf", True), ("seite.html", False), ("bild.svg", False)):
+            att = uploads.attach(self.case, SimpleUploadedFile(name, b"<script>alert(1)</script>"))
+            r = self.client.get(reverse("attachment_download", args=[att.pk]))
+            self.assertEqual(r["Content-Disposition"].startswith("inline"), inline, name)
+            self.assertEqual(r["X-Content-Type-Options"], "nosniff")
+            self.assertEqual(r["Content-Security-Policy"], "sandbox")
+            r.close()
+        r = self.client.get(reverse("attachment_download", args=[att.pk]), {"download": 1})
+        self.assertTrue(r["Content-Disposition"].startswith("attachment"))
+        r.close()
+
+    @override_settings(SENDFILE_BACKEND="nginx", SENDFILE_URL_PREFIX="/protected/")
+    def test_accel_redirect(self):
+        r, body = self.get(HTTP_RANGE="bytes=10-19")
+        self.assertEqual((r.status_code, body), (200, b""))
+        self.assertEqual(r["X-Accel-Redirect"], "/protected/" + self.attachment.file.name)
+
+
+class ThumbnailTests(SeededTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.client.force_login(self.clinic_user)
+
+    def photo(self, name="foto.jpg", size=(3000, 2000)):
+        from PIL import Image
+        buf = io.BytesIO()
+        Image.new("RGB", size, (200, 120, 40)).save(buf, format="JPEG", quality=95)
+        return SimpleUploadedFile(name, buf.getvalue())
+
+    def test_variants_are_generated_by_the_task_worker(self):
+        from PIL import Image
+        att = uploads.attach(self.case, self.photo())
+        self.assertEqual(tasks.work_off(), 1)
+        for variant, edge in thumbs.VARIANTS.items():
+            path = os.path.join(settings.MEDIA_ROOT, thumbs.variant_name(att.file.name, variant))
+            with Image.open(path) as img:
+                self.assertEqual((img.format, max(img.size)), ("WEBP", edge))
+
+        r = self.client.get(reverse("attachment_preview", args=[att.pk, "thumb"]))
+        self.assertEqual((r.status_code, r["Content-Type"]), (200, "image/webp"))
+        self.assertLess(int(r["Content-Length"]), att.blob.size // 5)
+        r.close()
+
+    def test_transient_io_errors_are_retried_broken_images_are_not(self):
+        att = uploads.attach(self.case, self.photo())
+        with mock.patch("tracker.thumbs.render", side_effect=OSError(28, "No space left on device")), \
+                self.assertLogs("tracker.tasks", "WARNING"):
+            tasks.work_off()
+        task = Task.objects.get(name="thumbs.render")
+        self.assertEqual((task.status, task.attempts), (Task.Status.QUEUED, 1))
+        self.assertTrue(thumbs.missing(att.file.name))
+
+        Task.objects.update(run_at=timezone.now())
+        broken = uploads.attach(self.case, SimpleUploadedFile("kaputt.jpg", b"no jpeg at all"))
+        with self.assertLogs("tracker.thumbs", "WARNING"):
+            self.assertEqual(tasks.work_off(), 2)
+        self.assertFalse(thumbs.missing(att.file.name))
+        self.assertEqual(set(Task.objects.values_list("status", flat=True)), {Task.Status.DONE})
+        with self.assertLogs("tracker.thumbs", "WARNING"):
+            r = self.client.get(reverse("attachment_preview", args=[broken.pk, "thumb"]))
+        self.assertEqual(r.status_code, 404)
+
+    def test_chat_lazy_loads_thumbnails_and_blob_cleanup_removes_them(self):
+        comment = self.case.comments.first()
+        att = uploads.attach(self.case, self.photo("OK_frontal.png"), comment=comment)
+        html = self.client.get(reverse("case_detail", args=[self.case.pk])).content.decode()
+        thumb = reverse("attachment_preview", args=[att.pk, "thumb"])
+        self.assertRegex(html, rf'<img src="{re.escape(thumb)}" loading="lazy"')
+
+        # rendered on first request when the background job has not run
+        r = self.client.get(reverse("attachment_preview", args=[att.pk, "preview"]))
+        self.assertEqual(r.status_code, 200)
+        r.close()
+        self.assertEqual(self.client.get(reverse("attachment_preview", args=[att.pk, "huge"])).status_code, 404)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            att.delete()
+        self.assertEqual([f for _, _, files in os.walk(settings.MEDIA_ROOT) for f in files], [])
+
+
+def cube_triangles():
+    """Unit cube as 12 outward-facing triangles."""
+    quads = [
+        [(0, 0, 0), (0, 1, 0), (1, 1, 0), (1, 0, 0)], [(0, 0, 1), (1, 0, 1), (1, 1, 1), (0, 1, 1)],
+        [(0, 0, 0), (1, 0, 0), (1, 0, 1), (0, 0, 1)], [(0, 1, 0), (0, 1, 1), (1, 1, 1), (1, 1, 0)],
+        [(0, 0, 0), (0, 0, 1), (0, 1, 1), (0, 1, 0)], [(1, 0, 0), (1, 1, 0), (1, 1, 1), (1, 0, 1)],
+    ]
+    return [tri for a, b, c, d in quads for tri in ((a, b, c), (a, c, d))]
+
+
+def binary_stl(triangles):
+    body = b"".join(struct.pack("<12fH", 0, 0, 0, *(x for v in t for x in v), 0) for t in triangles)
+    return b"solid but binary".ljust(80, b" ") + struct.pack("<I", len(triangles)) + body
+
+
+def ascii_stl(triangles):
+    facets = "".join(
+        "facet normal 0 0 0\n outer loop\n" + "".join("  vertex %g %g %g\n" % v for v in t) + " endloop\nendfacet\n"
+        for t in triangles
+    )
+    return f"solid cube\n{facets}endsolid cube\n".encode()
+
+
+@skipUnless(importlib.util.find_spec("numpy"), "numpy not installed")
+class StlPipelineTests(SeededTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.client.force_login(self.lab_user)
+
+    def test_binary_and_ascii_give_the_same_measurements(self):
+        results = []
+        for content in (binary_stl(cube_triangles()), ascii_stl(cube_triangles())):
+            path = os.path.join(settings.MEDIA_ROOT, "cube.stl")
+            with open(path, "wb") as fh:
+                fh.write(content)
+            results.append(stl.measure(stl.parse(path)))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0]["triangles"], 12)
+        self.assertEqual((results[0]["area"], results[0]["volume"], results[0]["size"]), (6.0, 1.0, [1.0, 1.0, 1.0]))
+
+    def test_decimate_reduces_to_about_the_target(self):
+        import numpy as np
+
+        n = 120
+        x, y = np.meshgrid(np.linspace(0, 30, n), np.linspace(0, 20, n))
+        v = np.stack([x, y, np.sin(x / 3) * 2], axis=-1).astype(np.float32)
+        a, b, c, d = v[:-1, :-1], v[1:, :-1], v[1:, 1:], v[:-1, 1:]
+        tris = np.concatenate([np.stack([a, b, c], 2).reshape(-1, 3, 3), np.stack([a, c, d], 2).reshape(-1, 3, 3)])
+        preview = stl.decimate(tris, target=2000)
+        self.assertTrue(500 < len(preview) <= 3000, len(preview))
+        # clustering pulls the open border inwards a little
+        self.assertLess(abs(stl.measure(preview)["area"] / stl.measure(tris)["area"] - 1), 0.1)
+
+    def test_upload_stores_metadata_and_artifacts(self):
+        comment = self.case.comments.first()
+        att = uploads.attach(self.case, SimpleUploadedFile("Stumpf.stl", binary_stl(cube_triangles())), comment=comment)
+        tasks.work_off()
+        att.refresh_from_db()
+        self.assertEqual(att.meta["stl"]["triangles"], 12)
+
+        r = self.client.get(reverse("attachment_preview", args=[att.pk, "snapshot"]))
+        self.assertEqual((r.status_code, r["Content-Type"]), (200, "image/png"))
+        r.close()
+        r = self.client.get(reverse("attachment_preview", args=[att.pk, "mesh"]) + "?download=1")
+        self.assertIn('attachment; filename="Stumpf.preview.stl"', r["Content-Disposition"])
+        r.close()
+        html = self.client.get(reverse("lab_case_detail", args=[self.case.pk])).content.decode()
+        self.assertIn("12 Dreiecke · 1,0 × 1,0 × 1,0 mm", html)
+
+        # the same file again: deduplicated, the earlier result is reused
+        again = uploads.attach(self.case, SimpleUploadedFile("Kopie.stl", binary_stl(cube_triangles())))
+        tasks.work_off()
+        again.refresh_from_db()
+        self.assertEqual(again.meta, att.meta)
+
+    def test_transient_io_errors_are_retried_invalid_files_are_not(self):
+        att = uploads.attach(self.case, SimpleUploadedFile("Stumpf.stl", binary_stl(cube_triangles())))
+        with mock.patch("tracker.stl.parse", side_effect=OSError(28, "No space left on device")), \
+                self.assertLogs("tracker.tasks", "WARNING"):
+            tasks.work_off()
+        task = Task.objects.get(name="stl.process")
+        self.assertEqual((task.status, task.attempts), (Task.Status.QUEUED, 1))
+        att.refresh_from_db()
+        self.assertNotIn("stl", att.meta)
+        with mock.patch("tracker.stl.parse", side_effect=OSError(5, "Input/output error")), \
+                self.assertLogs("tracker.stl", "WARNING"):
+            r = self.client.get(reverse("attachment_preview", args=[att.pk, "snapshot"]))
+        self.assertEqual(r.status_code, 404)
+
+        Task.objects.update(run_at=timezone.now())
+        broken = uploads.attach(self.case, SimpleUploadedFile("kaputt.stl", b"solid nothing"))
+        with self.assertLogs("tracker.stl", "WARNING"):
+            self.assertEqual(tasks.work_off(), 2)
+        self.assertEqual(set(Task.objects.values_list("status", flat=True)), {Task.Status.DONE})
+        att.refresh_from_db()
+        broken.refresh_from_db()
+        self.assertEqual(att.meta["stl"]["triangles"], 12)
+        self.assertIn("error", broken.meta["stl"])
+
+
+class TaskQueueTests(SeededTestCase):
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+
+        def flaky(n):
+            self.calls.append(n)
+            if len(self.calls) < 3:
+                raise RuntimeError("kurz nicht erreichbar")
+
+        tasks.register("test.flaky")(flaky)
+        self.addCleanup(tasks.HANDLERS.pop, "test.flaky")
+
+    def make_due(self):
+        Task.objects.filter(status=Task.Status.QUEUED).update(run_at=timezone.now())
+
+    def test_retries_with_backoff_then_succeeds(self):
+        task = tasks.enqueue("test.flaky", n=7)
+        with self.assertLogs("tracker.tasks", "WARNING"):
+            self.assertEqual(tasks.work_off(), 1)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.Status.QUEUED, 1))
+        self.assertIn("kurz nicht erreichbar", task.last_error)
+        self.assertGreater(task.run_at, timezone.now() + datetime.timedelta(seconds=5))
+        self.assertEqual(tasks.work_off(), 0)  # not due yet
+
+        self.make_due()
+        with self.assertLogs("tracker.tasks", "WARNING"):
+            tasks.work_off()
+        self.make_due()
+        tasks.work_off()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts, self.calls), (Task.Status.DONE, 3, [7, 7, 7]))
+
+    def test_gives_up_after_max_attempts_and_reports_it(self):
+        task = Task.enqueue("test.flaky", n=1, max_attempts=2)
+        with self.assertLogs("tracker.tasks", "WARNING") as logs:
+            tasks.work_off()
+            self.make_due()
+            tasks.work_off()
+        self.assertIn("endgültig", logs.output[-1])
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.Status.FAILED)
+        stats = tasks.stats()
+        self.assertEqual(stats["counts"]["FAILED"], 1)
+        self.assertEqual(stats["recent_failures"][0]["id"], task.pk)
+
+    def test_claims_are_exclusive_and_stale_leases_return(self):
+        for n in range(3):
+            tasks.enqueue("test.flaky", n=n)
+        first = tasks.claim("a", limit=2)
+        second = tasks.claim("b", limit=2)
+        self.assertEqual((len(first), len(second)), (2, 1))
+        self.assertFalse(set(first) & set(second))
+        self.assertEqual(tasks.claim("c", limit=5), [])
+
+        Task.objects.filter(pk__in=first).update(locked_at=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(tasks.requeue_stale(lease=60), 2)
+        self.assertEqual(tasks.stats()["due"], 2)
+
+    def test_rolled_back_work_leaves_no_task(self):
+        from django.db import transaction
+        try:
+            with transaction.atomic():
+                tasks.enqueue("test.flaky", n=1)
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertFalse(Task.objects.exists())
+        with self.assertRaises(ValueError):
+            tasks.enqueue("gibt.es.nicht")
+
+    def test_new_case_queues_qr_rendering(self):
+        qr._memory.clear()
+        self.addCleanup(qr._memory.clear)
+        self.client.force_login(self.clinic_user)
+        self.client.post(reverse("case_new"), {
+            "patient_name": "Queue Test", "patient_dob": "1980-01-01", "lab": self.lab.pk,
+        })
+        case = Case.objects.get(patient_name="Queue Test")
+        task = Task.objects.get(name="qr.warm")
+        self.assertEqual(task.kwargs, {"tokens": [str(case.qr_token)]})
+        self.assertEqual(tasks.work_off(), 1)
+        key = qr.qr_key(case.qr_token, qr.public_token_url(case.qr_token), qr.DEFAULT_SIZE)
+        # rendered by the worker into the class's scratch directory (see SeededTestCase)
+        self.assertTrue(qr._path(key).is_relative_to(self.cache_root))
+        self.assertTrue(qr._path(key).is_file())
+        self.client.force_login(self.clinic_user)
+        self.assertEqual(self.client.get(reverse("task_stats_api")).json()["counts"]["DONE"], 1)
+
+
+@override_settings(PIN_THROTTLE_RATES={"token": (10, 60), "ip": (20, 30), "pin": (30, 10), "global": (3, 60)})
+class PinThrottleTests(SeededTestCase):
+    """Lockout, buckets and format checks run before check_password (PBKDF2)."""
+
+    def setUp(self):
+        super().setUp()
+        self.lab.set_pin("abc123")
+        self.lab.save()
+        self.sent = Case.objects.filter(lab=self.lab).first()
+        Case.objects.filter(pk=self.sent.pk).update(status=Case.Status.SENT_CLINIC)
+        self.url = reverse("public_token", args=[self.sent.qr_token])
+
+    def attempt(self, code, ip="10.0.0.1", url=None):
+        return self.client.post(url or self.url, {"action": "receive_lab", "code": code}, REMOTE_ADDR=ip)
+
+    @override_settings(PIN_THROTTLE_RATES={"token": (10, 60), "ip": (20, 30), "pin": (30, 10), "global": (20, 1)})
+    def test_lockout_stops_hashing(self):
+        with mock.patch("tracker.models.check_password", return_value=False) as hashed:
+            for i in range(settings.PIN_LOCKOUT_AFTER):
+                self.assertEqual(self.attempt(f"wrong{i}", ip=f"10.0.0.{i}").status_code, 200)
+            response = self.attempt("abc123", ip="10.0.0.99")  # locked per case, whatever the address
+        self.assertEqual(hashed.call_count, settings.PIN_LOCKOUT_AFTER)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(int(response["Retry-After"]), settings.PIN_LOCKOUT_BASE)
+        self.assertContains(response, "Zu viele Versuche", status_code=429)
+        self.sent.refresh_from_db()
+        self.assertEqual(self.sent.status, Case.Status.SENT_CLINIC)
+
+    def test_locked_database_retries_the_write_not_the_pin_check(self):
+        from django.db import OperationalError
+
+        create = Event.objects.create
+        with mock.patch("tracker.pinthrottle.check", wraps=pinthrottle.check) as checked, \
+                mock.patch.object(Event.objects, "create",
+                                  side_effect=[OperationalError("database is locked"), create]) as events, \
+                mock.patch("tracker.sqlite.connection") as conn, mock.patch("tracker.sqlite.time.sleep"), \
+                self.assertLogs("tracker.sqlite", "WARNING"):
+            conn.in_atomic_block = False  # the test case transaction would block the retry
+            self.assertEqual(self.attempt("abc123").status_code, 302)
+        self.assertEqual((checked.call_count, events.call_count), (1, 2))
+        self.sent.refresh_from_db()
+        self.assertEqual(self.sent.status, Case.Status.RECEIVED_BY_LAB)
+        self.assertEqual(self.sent.events.filter(status=Case.Status.RECEIVED_BY_LAB).count(), 1)
+
+    def test_malformed_codes_count_without_hashing(self):
+        with mock.patch("tracker.models.check_password") as hashed:
+            for code in ("", "x" * 40, "12 34 56", "abc"):
+                self.attempt(code)
+        hashed.assert_not_called()
+        self.assertEqual(PinThrottle.objects.get(key="ip:10.0.0.1").failures, 4)
+        self.assertFalse(PinThrottle.objects.filter(key="global").exists())
+
+    def test_global_cap_and_success_reset(self):
+        others = Case.objects.filter(lab=self.lab).exclude(pk=self.sent.pk)[:3]
+        Case.objects.filter(pk__in=[c.pk for c in others]).update(status=Case.Status.SENT_CLINIC)
+        for i, case in enumerate(others):
+            url = reverse("public_token", args=[case.qr_token])
+            self.assertEqual(self.attempt("falsch1", ip=f"10.1.0.{i}", url=url).status_code, 200)
+        response = self.attempt("abc123", ip="10.2.0.1")
+        self.assertEqual(response.status_code, 429)
+
+        PinThrottle.objects.filter(key="global").update(tokens=3)
+        self.attempt("wrong1")
+        self.assertRedirects(self.attempt("abc123"), self.url)
+        self.assertEqual(PinThrottle.objects.get(key="ip:10.0.0.1").failures, 0)
+        self.sent.refresh_from_db()
+        self.assertEqual(self.sent.status, Case.Status.RECEIVED_BY_LAB)
+
+        self.client.force_login(self.clinic_user)
+        counters = self.client.get(reverse("pin_stats_api")).json()["counters"]
+        self.assertEqual((counters["ok"], counters["wrong"], counters["rejected_rate"]), (1, 4, 1))
+
+    def test_bucket_refills_over_time(self):
+        keys = pinthrottle.keys_for("t", "1.2.3.4", "praxis")
+        for _ in range(3):
+            self.assertEqual(pinthrottle.acquire(keys), 0)
+        self.assertEqual(pinthrottle.acquire(keys), 60)
+        PinThrottle.objects.filter(key="global").update(stamp=F("stamp") - 60)
+        self.assertEqual(pinthrottle.acquire(keys), 0)
+
+
+class TrustedDeviceTests(SeededTestCase):
+    def setUp(self):
+        super().setUp()
+        self.lab.set_pin("abc123")
+        self.lab.save()
+        sent = list(Case.objects.filter(lab=self.lab)[:2])
+        Case.objects.filter(pk__in=[c.pk for c in sent]).update(status=Case.Status.SENT_CLINIC)
+        self.first, self.second = (reverse("public_token", args=[c.qr_token]) for c in sent)
+
+    def test_remembered_device_skips_pin_hashing(self):
+        self.client.post(self.first, {"action": "receive_lab", "code": "abc123", "remember": "1"})
+        self.assertIn(trusted.cookie_name(self.lab.pk), self.client.cookies)
+        self.assertContains(self.client.get(self.second), "gemerkt")
+
+        with mock.patch("tracker.models.check_password") as hashed:
+            response = self.client.post(self.second, {"action": "receive_lab"})
+        hashed.assert_not_called()
+        self.assertRedirects(response, self.second)
+        case = Case.objects.get(qr_token=self.second.strip("/").split("/")[-1])
+        self.assertEqual(case.status, Case.Status.RECEIVED_BY_LAB)
+
+    def test_cookie_is_lab_scoped_and_rotates_with_pin(self):
+        self.client.post(self.first, {"action": "receive_lab", "code": "abc123", "remember": "1"})
+        other = Case.objects.filter(lab=self.other_lab).first()
+        self.other_lab.set_pin("zzz999")
+        self.other_lab.save()
+        Case.objects.filter(pk=other.pk).update(status=Case.Status.SENT_CLINIC)
+        other_url = reverse("public_token", args=[other.qr_token])
+        self.assertContains(self.client.post(other_url, {"action": "receive_lab"}), "Schutzcode ist falsch")
+
+        self.client.force_login(self.clinic_user)
+        self.client.post(reverse("clinic_set_lab_pin", args=[self.lab.pk]), {"new_pin": "neu456"})
+        self.client.logout()
+        self.assertContains(self.client.post(self.second, {"action": "receive_lab"}), "Schutzcode ist falsch")
+
+    def test_no_cookie_without_remember_and_forget(self):
+        page = self.client.get(self.first)
+        self.assertContains(page, 'name="remember" value="1" id="remember">')  # opt-in, not pre-checked
+        self.client.post(self.first, {"action": "receive_lab", "code": "abc123"})
+        self.assertNotIn(trusted.cookie_name(self.lab.pk), self.client.cookies)
+        self.client.post(self.first, {"action": "return_lab", "code": "abc123", "remember": "1"})
+        self.client.post(self.second, {"action": "forget_device"})
+        self.assertEqual(self.client.cookies[trusted.cookie_name(self.lab.pk)].value, "")
+
+
+class AppSettingsCacheTests(SeededTestCase):
+    def test_get_reads_once_and_follows_saves(self):
+        first = AppSettings.get()
+        self.assertTrue(first.check_praxis_pin(AppSettings.DEFAULT_PIN))
+        with CaptureQueriesContext(connection) as ctx:
+            AppSettings.get()
+        self.assertEqual(len(ctx), 1)  # only the version stamp
+
+        # another worker changes the PIN: the bumped stamp makes this one reload
+        changed = make_password("111111")
+        AppSettings.objects.filter(name="default").update(praxis_pin_hash=changed)
+        self.assertEqual(AppSettings.get().praxis_pin_hash, first.praxis_pin_hash)
+        ChangeStamp.bump(AppSettings.STAMP)
+        self.assertEqual(AppSettings.get().praxis_pin_hash, changed)
+
+        obj = AppSettings.get()
+        obj.set_praxis_pin("654321")
+        self.assertEqual(AppSettings.get().praxis_pin_hash, changed)  # callers get copies
+        obj.save()
+        self.assertTrue(AppSettings.get().check_praxis_pin("654321"))
+
+    def test_empty_pin_falls_back_to_the_default(self):
+        obj = AppSettings.get()
+        obj.praxis_pin_hash = ""
+        obj.save()
+        restored = AppSettings.get()
+        self.assertTrue(restored.check_praxis_pin(AppSettings.DEFAULT_PIN))
+        self.assertEqual(AppSettings.objects.get(name="default").praxis_pin_hash, restored.praxis_pin_hash)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(AppSettings.get().praxis_pin_hash, restored.praxis_pin_hash)
+        self.assertEqual(len(ctx), 2)  # stamp changed by the repair: reloaded once, then cached
+
+    def test_read_paths_never_write(self):
+        AppSettings.objects.all().delete()
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertTrue(AppSettings.get().check_praxis_pin(AppSettings.DEFAULT_PIN))
+            self.client.force_login(self.clinic_user)
+            self.client.get(reverse("settings_pin"))
+        self.assertFalse([q for q in ctx.captured_queries
+                          if q["sql"].startswith(("INSERT", "UPDATE", "DELETE")) and "tracker_" in q["sql"]])
+        self.assertFalse(AppSettings.objects.exists())
+
+
+class AuthQueryTests(SeededTestCase):
+    """Session, user, profile and lab cost one joined query, and none once cached."""
+
+    def auth_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [q["sql"] for q in ctx.captured_queries
+                if re.search(r'FROM "(auth_user|tracker_userprofile|tracker_lab|django_session)"', q["sql"])]
+
+    def test_cached_user_with_profile_and_lab(self):
+        self.client.force_login(self.lab_user)
+        url = reverse("lab_cases")
+        first = self.auth_queries(url)
+        self.assertEqual(len(first), 1)
+        self.assertIn('JOIN "tracker_lab"', first[0])
+        self.assertEqual(self.auth_queries(url), [])
+
+        # profile or lab changes reach the next request
+        self.lab_user.profile.lab = self.other_lab
+        self.lab_user.profile.save()
+        self.assertEqual(len(self.auth_queries(url)), 1)
+        Lab.objects.filter(pk=self.other_lab.pk).get().save()
+        self.assertEqual(len(self.auth_queries(url)), 1)
+        self.assertEqual(self.auth_queries(url), [])
+
+    def test_deactivated_user_is_logged_out(self):
+        self.client.force_login(self.clinic_user)
+        self.assertEqual(self.client.get(reverse("task_stats_api")).status_code, 200)
+        self.clinic_user.is_active = False
+        self.clinic_user.save()
+        self.assertEqual(self.client.get(reverse("task_stats_api")).status_code, 302)
+
+
+class SqliteProductionTests(TestCase):
+    def test_production_options_apply_pragmas(self):
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+
+        with tempfile.TemporaryDirectory() as tmp:
+            db = DatabaseWrapper({
+                **connection.settings_dict,
+                "NAME": os.path.join(tmp, "prod.sqlite3"),
+                "OPTIONS": {"transaction_mode": "IMMEDIATE", "init_command": settings.SQLITE_PRAGMAS},
+            })
+            try:
+                values = sqlite.pragmas(db)
+            finally:
+                db.close()
+        self.assertEqual(values["journal_mode"], "wal")
+        self.assertEqual(values["synchronous"], 1)  # NORMAL
+        self.assertGreater(values["busy_timeout"], 0)
+        self.assertEqual(values["cache_size"], -65536)
+        self.assertEqual(db.transaction_mode, "IMMEDIATE")
+
+    def test_retry_locked_reruns_the_block(self):
+        from django.db import OperationalError
+
+        calls = []
+
+        def block(arg):
+            calls.append(1)
+            if len(calls) < sqlite.RETRY_ATTEMPTS:
+                raise OperationalError("database is locked")
+            return "ok"
+
+        wrapped = sqlite.retry_locked(block)
+        with mock.patch("tracker.sqlite.connection") as conn, mock.patch("tracker.sqlite.time.sleep"), \
+                self.assertLogs("tracker.sqlite", "WARNING"):
+            conn.in_atomic_block = False
+            self.assertEqual(wrapped(None), "ok")
+            self.assertEqual(len(calls), sqlite.RETRY_ATTEMPTS)
+
+            conn.in_atomic_block = True  # an outer transaction is already lost: no retry
+            calls.clear()
+            with self.assertRaises(OperationalError):
+                wrapped(None)
+            self.assertEqual(len(calls), 1)
+
+
+class ImporterTests(SeededTestCase):
+    def upload(self, name, content):
+        self.client.force_login(self.clinic_user)
+        return self.client.post(reverse("case_import"), {"file": SimpleUploadedFile(name, content)})
+
+    def test_csv_utf8_and_excel_cp1252(self):
+        before = Case.objects.count()
+        csv_text = "Patient;Geburtsdatum;Labor\nJörg Müller;01.02.1970;Alpha Dental\n;01.01.1980;Alpha Dental\n"
+        response = self.upload("faelle.csv", csv_text.encode("utf-8-sig"))
+        self.assertContains(response, "1 Fälle importiert")
+        self.assertEqual(response.context["result"].errors, [(3, "Patient fehlt.")])
+
+        response = self.upload("excel.csv", "patient_name;patient_dob;lab\nJürgen Weiß;1970-02-01;Alpha Dental\n"
+                               .encode("cp1252"))
+        self.assertEqual(response.context["result"].created, 1)
+        self.assertTrue(Case.objects.filter(patient_name="Jürgen Weiß").exists())
+        self.assertEqual(Case.objects.count(), before + 2)
+        self.assertEqual(counters.status_counts(), counters.compute_counts())
+
+    def test_xlsx(self):
+        import openpyxl
+
+        wb = openpyxl.Workbook()
+        wb.active.append(["patient_name", "patient_dob", "lab"])
+        wb.active.append(["Xlsx Patient", datetime.date(1980, 5, 6), self.other_lab.pk])
+        wb.active.append(["Ohne Labor", datetime.date(1980, 5, 6), "Gibt es nicht"])
+        buf = io.BytesIO()
+        wb.save(buf)
+        result = importer.import_cases(importer.read_rows(io.BytesIO(buf.getvalue()), "liste.xlsx"))
+        self.assertEqual(result.created, 1)
+        self.assertEqual(result.errors, [(3, "Unbekanntes Labor: 'Gibt es nicht'")])
+        self.assertEqual(Case.objects.get(patient_name="Xlsx Patient").lab, self.other_lab)
+
+    def test_broken_files_are_form_errors(self):
+        for name, content in (
+            ("kaputt.xlsx", b"patient_name;patient_dob;lab\n"),  # renamed CSV
+            ("leer.xlsx", b""),
+            ("spalten.csv", b"name;foo\nA;B\n"),
+            ("binär.csv", b"patient_name;patient_dob;lab\n\x81\x8d\x8f;1970-01-01;1\n"),  # neither UTF-8 nor cp1252
+        ):
+            response = self.upload(name, content)
+            self.assertEqual(response.status_code, 200, name)
+            self.assertTrue(response.context["form"].errors["file"], name)
+        with self.assertRaises(CommandError):
+            with tempfile.NamedTemporaryFile(suffix=".xlsx") as fh:
+                fh.write(b"kein zip")
+                fh.flush()
+                call_command("import_cases", fh.name)
+
+    def test_file_breaking_off_halfway_imports_nothing(self):
+        before = Case.objects.count()
+        lines = ["patient_name,patient_dob,lab"] + [f"Teil {i},1970-01-01,{self.lab.pk}" for i in range(20)]
+        lines.append('Kaputt,"' + "x" * (csv.field_size_limit() + 1) + '",1')
+        content = ("\n".join(lines) + "\n").encode()
+        with self.assertRaises(importer.ImportFileError):
+            importer.import_cases(importer.read_rows(io.BytesIO(content), "teil.csv"), chunk_size=5)
+        self.assertEqual(Case.objects.count(), before)
+
+
+class StatusTransitionTests(SeededTestCase):
+    def test_stale_transition_changes_nothing(self):
+        from .views import _set_status
+
+        Case.objects.filter(pk=self.case.pk).update(status=Case.Status.SENT_CLINIC)
+        counters.rebuild()
+        first, second = Case.objects.get(pk=self.case.pk), Case.objects.get(pk=self.case.pk)
+        events = Event.objects.filter(case=self.case).count()
+        self.assertTrue(_set_status(first, Case.Status.RECEIVED_BY_LAB, actor="LAB"))
+        # a double-submitted form or a concurrent scan that loaded the old status
+        self.assertFalse(_set_status(second, Case.Status.RETURNED_BY_LAB, actor="LAB"))
+        self.assertEqual(Case.objects.get(pk=self.case.pk).status, Case.Status.RECEIVED_BY_LAB)
+        self.assertEqual(Event.objects.filter(case=self.case).count(), events + 1)
+        self.assertEqual(counters.status_counts(), counters.compute_counts())
+
+
+class BoardSnapshotTests(SeededTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.clinic_user)
+        self.url = reverse("dashboard_counts_api")
+
+    def test_polling_gets_304_until_data_changes(self):
+        from .views import _set_status
+
+        first = self.client.get(self.url)
+        self.assertEqual(first.json(), counters.compute_counts())
+        again = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b"")
+
+        case = Case.objects.exclude(status=Case.Status.RECEIVED_BY_CLINIC).first()
+        _set_status(case, Case.Status.RECEIVED_BY_CLINIC, actor="CLINIC")
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], first["ETag"])
+        self.assertEqual(changed.json(), counters.compute_counts())
+
+    def test_missing_stamp_row_keeps_the_snapshot_stable(self):
+        ChangeStamp.objects.filter(name=board.BOARD_STAMP).delete()
+        with mock.patch("tracker.board._build", wraps=board._build) as build:
+            first = self.client.get(self.url)
+            second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(build.call_count, 1)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(first["Last-Modified"], second["Last-Modified"])
+
+
+class QrCacheTests(SeededTestCase):
+    def setUp(self):
+        super().setUp()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.enterContext(override_settings(QR_CACHE_DIR=Path(cache_dir.name)))
+        self.cache_dir = Path(cache_dir.name)
+        qr._memory.clear()
+        self.addCleanup(qr._memory.clear)
+        self.tokens = list(Case.objects.order_by("id").values_list("qr_token", flat=True)[:6])
+
+    def cached_files(self):
+        return sorted(p.name for p in self.cache_dir.rglob("*.png"))
+
+    def test_unknown_sizes_fall_back_to_the_default(self):
+        for size in ("xxl", "99999", None):
+            images = qr.qr_pngs(self.tokens[:2], size)
+            self.assertEqual(len(images), 2)
+        self.assertEqual(qr.qr_png(self.tokens[0], "gigantisch")[0],
+                         qr.qr_key(self.tokens[0], qr.public_token_url(self.tokens[0]), qr.DEFAULT_SIZE))
+        self.assertEqual(len(self.cached_files()), 2)  # nothing cached under other size keys
+
+    def test_batch_timeout_keeps_finished_images_and_fails_cleanly(self):
+        class SlowPool:
+            def map(self, fn, urls, sizes, **kwargs):
+                yield fn(urls[0], sizes[0])
+                yield fn(urls[1], sizes[1])
+                raise TimeoutError
+
+            def shutdown(self, **kwargs):
+                pass
+
+        self.enterContext(mock.patch.object(qr, "_pool", SlowPool()))
+        with self.assertRaises(qr.QrBusy):
+            qr.qr_pngs(self.tokens)
+        self.assertEqual(len(self.cached_files()), 2)
+        self.assertIsNone(qr._pool)
+
+        self.client.force_login(self.clinic_user)
+        ids = ",".join(str(pk) for pk in Case.objects.filter(qr_token__in=self.tokens).values_list("id", flat=True))
+        with mock.patch.object(qr, "_render_many", return_value=[]):
+            response = self.client.get(reverse("label_sheet") + f"?ids={ids}", follow=True)
+        self.assertRedirects(response, reverse("cases_list"))
+        self.assertContains(response, "QR-Codes werden noch erzeugt")
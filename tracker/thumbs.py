@@ -0,0 +1,94 @@
+"""
+Vorschaubilder für Bildanhänge.
+
+Zu jedem Bild werden zwei WebP-Varianten neben dem Original abgelegt
+(<datei>.thumb.webp für den Chat, <datei>.preview.webp für die Großansicht).
+Erzeugt werden sie vom Task-Worker (Auftrag "thumbs.render", siehe
+tracker.tasks), damit weder der Upload-Request noch die Fallseite darauf
+warten. Fehlt eine Variante beim Abruf noch, wird sie einmalig im Request
+erzeugt. Bestehende Anhänge: `manage.py generate_thumbnails`.
+"""
+import logging
+import os
+import tempfile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# variant -> longest edge in pixels
+VARIANTS = {"thumb": 320, "preview": 1280}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp", ".tif", ".tiff"}
+WEBP_QUALITY = 80
+
+
+def is_image(name):
+    return os.path.splitext(name or "")[1].lower() in IMAGE_EXTENSIONS
+
+
+def variant_name(name, variant):
+    return f"{name}.{variant}.webp"
+
+
+def render(src):
+    """Write all variants for the image file at `src` (absolute path)."""
+    largest = max(VARIANTS.values())
+    with Image.open(src) as img:
+        img.draft("RGB", (largest, largest))  # JPEG: decode at a reduced scale
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "PA") else "RGB")
+        # largest first, every smaller variant is scaled from the previous one
+        for variant, edge in sorted(VARIANTS.items(), key=lambda item: -item[1]):
+            img.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+            dst = variant_name(src, variant)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dst), suffix=".tmp")
+            with os.fdopen(fd, "wb") as fh:
+                img.save(fh, format="WEBP", quality=WEBP_QUALITY, method=4)
+            os.replace(tmp, dst)
+
+
+def missing(name):
+    return not all(default_storage.exists(variant_name(name, v)) for v in VARIANTS)
+
+
+def _render_logged(path):
+    """
+    False for files that will never render (not an image, decompression
+    bomb). Other OSErrors (disk full, NFS hiccup) propagate, so the task
+    runner retries them.
+    """
+    try:
+        render(path)
+    except (UnidentifiedImageError, Image.DecompressionBombError) as e:
+        logger.warning("Vorschaubild für %s fehlgeschlagen: %s", path, e)
+        return False
+    return True
+
+
+def render_stored(name):
+    """Task handler (tracker.tasks): variants for a stored image unless present."""
+    # the attachment may be gone by the time the task runs
+    if is_image(name) and missing(name) and default_storage.exists(name):
+        _render_logged(default_storage.path(name))
+
+
+def ensure(name, variant):
+    """Storage name of a variant, rendered now if the background job has not run yet; None if impossible."""
+    if variant not in VARIANTS or not is_image(name):
+        return None
+    target = variant_name(name, variant)
+    if not default_storage.exists(target):
+        try:
+            if not _render_logged(default_storage.path(name)):
+                return None
+        except OSError as e:
+            # nothing is stored, the next request or the task tries again
+            logger.warning("Vorschaubild für %s derzeit nicht möglich: %s", name, e)
+            return None
+    return target
+
+
+def delete(name):
+    for variant in VARIANTS:
+        default_storage.delete(variant_name(name, variant))
@@ -0,0 +1,46 @@
+"""
+Vertrauenswürdige Geräte für die Labor-Aktionen auf der QR-Seite.
+
+Nach einer richtigen Labor-PIN bekommt der Browser ein signiertes Cookie
+(`trusted_lab_<id>`, TRUSTED_DEVICE_DAYS gültig). Folgende Scans von Fällen
+dieses Labors prüfen nur noch die HMAC-Signatur statt PBKDF2 (Lab.check_pin).
+
+Das Cookie enthält einen Fingerabdruck des aktuellen pin_hash; setzt die
+Praxis einen neuen Labor-PIN (clinic_set_lab_pin), passt er nicht mehr und
+alle gemerkten Geräte müssen den PIN neu eingeben.
+"""
+from django.conf import settings
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+SALT = "tracker.trusted-device"
+
+
+def cookie_name(lab_id):
+    return f"trusted_lab_{lab_id}"
+
+
+def fingerprint(lab):
+    # pin_hash carries a fresh salt on every set_pin(), so any PIN change rotates it
+    return salted_hmac(SALT, lab.pin_hash).hexdigest()[:20]
+
+
+def is_trusted(request, lab):
+    """True if this browser has a valid device cookie for the lab's current PIN."""
+    if lab is None or not lab.pin_hash:
+        return False
+    value = request.get_signed_cookie(
+        cookie_name(lab.pk), default="", salt=SALT, max_age=settings.TRUSTED_DEVICE_DAYS * 86400)
+    lab_id, _, pin = value.partition(":")
+    return lab_id == str(lab.pk) and constant_time_compare(pin, fingerprint(lab))
+
+
+def remember(request, response, lab):
+    response.set_signed_cookie(
+        cookie_name(lab.pk), f"{lab.pk}:{fingerprint(lab)}", salt=SALT,
+        max_age=settings.TRUSTED_DEVICE_DAYS * 86400,
+        secure=request.is_secure(), httponly=True, samesite="Lax",
+    )
+
+
+def forget(response, lab):
+    response.delete_cookie(cookie_name(lab.pk), samesite="Lax")
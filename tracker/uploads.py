@@ -0,0 +1,102 @@
+"""
+Uploads mit SHA-256 und inhaltsadressierter Ablage.
+
+HashingFileUploadHandler (settings.FILE_UPLOAD_HANDLERS) schreibt jede
+hochgeladene Datei blockweise in eine temporäre Datei und berechnet dabei die
+SHA-256-Prüfsumme; der Speicherbedarf pro Upload bleibt bei einer Blockgröße.
+`store()` legt den Inhalt genau einmal unter blobs/<ab>/<sha256><ext> ab und
+zählt die Referenzen im Blob-Datensatz; ein erneuter Upload derselben Datei
+erhöht nur den Zähler.
+"""
+import hashlib
+import os
+import uuid
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Attachment, Blob
+
+HASH_CHUNK = 64 * 1024
+
+
+class HashingFileUploadHandler(TemporaryFileUploadHandler):
+    """Streams uploads to a temporary file and sets `.sha256` on the result."""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        f = super().file_complete(file_size)
+        f.sha256 = self.hasher.hexdigest()
+        return f
+
+
+def sha256_of(f):
+    """Digest of an uploaded file; uses the handler's value when present."""
+    digest = getattr(f, "sha256", None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    for chunk in f.chunks(HASH_CHUNK):
+        hasher.update(chunk)
+    f.seek(0)
+    return hasher.hexdigest()
+
+
+def blob_path(digest, filename):
+    ext = os.path.splitext(filename or "")[1].lower()[:10]
+    return f"blobs/{digest[:2]}/{digest}{ext}"
+
+
+def store(f):
+    """Blob for the uploaded file with one more reference (stored only if new)."""
+    digest = sha256_of(f)
+    with transaction.atomic():
+        if Blob.objects.filter(sha256=digest).update(refcount=F("refcount") + 1):
+            return Blob.objects.get(sha256=digest)
+
+    # write the content without holding the lock (a large scan takes a while);
+    # under the lock it is only renamed to its final name
+    incoming = default_storage.save(f"blobs/incoming/{uuid.uuid4().hex}", f)
+    name = blob_path(digest, f.name)
+    try:
+        # Blob.collect() of the same content holds this lock from deleting the row
+        # until the file is gone, so the file cannot disappear after the rename
+        with Blob.locked(digest):
+            # same digest, same bytes: replacing a file stored concurrently (or left
+            # over from an interrupted upload) is harmless
+            path = default_storage.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(default_storage.path(incoming), path)
+            incoming = None
+            try:
+                with transaction.atomic():
+                    return Blob.objects.create(sha256=digest, file=name, size=f.size, refcount=1)
+            except IntegrityError:
+                # the same content was stored concurrently; use that blob
+                Blob.objects.filter(sha256=digest).update(refcount=F("refcount") + 1)
+                return Blob.objects.get(sha256=digest)
+    finally:
+        if incoming:
+            default_storage.delete(incoming)
+
+
+def release(blob):
+    """Give back a reference from store() that ended up unused."""
+    Blob.objects.filter(pk=blob.pk, refcount__gt=0).update(refcount=F("refcount") - 1)
+    Blob.collect(blob.pk)
+
+
+def attach(case, f, **fields):
+    """Create an Attachment for an uploaded file, deduplicated via Blob."""
+    blob = store(f)
+    fields.setdefault("label", f.name)
+    return Attachment.objects.create(case=case, blob=blob, file=blob.file.name, **fields)
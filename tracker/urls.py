@@ -19,6 +19,8 @@ urlpatterns = [
     # Clinic
     path("cases/", views.cases_list, name="cases_list"),
     path("cases/new/", views.case_new, name="case_new"),
+    path("cases/labels/", views.label_sheet, name="label_sheet"),
+    path("cases/import/", views.case_import, name="case_import"),
     path("cases/<int:pk>/", views.case_detail, name="case_detail"),
     path("cases/<int:pk>/label/", views.label_print, name="label_print"),
     path("cases/<int:pk>/qr.png", views.case_qr_png, name="case_qr_png"),
@@ -52,8 +54,19 @@ urlpatterns = [
     path("display/board/", views.display_board, name="display_board"),
     path("api/dashboard/recent/", views.dashboard_recent_api, name="dashboard_recent_api"),
     path("api/dashboard/counts/", views.dashboard_counts_api, name="dashboard_counts_api"),
+    path("api/dashboard/stream/", views.board_stream, name="board_stream"),
+    path("api/cache/stats/", views.cache_stats_api, name="cache_stats_api"),
+    path("api/tasks/stats/", views.task_stats_api, name="task_stats_api"),
+    path("api/security/pin-stats/", views.pin_stats_api, name="pin_stats_api"),
+    path("api/search/", views.search_api, name="search_api"),
+    path("api/patients/lookup/", views.patient_lookup_api, name="patient_lookup_api"),
 
     path("cases/<int:pk>/comment/", views.case_add_comment, name="case_add_comment"),
+    path("cases/<int:pk>/uploads/", views.upload_create, name="upload_create"),
+    path("uploads/<uuid:upload_id>/", views.upload_session, name="upload_session"),
+    path("uploads/<uuid:upload_id>/finish/", views.upload_finish, name="upload_finish"),
+    path("attachments/<int:pk>/", views.attachment_download, name="attachment_download"),
+    path("attachments/<int:pk>/<slug:variant>/", views.attachment_preview, name="attachment_preview"),
 
 
     # Public QR
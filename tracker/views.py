@@ -1,18 +1,22 @@
-import io
-import qrcode
+import datetime
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.urls import reverse
 from django.http import JsonResponse
 from django.contrib import messages
 from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.db import transaction
 from django.contrib.auth.models import User
 from .forms import LabUserEditForm, LabUserCreateForm
-from django.db.models import Q
-from django.http import HttpResponse, HttpResponseForbidden, Http404
+from django.db.models import F, Q
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotAllowed, Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.http import urlencode
 from django.views.decorators.http import require_POST
 
 from tracker.decorators import role_required
@@ -26,8 +30,13 @@ from .forms import (
     CaseForm,
     LabForm,
     CaseCommentForm,  # NEW
+    CaseImportForm,
+)
+from . import (
+    board, counters, downloads, importer, live, lookup, pagecache, pagination, pinthrottle, qr, resumable, search, sqlite,
+    tasks, trusted, uploads,
 )
-from .models import Case, Event, Lab, AppSettings, CaseComment, Attachment
+from .models import Case, Event, Lab, AppSettings, CaseComment, Attachment, UploadSession
 from .utils import public_token_url
 
 
@@ -43,6 +52,35 @@ def user_lab(u):
 def require_role(user, role):
     return user_role(user) == role
 
+def _lab_names():
+    """Names of labs that have cases (from the counter table, not a scan over Case)."""
+    return (Lab.objects.filter(status_counts__count__gt=0)
+            .values_list("name", flat=True).distinct().order_by("name"))
+
+@sqlite.retry_locked
+def _set_status(case, target, **event_fields):
+    """
+    Log the event, apply the new status and keep the status counters in sync.
+    The transition only applies if the case is still in the status the caller
+    loaded (concurrent scans, double-submitted forms); otherwise nothing is
+    written and False is returned.
+    """
+    old_status = case.status
+    with transaction.atomic():
+        moved = Case.objects.filter(pk=case.pk, status=old_status).update(
+            status=target, revision=F("revision") + 1,
+        )
+        if not moved:
+            return False
+        Event.objects.create(case=case, status=target, **event_fields)
+        counters.record_change(case.lab_id, old_status, case.lab_id, target)
+        board.bump()
+        live.publish_case(case, old_status, target)
+    # only after commit: a rolled back attempt (retry_locked) must start from the loaded status
+    case.status = target
+    case.refresh_from_db(fields=["revision"])
+    return True
+
 
 # -------------------------------
 # Auth / Home
@@ -81,54 +119,57 @@ def lab_home(request):
 @role_required("CLINIC")
 @login_required
 def dashboard(request):
-    counts = {
-        "sent": Case.objects.filter(status=Case.Status.SENT_CLINIC).count(),
-        "in_lab": Case.objects.filter(status=Case.Status.RECEIVED_BY_LAB).count(),
-        "returned": Case.objects.filter(status=Case.Status.RETURNED_BY_LAB).count(),
-        "completed": Case.objects.filter(status=Case.Status.RECEIVED_BY_CLINIC).count(),
-    }
+    counts = counters.status_counts()
     recent = (Case.objects
                   .select_related('lab')           # ensure lab is joined
                   .order_by("-created_at")[:10])
-    labs = (Case.objects
-                .select_related('lab')
-                .values_list('lab__name', flat=True)
-                .distinct().order_by('lab__name'))
+    labs = _lab_names()
     return render(request, "dashboard.html", {"counts": counts, "recent": recent, "labs": labs})
 
+CASE_STATUS_FILTERS = [
+    ("", "Alle"),
+    (Case.Status.SENT_CLINIC, "Gesendet"),
+    (Case.Status.RECEIVED_BY_LAB, "Im Labor"),
+    (Case.Status.RETURNED_BY_LAB, "Zurück"),
+    (Case.Status.RECEIVED_BY_CLINIC, "Abgeschlossen"),
+]
+
 @login_required
 def cases_list(request):
     # LAB users should not see the clinic-wide list
     if user_role(request.user) == "LAB":
         return redirect("lab_cases")
 
-    qs = Case.objects.select_related('lab').order_by('-created_at')
+    qs = Case.objects.select_related('lab')
 
     status = (request.GET.get("status") or "").strip()
     q = (request.GET.get("q") or "").strip()
+    lab_name = (request.GET.get("lab") or "").strip()
+    lab = Lab.objects.filter(name=lab_name).first() if lab_name else None
 
     if status:
         qs = qs.filter(status=status)
+    if lab_name:
+        qs = qs.filter(lab=lab)
 
     if q:
-        qs = qs.filter(
-            Q(patient_name__icontains=q) |
-            Q(case_code__icontains=q) |
-            Q(lab__name__icontains=q)
-        )
+        qs = search.filter_cases(qs, q)
+
+    # total from the counter table; unknown once a text search is applied
+    total = None if q or (lab_name and lab is None) else counters.total(lab=lab, status=status)
+    page = pagination.paginate(qs, request.GET.get("cursor"), total=total)
 
     # ALWAYS define labs so the template has it
-    labs = list(
-        Case.objects.select_related('lab')
-        .values_list('lab__name', flat=True)
-        .distinct()
-        .order_by('lab__name')
-    )
+    labs = list(_lab_names())
 
     return render(request, "cases_list.html", {
-        "cases": qs,
+        "page": page,
+        "cases": page.object_list,
         "status": status,
         "q": q,
+        "lab": lab_name,
+        "filter_query": urlencode({k: v for k, v in (("status", status), ("q", q), ("lab", lab_name)) if v}),
+        "status_filters": CASE_STATUS_FILTERS,
         "Case": Case,
         "labs": labs,
     })
@@ -162,17 +203,15 @@ def clinic_status_rollback(request, pk):
         messages.error(request, "Dieser Status kann nicht zurückgesetzt werden.")
         return redirect("case_detail", pk=case.pk)
 
-    # Log event
-    Event.objects.create(
-        case=case,
-        status=new_status,
+    # Log event + apply new status
+    if not _set_status(
+        case,
+        new_status,
         actor="CLINIC",
         note=f"Status-Korrektur von {case.get_status_display()} auf {Case.Status(new_status).label}",
-    )
-
-    # Apply new status
-    case.status = new_status
-    case.save(update_fields=["status"])
+    ):
+        messages.error(request, "Der Status wurde inzwischen geändert. Bitte erneut prüfen.")
+        return redirect("case_detail", pk=case.pk)
 
     messages.success(request, "Status wurde einen Schritt zurückgesetzt.")
     return redirect("case_detail", pk=case.pk)
@@ -198,6 +237,11 @@ def case_new(request):
                     actor="CLINIC",
                     note="Created in clinic",
                 )
+                counters.record_change(new_lab_id=case.lab_id, new_status=case.status)
+                board.bump()
+                live.publish_case(case, new_status=case.status)
+                # label printing later hits the cache; the label view renders on a miss itself
+                tasks.enqueue("qr.warm", tokens=[str(case.qr_token)])
             if "print" in request.POST:
                 return redirect("label_print", pk=case.pk)
             return redirect("case_detail", pk=case.pk)
@@ -205,11 +249,33 @@ def case_new(request):
         form = CaseCreateForm()
     return render(request, "case_form.html", {"form": form})
 
+@role_required("CLINIC")
+@login_required
+def case_import(request):
+    """Massenimport (CSV/XLSX) mit Fehlern pro Zeile."""
+    result = None
+    if request.method == "POST":
+        form = CaseImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            f = form.cleaned_data["file"]
+            try:
+                result = importer.import_cases(importer.read_rows(f.file, f.name), user=request.user)
+            except importer.ImportFileError as exc:
+                form.add_error("file", str(exc))
+            else:
+                if result.created:
+                    messages.success(request, f"{result.created} Fälle importiert.")
+                if result.errors:
+                    messages.warning(request, f"{len(result.errors)} Zeilen mit Fehlern übersprungen.")
+    else:
+        form = CaseImportForm()
+    return render(request, "case_import.html", {"form": form, "result": result})
+
 @role_required("CLINIC")
 @login_required
 def case_detail(request, pk: int):
-    case = get_object_or_404(Case, pk=pk)
-    # comments will be accessed via case.comments.all in template
+    # events/messages are loaded by the cached fragments, only on a miss
+    case = get_object_or_404(Case.objects.select_related("lab"), pk=pk)
     return render(request, "case_detail.html", {"case": case})
 
 @role_required("CLINIC")
@@ -219,6 +285,52 @@ def label_print(request, pk: int):
     token_url = public_token_url(case.qr_token)
     return render(request, "label_print.html", {"case": case, "token_url": token_url})
 
+LABEL_SHEET_MAX = 500
+
+@role_required("CLINIC")
+@login_required
+def label_sheet(request):
+    """
+    Mehrere Labels in einem Druckbogen.
+    Auswahl über ?ids=1,2,3 oder Filter ?status=SENT_CLINIC&created=today (oder JJJJ-MM-TT).
+    Die QR-Codes werden inline als data-URI eingebettet, der ganze Druckauftrag ist ein Request.
+    """
+    qs = Case.objects.select_related("lab").order_by("created_at", "id")
+
+    ids = [int(x) for v in request.GET.getlist("ids") for x in v.split(",") if x.strip().isdigit()]
+    status = (request.GET.get("status") or "").strip()
+    created = (request.GET.get("created") or "").strip()
+    if not (ids or status or created):
+        messages.error(request, "Bitte Fälle oder einen Filter für den Labeldruck wählen.")
+        return redirect("cases_list")
+
+    if ids:
+        qs = qs.filter(pk__in=ids)
+    if status:
+        if status not in Case.Status.values:
+            raise Http404("Unbekannter Status.")
+        qs = qs.filter(status=status)
+    if created:
+        day = timezone.localdate() if created == "today" else parse_date(created)
+        if not day:
+            raise Http404("Ungültiges Datum.")
+        # range instead of __date so the (status, created_at) index is usable
+        start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+        qs = qs.filter(created_at__gte=start, created_at__lt=start + datetime.timedelta(days=1))
+
+    cases = list(qs[:LABEL_SHEET_MAX + 1])
+    if len(cases) > LABEL_SHEET_MAX:
+        cases = cases[:LABEL_SHEET_MAX]
+        messages.warning(request, f"Es werden nur die ersten {LABEL_SHEET_MAX} Labels gedruckt.")
+
+    try:
+        images = qr.qr_pngs([c.qr_token for c in cases])
+    except qr.QrBusy:
+        messages.error(request, "Die QR-Codes werden noch erzeugt. Bitte den Labeldruck gleich erneut starten.")
+        return redirect("cases_list")
+    labels = [{"case": c, "qr_src": qr.data_uri(images[c.qr_token])} for c in cases]
+    return render(request, "label_sheet.html", {"labels": labels})
+
 @role_required("CLINIC")
 @login_required
 def case_qr_png(request, pk: int):
@@ -226,11 +338,7 @@ def case_qr_png(request, pk: int):
     PNG des QR-Codes für die öffentliche Token-URL.
     """
     case = get_object_or_404(Case, pk=pk)
-    url = public_token_url(case.qr_token)
-    img = qrcode.make(url)
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    return HttpResponse(buf.getvalue(), content_type="image/png")
+    return qr.qr_response(request, case.qr_token, request.GET.get("size"))
 
 
 # -------------------------------
@@ -242,7 +350,9 @@ def public_token_view(request, token):
     Das Labor (oder die Praxis bei Rückgabe) gibt den Schutzcode ein und führt die
     jeweils erlaubte nächste Aktion aus.
     """
-    case = get_object_or_404(Case, qr_token=token)
+    case = get_object_or_404(Case.objects.select_related("lab"), qr_token=token)
+    trusted_lab = trusted.is_trusted(request, case.lab)
+    context = {"case": case, "trusted_lab": trusted_lab, "trusted_days": settings.TRUSTED_DEVICE_DAYS}
 
     # Allowed transitions
     next_map = {
@@ -257,6 +367,12 @@ def public_token_view(request, token):
         note = (request.POST.get("note") or "").strip()
         action = request.POST.get("action") or ""
 
+        if action == "forget_device" and case.lab:
+            response = redirect("public_token", token=token)
+            trusted.forget(response, case.lab)
+            messages.info(request, "Dieses Gerät ist nicht mehr gemerkt.")
+            return response
+
         # Map action -> target + which PIN is required
         target, need = None, None
         if action == "receive_lab":
@@ -268,35 +384,50 @@ def public_token_view(request, token):
 
         if not (target and target in next_map.get(case.status, [])):
             messages.error(request, "Diese Aktion ist derzeit nicht erlaubt.")
-            return render(request, "public_token.html", {"case": case})
-
-        # PIN checks
-        pin_ok = False
-        if need == "LAB":
-            pin_ok = bool(case.lab and case.lab.check_pin(code))
-        elif need == "CLINIC":
-            pin_ok = AppSettings.get().check_praxis_pin(code)
+            return render(request, "public_token.html", context)
 
+        if need == "LAB" and trusted_lab and not code:
+            # remembered device: signature check instead of PBKDF2
+            pin_ok, retry_after = True, 0
+        else:
+            # PIN checks: lockout, rate limits and format first, hashing last
+            if need == "LAB":
+                scope = f"lab:{case.lab_id}"
+                verify = case.lab.check_pin if case.lab else (lambda raw: False)
+            else:
+                scope = "praxis"
+                verify = AppSettings.get().check_praxis_pin
+            keys = pinthrottle.keys_for(case.qr_token, pinthrottle.client_ip(request), scope)
+            pin_ok, retry_after = pinthrottle.check(keys, need, code, verify)
+
+        if retry_after:
+            messages.error(request, f"Zu viele Versuche. Bitte in {retry_after} Sekunden erneut versuchen.")
+            response = render(request, "public_token.html", context, status=429)
+            response["Retry-After"] = str(retry_after)
+            return response
         if not pin_ok:
             messages.error(request, "Schutzcode ist falsch.")
-            return render(request, "public_token.html", {"case": case})
+            return render(request, "public_token.html", context)
 
         # Record and update
         actor = "LAB" if need == "LAB" else "CLINIC"
-        Event.objects.create(
-            case=case,
-            status=target,
+        if _set_status(
+            case,
+            target,
             actor=actor,
             note=note,
             ip=request.META.get("REMOTE_ADDR"),
             user_agent=request.META.get("HTTP_USER_AGENT", ""),
-        )
-        case.status = target
-        case.save(update_fields=["status"])
-        messages.success(request, "Status aktualisiert.")
-        return redirect("public_token", token=token)
+        ):
+            messages.success(request, "Status aktualisiert.")
+        else:
+            messages.error(request, "Der Status wurde inzwischen geändert. Bitte erneut prüfen.")
+        response = redirect("public_token", token=token)
+        if need == "LAB" and code and request.POST.get("remember"):
+            trusted.remember(request, response, case.lab)
+        return response
 
-    return render(request, "public_token.html", {"case": case})
+    return render(request, "public_token.html", context)
 
 
 # -------------------------------
@@ -403,14 +534,13 @@ def clinic_mark_received(request, pk):
     case = get_object_or_404(Case, pk=pk)
     if case.status != Case.Status.RETURNED_BY_LAB:
         return HttpResponseForbidden("Dieser Schritt ist aktuell nicht erlaubt.")
-    Event.objects.create(
-        case=case,
-        status=Case.Status.RECEIVED_BY_CLINIC,
+    if not _set_status(
+        case,
+        Case.Status.RECEIVED_BY_CLINIC,
         actor="CLINIC",
         note="In Praxis erhalten",
-    )
-    case.status = Case.Status.RECEIVED_BY_CLINIC
-    case.save(update_fields=["status"])
+    ):
+        messages.error(request, "Der Status wurde inzwischen geändert. Bitte erneut prüfen.")
     return redirect("case_detail", pk=case.pk)
 
 
@@ -422,29 +552,31 @@ def lab_cases_list(request):
     if user_role(request.user) != "LAB":
         return HttpResponseForbidden("Nicht erlaubt.")
     lab = user_lab(request.user)
-    qs = Case.objects.filter(lab=lab).order_by("-created_at")
+    qs = Case.objects.filter(lab=lab)
 
     status = request.GET.get("status") or ""
     q = request.GET.get("q") or ""
     if status:
         qs = qs.filter(status=status)
     if q:
-        qs = qs.filter(Q(case_code__icontains=q) | Q(patient_name__icontains=q))
+        qs = search.filter_cases(qs, q, fields=("case_code", "patient_name"))
 
-    page = Paginator(qs, 25).get_page(request.GET.get("page"))
+    total = None if q else counters.total(lab=lab, status=status)
+    page = pagination.paginate(qs, request.GET.get("cursor"), total=total)
 
-    labs = (Case.objects.select_related('lab')
-        .values_list('lab__name', flat=True)
-        .distinct().order_by('lab__name'))
-    
-    return render(request, "lab_cases_list.html", {"page": page, "status": status, "q": q, "Case": Case, "labs": labs})
+    labs = _lab_names()
+
+    return render(request, "lab_cases_list.html", {
+        "page": page, "status": status, "q": q, "Case": Case, "labs": labs,
+        "filter_query": urlencode({k: v for k, v in (("status", status), ("q", q)) if v}),
+    })
 
 @login_required
 def lab_case_detail(request, pk):
     if user_role(request.user) != "LAB":
         return HttpResponseForbidden("Nicht erlaubt.")
     lab = user_lab(request.user)
-    case = get_object_or_404(Case, pk=pk, lab=lab)  # restrict to this lab
+    case = get_object_or_404(Case.objects.select_related("lab"), pk=pk, lab=lab)  # restrict to this lab
 
     next_map = {
         Case.Status.SENT_CLINIC: [Case.Status.RECEIVED_BY_LAB, Case.Status.RETURNED_BY_LAB],
@@ -464,16 +596,15 @@ def lab_case_detail(request, pk):
             target = Case.Status.RETURNED_BY_LAB
 
         if target and target in allowed:
-            Event.objects.create(
-                case=case,
-                status=target,
+            if not _set_status(
+                case,
+                target,
                 actor="LAB",
                 note=note,
                 ip=request.META.get("REMOTE_ADDR"),
                 user_agent=request.META.get("HTTP_USER_AGENT", ""),
-            )
-            case.status = target
-            case.save(update_fields=["status"])
+            ):
+                messages.error(request, "Der Status wurde inzwischen geändert. Bitte erneut prüfen.")
             return redirect("lab_case_detail", pk=case.pk)
 
     # Build action list for template
@@ -500,9 +631,15 @@ def case_edit(request, pk):
         return HttpResponseForbidden("Nur Praxis-Benutzer dürfen Fälle bearbeiten.")
 
     if request.method == 'POST':
+        old_lab_id = case.lab_id
         form = CaseForm(request.POST, instance=case)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                form.save()
+                # moving a case to another lab moves it between per-lab counters
+                counters.record_change(old_lab_id, case.status, case.lab_id, case.status)
+                board.bump()
+                live.publish_case(case, case.status, case.status)
             messages.success(request, "Fall gespeichert.")
             return redirect('case_detail', pk=case.pk)
     else:
@@ -516,7 +653,13 @@ def case_delete(request, pk):
     case = get_object_or_404(Case, pk=pk)
     if not _is_clinic(request.user):
         return HttpResponseForbidden("Nur Praxis-Benutzer dürfen Fälle löschen.")
-    case.delete()
+    with transaction.atomic():
+        case_id = case.pk
+        case.delete()
+        case.pk = case_id  # keep the id for the live event
+        counters.record_change(old_lab_id=case.lab_id, old_status=case.status)
+        board.bump()
+        live.publish_case(case, old_status=case.status)
     messages.success(request, "Fall gelöscht.")
     return redirect('cases_list')
 
@@ -529,11 +672,7 @@ def lab_case_qr_png(request, pk):
     if user_role(request.user) != "LAB":
         return HttpResponseForbidden("Nicht erlaubt.")
     case = get_object_or_404(Case, pk=pk, lab=user_lab(request.user))
-    url = public_token_url(case.qr_token)
-    img = qrcode.make(url)
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    return HttpResponse(buf.getvalue(), content_type="image/png")
+    return qr.qr_response(request, case.qr_token, request.GET.get("size"))
 
 
 
@@ -636,11 +775,115 @@ def display_board(request):
     # Read-only TV page — data comes via AJAX
     return render(request, "display_board.html")
 
+async def board_stream(request):
+    """
+    Server-Sent Events für das TV-Board (nur unter ASGI).
+    Unter WSGI würde der Stream einen Worker dauerhaft blockieren; dort
+    antworten wir mit 204, der Browser beendet die Verbindung und das Board pollt.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponseForbidden("Nicht erlaubt.")
+    if await sync_to_async(user_role)(user) != "CLINIC":
+        return HttpResponseForbidden("Nicht erlaubt.")
+    response = StreamingHttpResponse(
+        live.stream(request.headers.get("Last-Event-ID")),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx: do not buffer the stream
+    return response
+
+# DataTables column "data" name -> ORM field used for ordering
+RECENT_ORDER_FIELDS = {
+    "case_code": "case_code",
+    "patient_name": "patient_name",
+    "patient_dob": "patient_dob",
+    "lab": "lab__name",
+    "status": "status",
+    "status_label": "status",
+}
+RECENT_MAX_PAGE = 500
+
+
+def _int_param(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _recent_search(qs, value):
+    """Every search term must match code, patient, lab or the status label."""
+    for term in value.split():
+        statuses = [key for key, label in Case.Status.choices if term.lower() in label.lower()]
+        qs = qs.filter(
+            Q(case_code__icontains=term) |
+            Q(patient_name__icontains=term) |
+            Q(lab__name__icontains=term) |
+            Q(status__in=statuses)
+        )
+    return qs
+
+
+def _recent_server_side(request):
+    """
+    DataTables server-side protocol (draw/start/length/order/search).
+    Filtering, ordering and LIMIT/OFFSET run in the database; only the
+    visible page is serialized.
+    """
+    g = request.GET
+    draw = _int_param(g.get("draw"), 0)
+    start = max(0, _int_param(g.get("start"), 0))
+    length = _int_param(g.get("length"), 25)
+    if length <= 0 or length > RECENT_MAX_PAGE:
+        length = RECENT_MAX_PAGE
+
+    base = Case.objects.all()
+    qs = base
+    search = (g.get("search[value]") or "").strip()
+    if search:
+        qs = _recent_search(qs, search)
+
+    # order[i][column] points into columns[n][data]; unknown columns are ignored
+    ordering = []
+    i = 0
+    while f"order[{i}][column]" in g:
+        col = g.get(f"order[{i}][column]")
+        field = RECENT_ORDER_FIELDS.get(g.get(f"columns[{col}][data]") or "")
+        if field:
+            desc = (g.get(f"order[{i}][dir]") or "").lower() == "desc"
+            ordering.append(f"-{field}" if desc else field)
+        i += 1
+    # stable tie-breaker so LIMIT/OFFSET pages never overlap
+    ordering += ["-created_at", "-id"] if not ordering else ["-id"]
+
+    total = sum(counters.status_counts().values())
+    filtered = qs.count() if search else total
+    page = qs.select_related("lab").order_by(*ordering)[start:start + length]
+
+    return JsonResponse({
+        "draw": draw,
+        "recordsTotal": total,
+        "recordsFiltered": filtered,
+        "data": [board.recent_row(c) for c in page],
+    })
+
+
 @login_required
 @role_required("CLINIC")
 def dashboard_recent_api(request):
+    # DataTables server-side mode (dashboard table)
+    if "draw" in request.GET:
+        return _recent_server_side(request)
+
     # ?limit=ALL to return everything; otherwise cap to a sane number
     limit_param = (request.GET.get("limit") or "").strip().lower()
+    if limit_param == str(board.BOARD_RECENT_LIMIT):
+        # TV boards: shared snapshot, 304 while nothing changed
+        return board.snapshot_response(request, "recent")
     if limit_param in ("all", "0", "-1"):
         qs = Case.objects.select_related("lab").order_by("-created_at")
     else:
@@ -650,35 +893,126 @@ def dashboard_recent_api(request):
             limit = 500
         qs = Case.objects.select_related("lab").order_by("-created_at")[:limit]
 
-    data = [{
-        "id": c.id,
-        "case_code": c.case_code,
-        "patient_name": c.patient_name,
-        "patient_dob": c.patient_dob.strftime("%d.%m.%Y") if c.patient_dob else "",
-        "patient_dob_order": c.patient_dob.strftime("%Y-%m-%d") if c.patient_dob else "",
-        "lab": c.lab.name if c.lab else "",
-        "status": c.status,
-        "status_label": c.get_status_display(),
-        "detail_url": reverse("case_detail", args=[c.id]),
-        "delete_url": reverse("case_delete", args=[c.id]),
-    } for c in qs]
+    data = [board.recent_row(c) for c in qs]
 
     return JsonResponse(data, safe=False)
 
 @login_required
 @role_required("CLINIC")
 def dashboard_counts_api(request):
-    return JsonResponse({
-        "sent": Case.objects.filter(status=Case.Status.SENT_CLINIC).count(),
-        "in_lab": Case.objects.filter(status=Case.Status.RECEIVED_BY_LAB).count(),
-        "returned": Case.objects.filter(status=Case.Status.RETURNED_BY_LAB).count(),
-        "completed": Case.objects.filter(status=Case.Status.RECEIVED_BY_CLINIC).count(),
-    })
+    return board.snapshot_response(request, "counts")
+
+
+@login_required
+@role_required("CLINIC")
+def cache_stats_api(request):
+    """Hit/miss counts of the case fragment cache (all workers); POST resets them."""
+    if request.method == "POST":
+        pagecache.reset_stats()
+    return JsonResponse({"fragments": pagecache.stats()})
+
+
+@login_required
+@role_required("CLINIC")
+def task_stats_api(request):
+    """Queue depth of the background task queue (tracker.tasks)."""
+    return JsonResponse(tasks.stats())
+
+
+@login_required
+@role_required("CLINIC")
+def pin_stats_api(request):
+    """Checked/rejected PIN attempts on the QR page and current lockouts; POST resets the counters."""
+    if request.method == "POST":
+        pinthrottle.reset_stats()
+    return JsonResponse(pinthrottle.stats())
+
+
+# -------------------------------
+# SEARCH: ranked full-text search (clinic: all cases, lab: own lab)
+# -------------------------------
+@login_required
+def search_api(request):
+    role = user_role(request.user)
+    if role not in ("CLINIC", "LAB"):
+        return HttpResponseForbidden("Nicht erlaubt.")
+    q = (request.GET.get("q") or "").strip()
+    limit = max(1, min(_int_param(request.GET.get("limit"), search.SEARCH_LIMIT), search.SEARCH_LIMIT))
+    lab_id = getattr(user_lab(request.user), "id", 0) if role == "LAB" else None
+
+    if search.available():
+        hits = search.ranked(q, lab_id=lab_id, limit=limit) if q else []
+    else:
+        # no FTS5: unranked icontains search, newest first
+        qs = Case.objects.all() if lab_id is None else Case.objects.filter(lab_id=lab_id)
+        ids = search.filter_cases(qs, q).order_by("-created_at").values_list("id", flat=True)[:limit] if q else []
+        hits = [(pk, None, "case", "") for pk in ids]
+
+    cases = Case.objects.select_related("lab").in_bulk([h[0] for h in hits])
+    detail = "case_detail" if role == "CLINIC" else "lab_case_detail"
+    results = []
+    for pk, score, kind, snippet in hits:
+        c = cases.get(pk)
+        if c is None:
+            continue
+        results.append({
+            "id": c.id,
+            "case_code": c.case_code,
+            "patient_name": c.patient_name,
+            "lab": c.lab.name if c.lab_id else "",
+            "status": c.status,
+            "status_label": c.get_status_display(),
+            "match": kind,
+            "snippet": snippet,
+            "score": score,
+            "url": reverse(detail, args=[c.id]),
+        })
+    return JsonResponse({"q": q, "results": results})
+
+
+@login_required
+def patient_lookup_api(request):
+    """Fuzzy patient lookup: ?name=...&dob=YYYY-MM-DD (clinic: all cases, lab: own lab)."""
+    role = user_role(request.user)
+    if role not in ("CLINIC", "LAB"):
+        return HttpResponseForbidden("Nicht erlaubt.")
+    name = (request.GET.get("name") or "").strip()
+    try:
+        dob = parse_date((request.GET.get("dob") or "").strip())
+    except ValueError:  # well-formed but impossible date
+        dob = None
+    limit = max(1, min(_int_param(request.GET.get("limit"), lookup.LOOKUP_LIMIT), 100))
+    lab = user_lab(request.user) if role == "LAB" else None
+    if role == "LAB" and lab is None:
+        return JsonResponse({"results": []})
+
+    detail = "case_detail" if role == "CLINIC" else "lab_case_detail"
+    results = [{
+        "id": c.id,
+        "case_code": c.case_code,
+        "patient_name": c.patient_name,
+        "patient_dob": c.patient_dob.isoformat(),
+        "lab": c.lab.name if c.lab_id else "",
+        "status": c.status,
+        "status_label": c.get_status_display(),
+        "score": round(score, 3),
+        "url": reverse(detail, args=[c.id]),
+    } for c, score in lookup.lookup(name, dob=dob, lab=lab, limit=limit)]
+    return JsonResponse({"name": name, "dob": dob.isoformat() if dob else None, "results": results})
 
 
 # -------------------------------
 # CHAT / COMMENTS: clinic + lab
 # -------------------------------
+def _can_access(user, case):
+    """Clinic may see and comment on all cases, Lab only on its own lab's cases."""
+    role = user_role(user)
+    if role == "CLINIC":
+        return True
+    if role == "LAB":
+        return case.lab_id == getattr(user_lab(user), "id", None)
+    return False
+
 @require_POST
 @login_required
 def case_add_comment(request, pk):
@@ -688,15 +1022,7 @@ def case_add_comment(request, pk):
     """
     case = get_object_or_404(Case, pk=pk)
     role = user_role(request.user)
-
-    if role == "CLINIC":
-        allowed = True
-    elif role == "LAB":
-        allowed = (case.lab_id == getattr(user_lab(request.user), "id", None))
-    else:
-        allowed = False
-
-    if not allowed:
+    if not _can_access(request.user, case):
         return HttpResponseForbidden("Nicht erlaubt für diesen Fall.")
 
     form = CaseCommentForm(request.POST, request.FILES)
@@ -707,14 +1033,9 @@ def case_add_comment(request, pk):
             text=form.cleaned_data["text"].strip(),
         )
         # multiple files
+        # stored once per content (see tracker.uploads)
         for f in request.FILES.getlist("files"):
-            Attachment.objects.create(
-                case=case,
-                uploaded_by=request.user,
-                comment=comment,
-                file=f,
-                label=f.name,
-            )
+            uploads.attach(case, f, uploaded_by=request.user, comment=comment)
         messages.success(request, "Nachricht gesendet.")
     else:
         messages.error(request, "Bitte Nachricht oder Anhänge prüfen.")
@@ -724,6 +1045,105 @@ def case_add_comment(request, pk):
     return redirect("case_detail", pk=case.pk)
 
 
+# -------------------------------
+# RESUMABLE UPLOADS: large scan files in chunks (see tracker.resumable)
+# -------------------------------
+def _upload_headers(response, session):
+    response["Upload-Offset"] = str(session.offset)
+    response["Upload-Length"] = str(session.size)
+    response["Cache-Control"] = "no-store"
+    return response
+
+def _upload_error(e):
+    return JsonResponse({"error": str(e)}, status=e.status)
+
+@require_POST
+@login_required
+def upload_create(request, pk):
+    case = get_object_or_404(Case, pk=pk)
+    if not _can_access(request.user, case):
+        return HttpResponseForbidden("Nicht erlaubt für diesen Fall.")
+    size = _int_param(request.POST.get("size") or request.headers.get("Upload-Length"), None)
+    try:
+        session = resumable.create(case, request.user, request.POST.get("filename"), size)
+    except resumable.UploadError as e:
+        return _upload_error(e)
+    url = reverse("upload_session", args=[session.pk])
+    response = JsonResponse({"id": str(session.pk), "url": url, "offset": 0,
+                             "chunk_size": settings.UPLOAD_CHUNK_MAX}, status=201)
+    response["Location"] = url
+    return _upload_headers(response, session)
+
+@login_required
+def upload_session(request, upload_id):
+    """HEAD: current offset, PATCH: append a chunk, DELETE: abort."""
+    session = get_object_or_404(UploadSession, pk=upload_id, user=request.user)
+    try:
+        if request.method == "HEAD":
+            return _upload_headers(HttpResponse(status=200), session)
+        if request.method == "PATCH":
+            if request.content_type != "application/offset+octet-stream":
+                return JsonResponse({"error": "Content-Type application/offset+octet-stream erwartet."}, status=415)
+            offset = _int_param(request.headers.get("Upload-Offset"), None)
+            length = _int_param(request.headers.get("Content-Length"), None)
+            if offset is None:
+                return JsonResponse({"error": "Upload-Offset fehlt."}, status=400)
+            resumable.append(session, offset, request, length)
+            return _upload_headers(HttpResponse(status=204), session)
+        if request.method == "DELETE":
+            resumable.abort(session)
+            return HttpResponse(status=204)
+    except resumable.UploadError as e:
+        return _upload_headers(_upload_error(e), session)
+    return HttpResponseNotAllowed(["HEAD", "PATCH", "DELETE"])
+
+@require_POST
+@login_required
+def upload_finish(request, upload_id):
+    session = get_object_or_404(UploadSession.objects.select_related("case"), pk=upload_id, user=request.user)
+    if not _can_access(request.user, session.case):
+        return HttpResponseForbidden("Nicht erlaubt für diesen Fall.")
+    try:
+        attachment = resumable.finish(session, (request.POST.get("text") or "").strip())
+    except resumable.UploadError as e:
+        return _upload_error(e)
+    return JsonResponse({
+        "attachment_id": attachment.pk,
+        "comment_id": attachment.comment_id,
+        "label": attachment.label,
+        "size": attachment.blob.size,
+        "sha256": attachment.blob.sha256,
+    }, status=201)
+
+
+# -------------------------------
+# ATTACHMENT DOWNLOAD (permission check here, transfer see tracker.downloads)
+# -------------------------------
+@login_required
+def attachment_download(request, pk):
+    attachment = get_object_or_404(Attachment.objects.select_related("case", "blob"), pk=pk)
+    if not _can_access(request.user, attachment.case):
+        return HttpResponseForbidden("Nicht erlaubt für diesen Fall.")
+    response = downloads.serve(request, attachment, as_attachment="download" in request.GET)
+    if response is None:
+        raise Http404("Datei nicht gefunden.")
+    return response
+
+@login_required
+def attachment_preview(request, pk, variant):
+    """
+    Derived file of an attachment: "thumb"/"preview" (WebP) for images,
+    "snapshot" (PNG) and "mesh" (decimated STL) for STL scans.
+    """
+    attachment = get_object_or_404(Attachment.objects.select_related("case", "blob"), pk=pk)
+    if not _can_access(request.user, attachment.case):
+        return HttpResponseForbidden("Nicht erlaubt für diesen Fall.")
+    response = downloads.serve(request, attachment, as_attachment="download" in request.GET, variant=variant)
+    if response is None:
+        raise Http404("Keine Vorschau verfügbar.")
+    return response
+
+
 @login_required
 def help_guide(request):
     contact_email = getattr(settings, "SUPPORT_EMAIL", "s.peroz@dens-health-management.de")